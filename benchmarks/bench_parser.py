@@ -0,0 +1,32 @@
+import argparse, gc, os, sys, time
+
+# Run as a script (python3 benchmarks/bench_parser.py) the repository root is not on sys.path.
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from iptables_parser import SaveParser
+from benchmarks.synthetic import generate_dump
+
+# The requested target, not yet met: CPython builds one Rule per line and the fast-path regex alone takes ~3 µs;
+# 300k lines measure 117k-160k lines/s on the single-core sandbox this was written on.
+TARGET_LINES_PER_SEC = 1_000_000
+
+def run(n_lines, counters=False, repeat=3):
+    lines = generate_dump(n_lines, counters=counters)
+    best = float("inf")
+    for _ in range(repeat):
+        gc.collect()
+        start = time.perf_counter()
+        rules = sum(1 for _ in SaveParser().parse(lines))
+        best = min(best, time.perf_counter() - start)
+    return {"lines": len(lines), "rules": rules, "seconds": best, "lines_per_sec": len(lines) / best}
+
+if __name__ == "__main__":
+    ap = argparse.ArgumentParser(description="Benchmark the streaming iptables-save parser on a synthetic dump")
+    ap.add_argument("--lines", type=int, default=1_000_000)
+    ap.add_argument("--counters", action="store_true")
+    ap.add_argument("--repeat", type=int, default=3)
+    args = ap.parse_args()
+    res = run(args.lines, args.counters, args.repeat)
+    verdict = "OK" if res["lines_per_sec"] >= TARGET_LINES_PER_SEC else "SOTTO OBIETTIVO"
+    print(f"{res['lines']} righe, {res['rules']} regole in {res['seconds']:.3f}s: "
+          f"{res['lines_per_sec']:,.0f} righe/s (obiettivo {TARGET_LINES_PER_SEC:,}) {verdict}")
@@ -0,0 +1,169 @@
+import argparse, gc, json, os, platform, random, resource, subprocess, sys, tempfile, time, tracemalloc
+from collections import defaultdict
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+STUBS = os.path.join(ROOT, "benchmarks", "stubs")
+DEFAULT_SIZES = (1_000, 10_000, 100_000)
+
+def best_of(fn, repeat):
+    best = float("inf")
+    for _ in range(repeat):
+        gc.collect()
+        started = time.perf_counter()
+        fn()
+        best = min(best, time.perf_counter() - started)
+    return best
+
+def per_op(fn, args):
+    gc.collect()
+    started = time.perf_counter()
+    for arg in args: fn(*arg)
+    return (time.perf_counter() - started) / max(len(args), 1)
+
+def read_log(path):
+    # The stubs append one line per invocation; the payload size is the last field for restore calls.
+    calls, payload = defaultdict(int), 0
+    with open(path) as f:
+        for line in f:
+            calls[line.split(" ", 1)[0]] += 1
+            if " bytes=" in line: payload += int(line.rsplit("=", 1)[1])
+    open(path, "w").close()
+    return {"calls": dict(calls), "payload_bytes": payload}
+
+def bench_size(size, repeat, ops, legacy_limit, seed):
+    # Runs in its own process (see main) so that peak RSS belongs to this size alone.
+    from benchmarks.synthetic import generate_dump
+    workdir = tempfile.mkdtemp(prefix="forge-bench-")
+    dump, log = os.path.join(workdir, "dump.v4"), os.path.join(workdir, "calls.log")
+    lines = generate_dump(size, counters=True, seed=seed)
+    text = "\n".join(lines) + "\n"
+    with open(dump, "w") as f: f.write(text)
+    open(log, "w").close()
+    os.environ.update(FORGE_BENCH_DUMP=dump, FORGE_BENCH_LOG=log, FORGE_BACKEND="iptables", QT_QPA_PLATFORM="offscreen",
+                      PATH=STUBS + os.pathsep + os.environ.get("PATH", ""))
+    os.environ.pop("FORGE_BENCH_DUMP6", None)
+
+    from PyQt6.QtCore import QThreadPool
+    from PyQt6.QtWidgets import QApplication
+    app = QApplication.instance() or QApplication([])
+    from iptables_manager import IptablesManager
+    from iptables_parser import parse_rule_line
+    from main_window import MainWindow
+
+    rng = random.Random(seed)
+    timings, result = {}, {"size": size, "lines": len(lines)}
+    manager = IptablesManager()
+    timings["parse"] = best_of(lambda: manager._parse_output(text), repeat)
+    tracemalloc.start()
+    manager._parse_output(text)
+    result["parse_heap_peak_kb"] = tracemalloc.get_traced_memory()[1] // 1024
+    tracemalloc.stop()
+    timings["refresh"] = best_of(lambda: manager.refresh_all(force=True), repeat)
+
+    window = MainWindow()
+    window.history_dir = None
+    window.show()
+    QThreadPool.globalInstance().waitForDone()
+    app.processEvents()
+    read_log(log)
+    rules = window.all_rules
+    result["rules"] = len(rules)
+
+    def settle(fn):
+        def run(*args):
+            fn(*args)
+            app.processEvents()
+        return run
+    timings["show_family"] = best_of(settle(window.show_family), repeat)
+    timings["populate_table"] = best_of(settle(window.populate_table), repeat)
+    chains = [window.chain_filter.itemText(i) for i in range(window.chain_filter.count())]
+    timings["chain_filter"] = per_op(settle(window.chain_filter.setCurrentText), [(c,) for c in chains[1:] + chains[:1]])
+
+    rows = window.model.rowCount()
+    timings["handle_reorder"] = per_op(settle(window.handle_reorder), [(rng.randrange(rows), rng.randrange(rows)) for _ in range(ops)])
+    # Lookups are exercised with a chain filter on: that is where a view row has to be found in the full store.
+    window.chain_filter.setCurrentText("INPUT")
+    app.processEvents()
+    rows = window.model.rowCount()
+    picks = [rng.randrange(rows) for _ in range(min(ops, rows))]
+    replacements = [(row, parse_rule_line(str(window.model.rule_at(row)), window.model.rule_at(row).table)) for row in picks]
+    timings["edit_rule"] = per_op(settle(window.model.replace_row), replacements)
+    timings["handle_reorder_filtered"] = per_op(settle(window.handle_reorder), [(rng.randrange(rows), rng.randrange(rows)) for _ in range(ops)])
+    timings["remove_rule"] = per_op(settle(window.model.remove_row), [(rng.randrange(rows - i),) for i in range(min(ops, rows - 1))])
+
+    edited = list(rules)
+    started = time.perf_counter()
+    plan = window.manager.plan_changes(edited)
+    timings["plan_changes"] = time.perf_counter() - started
+    result["plan_ops"] = len(plan)
+    read_log(log)
+    timings["apply_plan"] = best_of(lambda: window.manager.apply_plan(plan), 1)
+    result["apply_plan_stub"] = read_log(log)
+    structured = defaultdict(lambda: defaultdict(list))
+    for rule in edited: structured[rule.table][rule.chain].append(rule)
+    timings["apply_rules"] = best_of(lambda: window.manager.apply_rules(structured), 1)
+    result["apply_rules_stub"] = read_log(log)
+    if size <= legacy_limit:
+        timings["apply_rules_one_by_one"] = best_of(lambda: window.manager.apply_rules(structured, batch=False), 1)
+        result["apply_rules_one_by_one_stub"] = read_log(log)
+
+    window.close()
+    result["timings"] = timings
+    result["peak_rss_kb"] = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    return result
+
+def git_revision():
+    try:
+        return subprocess.run(["git", "rev-parse", "--short", "HEAD"], cwd=ROOT, capture_output=True, text=True, check=True).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+def compare(report, baseline):
+    old = {r["size"]: r for r in baseline["results"]}
+    for result in report["results"]:
+        before = old.get(result["size"])
+        if before is None: continue
+        print(f"--- {result['size']} regole (rispetto a {baseline.get('revision')})", file=sys.stderr)
+        metrics = [(name, value, before["timings"].get(name)) for name, value in result["timings"].items()]
+        metrics.append(("peak_rss_kb", result["peak_rss_kb"], before.get("peak_rss_kb")))
+        for name, value, previous in metrics:
+            if not previous: continue
+            print(f"{name:>26} {previous:>12.6g} -> {value:<12.6g} x{value / previous:.2f}", file=sys.stderr)
+
+def main(argv=None):
+    ap = argparse.ArgumentParser(description="Benchmark parse, render, diff e apply su ruleset sintetici")
+    ap.add_argument("--sizes", type=int, nargs="+", default=list(DEFAULT_SIZES), help="numero di regole (es. 1000 10000 100000 1000000)")
+    ap.add_argument("--repeat", type=int, default=3, help="ripetizioni per le misure 'migliore di'")
+    ap.add_argument("--ops", type=int, default=200, help="operazioni per reorder/edit/remove")
+    ap.add_argument("--legacy-limit", type=int, default=1_000, help="misura apply_rules regola per regola fino a questa dimensione")
+    ap.add_argument("--seed", type=int, default=0)
+    ap.add_argument("-o", "--output", default="-", help="file JSON dei risultati ('-' per stdout)")
+    ap.add_argument("--compare", help="JSON di un'esecuzione precedente da confrontare")
+    ap.add_argument("--worker", type=int, help=argparse.SUPPRESS)
+    args = ap.parse_args(argv)
+
+    if args.worker is not None:
+        json.dump(bench_size(args.worker, args.repeat, args.ops, args.legacy_limit, args.seed), sys.stdout)
+        return 0
+    results = []
+    for size in args.sizes:
+        print(f"benchmark {size} regole...", file=sys.stderr)
+        cmd = [sys.executable, "-m", "benchmarks.run", "--worker", str(size), "--repeat", str(args.repeat),
+               "--ops", str(args.ops), "--legacy-limit", str(args.legacy_limit), "--seed", str(args.seed)]
+        proc = subprocess.run(cmd, cwd=ROOT, capture_output=True, text=True, env={**os.environ, "PYTHONPATH": ROOT})
+        if proc.returncode != 0:
+            print(proc.stderr, file=sys.stderr)
+            return 1
+        results.append(json.loads(proc.stdout))
+    report = {"revision": git_revision(), "python": platform.python_version(), "platform": platform.platform(),
+              "created": time.strftime("%Y-%m-%dT%H:%M:%S"), "results": results}
+    text = json.dumps(report, indent=2) + "\n"
+    if args.output == "-": sys.stdout.write(text)
+    else:
+        with open(args.output, "w") as f: f.write(text)
+    if args.compare:
+        with open(args.compare) as f: compare(report, json.load(f))
+    return 0
+
+if __name__ == "__main__":
+    sys.exit(main())
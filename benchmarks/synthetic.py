@@ -0,0 +1,55 @@
+import random
+
+TABLE_CHAINS = {
+    "filter": ["INPUT", "FORWARD", "OUTPUT"],
+    "nat": ["PREROUTING", "INPUT", "OUTPUT", "POSTROUTING"],
+    "mangle": ["PREROUTING", "INPUT", "FORWARD", "OUTPUT", "POSTROUTING"],
+    "raw": ["PREROUTING", "OUTPUT"]
+}
+TABLE_WEIGHTS = {"filter": 0.7, "nat": 0.15, "mangle": 0.1, "raw": 0.05}
+
+def _addr(rng):
+    bits = rng.choice((8, 16, 24, 24, 32, 32, 32))
+    return f"{rng.randrange(1, 224)}.{rng.randrange(256)}.{rng.randrange(256)}.{rng.randrange(256) if bits == 32 else 0}/{bits}"
+
+def _rule(rng, table, chain, user_chains):
+    parts = [f"-A {chain}"]
+    if rng.random() < 0.6: parts.append(f"-s {_addr(rng)}")
+    if rng.random() < 0.3: parts.append(f"-d {_addr(rng)}")
+    if rng.random() < 0.2: parts.append(f"-i eth{rng.randrange(4)}")
+    proto = rng.choice(("tcp", "tcp", "udp", None))
+    if proto:
+        parts.append(f"-p {proto}")
+        roll = rng.random()
+        if roll < 0.6: parts.append(f"-m {proto} --dport {rng.randrange(1, 65536)}")
+        elif roll < 0.75: parts.append(f"-m multiport --dports {rng.randrange(1, 1024)},{rng.randrange(1024, 65536)}")
+        elif roll < 0.85: lo = rng.randrange(1024, 60000); parts.append(f"-m {proto} --sport {lo}:{lo + rng.randrange(1, 5000)}")
+    if rng.random() < 0.3: parts.append("-m state --state NEW,ESTABLISHED")
+    if rng.random() < 0.05: parts.append(f"-m limit --limit {rng.randrange(1, 100)}/sec")
+    if rng.random() < 0.4: parts.append(f'-m comment --comment "customer-{rng.randrange(500)} rule {rng.randrange(10000)}"')
+    if table == "nat" and chain == "PREROUTING":
+        parts.append(f"-j DNAT --to-destination 10.{rng.randrange(256)}.{rng.randrange(256)}.{rng.randrange(1, 255)}:{rng.randrange(1, 65536)}")
+    elif table == "nat" and chain == "POSTROUTING": parts.append("-j MASQUERADE")
+    elif user_chains and rng.random() < 0.1: parts.append(f"-j {rng.choice(user_chains)}")
+    else: parts.append(f"-j {rng.choice(('ACCEPT', 'ACCEPT', 'DROP', 'REJECT', 'RETURN', 'LOG'))}")
+    return " ".join(parts)
+
+def generate_dump(n_rules, counters=False, user_chains=8, seed=0):
+    rng = random.Random(seed)
+    lines = ["# Generated by synthetic iptables-save"]
+    for table, weight in TABLE_WEIGHTS.items():
+        users = [f"{table.upper()}_USER{i}" for i in range(user_chains)] if table == "filter" else []
+        chains = TABLE_CHAINS[table] + users
+        lines.append(f"*{table}")
+        for chain in chains:
+            policy = "-" if chain in users else "ACCEPT"
+            lines.append(f":{chain} {policy} [{rng.randrange(10**6)}:{rng.randrange(10**9)}]" if counters else f":{chain} {policy} [0:0]")
+        for i in range(max(1, int(n_rules * weight))):
+            rule = _rule(rng, table, chains[i % len(chains)], users)
+            lines.append(f"[{rng.randrange(10**6)}:{rng.randrange(10**9)}] {rule}" if counters else rule)
+        lines.append("COMMIT")
+    return lines
+
+def write_dump(path, n_rules, **kwargs):
+    with open(path, "w") as f:
+        f.write("\n".join(generate_dump(n_rules, **kwargs)) + "\n")
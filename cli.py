@@ -0,0 +1,238 @@
+import argparse
+import json
+import sys
+import time
+from collections import defaultdict
+
+from iptables_manager import IptablesManager, BACKENDS, make_backend
+from iptables_parser import SaveParser
+from counter_monitor import CounterMonitor, hottest
+from packet_sim import Simulator, evaluate_parallel, read_flows, write_results
+from rule import Rule
+import profiling
+
+FORMATS = ("json", "yaml", "save")
+
+def _yaml():
+    try:
+        import yaml
+    except ImportError:
+        raise ValueError("PyYAML non installato: usa --format json o save")
+    return yaml
+
+def detect_format(path, text):
+    if path.endswith((".yaml", ".yml")): return "yaml"
+    if path.endswith(".json"): return "json"
+    head = text.lstrip()
+    if head.startswith(("{", "[")): return "json"
+    if head.startswith(("*", "#", ":", "-A ")): return "save"
+    return "yaml"
+
+def render(manager, rules, fmt):
+    if fmt == "save":
+        data = defaultdict(lambda: defaultdict(list))
+        for rule in rules: data[rule.table][rule.chain].append(rule)
+        return manager.build_restore_payload(data, counters=False)[0]
+    doc = {"family": manager.family, "rules": [rule.to_dict() for rule in rules]}
+    if fmt == "json": return json.dumps(doc, indent=2, ensure_ascii=False) + "\n"
+    return _yaml().safe_dump(doc, sort_keys=False, allow_unicode=True)
+
+def read_rules(manager, path, fmt=None):
+    # Returns the rules and, for a save file, the {table: {chain: policy}} it declares (None otherwise).
+    text = sys.stdin.read() if path == "-" else open(path).read()
+    fmt = fmt or detect_format(path, text)
+    if fmt == "save":
+        parser, lines = SaveParser(), text.splitlines()
+        rules = list(parser.parse(lines))
+        chains = {line[1:].strip(): {} for line in lines if line.startswith("*")}
+        for table, declared in parser.chains.items(): chains.setdefault(table, {}).update(declared)
+        return rules, chains
+    if fmt == "json": doc = json.loads(text)
+    else:
+        yaml = _yaml()
+        try: doc = yaml.safe_load(text)
+        except yaml.YAMLError as e: raise ValueError(f"YAML non valido: {e}")
+    if isinstance(doc, dict):
+        family = doc.get("family", manager.family)
+        if family != manager.family: raise ValueError(f"il file contiene regole {family}: {'aggiungi' if family == 'ipv6' else 'rimuovi'} -6")
+        doc = doc.get("rules", [])
+    if not isinstance(doc, list): raise ValueError("formato non valido: attesa una lista di regole")
+    return [Rule.from_dict(item) for item in doc], None
+
+def cmd_export(manager, args):
+    rules = manager.kernel_rules()
+    text = render(manager, rules, args.format)
+    if args.output == "-": sys.stdout.write(text)
+    else:
+        with open(args.output, "w") as f: f.write(text)
+        print(f"{len(rules)} regole esportate in {args.output}", file=sys.stderr)
+    return 0
+
+def cmd_diff(manager, args):
+    ops = manager.plan_changes(*read_rules(manager, args.file, args.format))
+    for op in ops: print(f"[{op.table}] {op}")
+    return 1 if ops else 0
+
+def cmd_apply(manager, args):
+    rules, chains = read_rules(manager, args.file, args.format)
+    started = time.perf_counter()
+    ops = manager.plan_changes(rules, chains)
+    if args.dry_run:
+        for op in ops: print(f"[{op.table}] {op}")
+        return 0
+    ok, err = manager.apply_plan(ops, test_first=not args.no_test)
+    if not ok:
+        print(err, file=sys.stderr)
+        return 1
+    print(f"{len(ops)} operazioni applicate in {time.perf_counter() - started:.2f}s")
+    if args.persist:
+        if not manager.refresh(force=True):
+            print("Errore persistenza: rilettura delle regole non riuscita", file=sys.stderr)
+            return 1
+        ok, report = manager.save_to_system()
+        print(report if ok else f"Errore persistenza: {report}", file=sys.stdout if ok else sys.stderr)
+        if not ok: return 1
+    return 0
+
+def cmd_import(manager, args):
+    args.persist = True
+    return cmd_apply(manager, args)
+
+def cmd_monitor(manager, args):
+    family, monitor = manager.family, CounterMonitor()
+    rules, polls = manager.kernel_rules(), 0
+    try:
+        while True:
+            monitor.poll((family,))
+            rows = list(zip(rules, monitor.rule_stats(family, rules)))
+            if args.top: rows = hottest(rows, args.top)
+            print(f"--- {time.strftime('%H:%M:%S')} {family}")
+            print(f"{'PKT/S':>10} {'BYTE/S':>12} {'PACCHETTI':>12}  REGOLA")
+            for rule, stats in rows:
+                pkts, _, pps, bps = stats or (0, 0, 0.0, 0.0)
+                print(f"{pps:>10.1f} {bps:>12.1f} {pkts:>12}  {rule.table}/{rule}")
+            sys.stdout.flush()
+            polls += 1
+            if args.count and polls >= args.count: return 0
+            time.sleep(args.interval)
+    except KeyboardInterrupt:
+        return 0
+
+def cmd_simulate(manager, args):
+    rules, chains = read_rules(manager, args.rules, args.format) if args.rules else (None, None)
+    if rules is None or not chains:
+        # Chain policies come from the kernel unless the ruleset file declares them.
+        try: kernel = manager.kernel_rules()
+        except OSError:
+            if rules is None: raise
+        else:
+            if rules is None: rules = kernel
+            chains = manager.chains
+    simulator = Simulator(rules, chains or {})
+    flows = read_flows(args.flows)
+    started = time.perf_counter()
+    results = evaluate_parallel(simulator, flows, args.chain, args.jobs or None)
+    elapsed = max(time.perf_counter() - started, 1e-9)
+    if args.output == "-": write_results(sys.stdout, simulator, flows, results)
+    else:
+        with open(args.output, "w", newline="") as f: write_results(f, simulator, flows, results)
+    verdicts = {}
+    for result in results: verdicts[result[0]] = verdicts.get(result[0], 0) + 1
+    summary = ", ".join(f"{v} {n}" for v, n in sorted(verdicts.items()))
+    print(f"{len(flows)} flussi in {elapsed:.2f}s ({len(flows) / elapsed * 60:,.0f}/min): {summary}", file=sys.stderr)
+    return 0
+
+def cmd_fleet(manager, args):
+    # Imported here: asyncio is only needed by this command, not by the CLI cold start.
+    from fleet import Fleet, load_hosts
+    golden = read_rules(manager, args.file, args.format)[0] if args.file else None
+    if args.action != "status" and golden is None: raise ValueError(f"fleet {args.action}: manca il ruleset di riferimento")
+    fleet = Fleet(load_hosts(args.hosts, args.fake), args.backend, manager.family, args.jobs, args.nft)
+    started = time.perf_counter()
+    try:
+        if args.action == "status": results = fleet.status()
+        elif args.action == "diff": results = fleet.diff(golden)
+        else: results = fleet.apply(golden, args.persist, args.dry_run, not args.no_test)
+    finally:
+        fleet.close()
+    for result in results:
+        print(result)
+        if args.action == "diff" or args.dry_run or args.verbose:
+            for op in result.ops: print(f"    [{op.table}] {op}")
+        if result.report is not None: print(f"    {result.report}")
+    failed = sum(not r.ok for r in results)
+    drifted = sum(r.ok and r.drift and not r.applied for r in results)
+    print(f"{len(results)} host in {time.perf_counter() - started:.2f}s: {failed} errori" +
+          (f", {drifted} non allineati" if golden is not None else ""), file=sys.stderr)
+    if failed: return 2 if failed == len(results) else 1
+    return 1 if args.action == "diff" and drifted else 0
+
+def build_parser():
+    parser = argparse.ArgumentParser(prog="iptables-forge", description="IPTables Forge senza interfaccia grafica")
+    parser.add_argument("-6", dest="ipv6", action="store_true", help="opera su ip6tables")
+    parser.add_argument("--backend", choices=BACKENDS, help="backend del kernel (default $FORGE_BACKEND o iptables)")
+    parser.add_argument("--nft", help="eseguibile nft (default $FORGE_NFT o nft)")
+    parser.add_argument("--profile", metavar="FILE", help="salva un profilo: trace Chrome se FILE è .json, altrimenti cProfile")
+    sub = parser.add_subparsers(dest="command", required=True)
+
+    export = sub.add_parser("export", help="esporta le regole del kernel")
+    export.add_argument("-f", "--format", choices=FORMATS, default="json")
+    export.add_argument("-o", "--output", default="-")
+    export.set_defaults(handler=cmd_export)
+
+    for name, handler, text in (("diff", cmd_diff, "mostra le operazioni necessarie per arrivare al file"),
+                                ("apply", cmd_apply, "applica il file al kernel"),
+                                ("import", cmd_import, "applica il file e aggiorna la persistenza")):
+        cmd = sub.add_parser(name, help=text)
+        cmd.add_argument("file", help="file JSON, YAML o iptables-save ('-' per stdin)")
+        cmd.add_argument("-f", "--format", choices=FORMATS)
+        cmd.set_defaults(handler=handler)
+        if name == "diff": continue
+        cmd.add_argument("--dry-run", action="store_true", help="mostra le operazioni senza applicarle")
+        cmd.add_argument("--no-test", action="store_true", help="salta la validazione con --test")
+        if name == "apply": cmd.add_argument("--persist", action="store_true", help="aggiorna anche la persistenza")
+
+    simulate = sub.add_parser("simulate", help="classifica un CSV di flussi (src,dst,proto,sport,dport,state[,in,out])")
+    simulate.add_argument("flows")
+    simulate.add_argument("-r", "--rules", help="ruleset da simulare al posto di quello del kernel")
+    simulate.add_argument("-f", "--format", choices=FORMATS)
+    simulate.add_argument("--chain", default="INPUT")
+    simulate.add_argument("-j", "--jobs", type=int, default=1, help="processi paralleli (0 = tutti i core)")
+    simulate.add_argument("-o", "--output", default="-")
+    simulate.set_defaults(handler=cmd_simulate)
+
+    fleet = sub.add_parser("fleet", help="legge, confronta o applica un ruleset su più host via SSH")
+    fleet.add_argument("hosts", help="file JSON con la lista degli host")
+    fleet.add_argument("action", choices=("status", "diff", "apply"))
+    fleet.add_argument("file", nargs="?", help="ruleset di riferimento (JSON, YAML o iptables-save)")
+    fleet.add_argument("-f", "--format", choices=FORMATS)
+    fleet.add_argument("-j", "--jobs", type=int, default=8, help="host gestiti in parallelo")
+    fleet.add_argument("--fake", metavar="DIR", help="host simulati da DIR/<nome>.v4 e .v6 invece di SSH")
+    fleet.add_argument("--dry-run", action="store_true", help="mostra le operazioni senza applicarle")
+    fleet.add_argument("--no-test", action="store_true", help="salta la validazione con --test")
+    fleet.add_argument("--persist", action="store_true", help="aggiorna anche la persistenza sugli host")
+    fleet.add_argument("-v", "--verbose", action="store_true", help="elenca anche le operazioni applicate")
+    fleet.set_defaults(handler=cmd_fleet)
+
+    monitor = sub.add_parser("monitor", help="mostra le regole più colpite")
+    monitor.add_argument("-i", "--interval", type=float, default=2.0)
+    monitor.add_argument("-n", "--top", type=int, default=20)
+    monitor.add_argument("-c", "--count", type=int, default=0, help="numero di letture (0 = infinite)")
+    monitor.set_defaults(handler=cmd_monitor)
+    return parser
+
+def main(argv=None):
+    args = build_parser().parse_args(argv)
+    manager = IptablesManager(make_backend(args.backend, args.nft))
+    manager.is_ipv6_mode = args.ipv6
+    with profiling.session(args.profile) as profiler:
+        try:
+            return args.handler(manager, args)
+        except (OSError, ValueError) as e:
+            print(f"errore: {e}", file=sys.stderr)
+            return 2
+        finally:
+            if profiler is not None: print(profiler.report(), file=sys.stderr)
+
+if __name__ == "__main__":
+    sys.exit(main())
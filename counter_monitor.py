@@ -0,0 +1,83 @@
+import heapq
+import time
+
+import profiling
+from iptables_parser import parse_rule_line
+
+FAMILIES = {"ipv4": "iptables-save", "ipv6": "ip6tables-save"}
+
+class CounterSnapshot:
+    def __init__(self, taken_at, counters):
+        self.taken_at = taken_at
+        self.counters = counters
+
+class CounterMonitor:
+    def __init__(self):
+        # Kernel rule text -> canonical key: after the first poll a line costs one dict lookup, not a parse.
+        self._keys = {}
+        self.previous = {}
+        self.rates = {}
+
+    def _key(self, table, text):
+        key = self._keys.get((table, text))
+        if key is None:
+            key = parse_rule_line(text, table).key
+            self._keys[(table, text)] = key
+        return key
+
+    def read_counters(self, lines):
+        counters, table = {}, "filter"
+        for line in lines:
+            if line.startswith("["):
+                values, _, text = line.rstrip("\n").partition("] ")
+                if not text.startswith("-A "): continue
+                pkts, _, bytes = values[1:].partition(":")
+                counters.setdefault(self._key(table, text), []).append((int(pkts), int(bytes)))
+            elif line.startswith("*"): table = line[1:].strip()
+        return counters
+
+    def snapshot(self, family):
+        with profiling.Stream([FAMILIES[family], "-c"]) as proc:
+            counters = self.read_counters(proc)
+        return CounterSnapshot(time.monotonic(), counters)
+
+    def poll(self, families=tuple(FAMILIES)):
+        for family in families:
+            try: current = self.snapshot(family)
+            except OSError: continue
+            self.rates[family] = self._rates(self.previous.get(family), current)
+            self.previous[family] = current
+        return self.rates
+
+    def _rates(self, before, after):
+        rates = {}
+        elapsed = after.taken_at - before.taken_at if before else 0
+        for key, values in after.counters.items():
+            old = before.counters.get(key, ()) if before else ()
+            per_key = []
+            for i, (pkts, bytes) in enumerate(values):
+                if elapsed <= 0 or i >= len(old) or pkts < old[i][0]: per_key.append((pkts, bytes, 0.0, 0.0))
+                else: per_key.append((pkts, bytes, (pkts - old[i][0]) / elapsed, (bytes - old[i][1]) / elapsed))
+            rates[key] = per_key
+        return rates
+
+    def rule_stats(self, family, rules):
+        return match_occurrences(rules, self.rates.get(family, {}))
+
+    def packet_counts(self, family, rules):
+        counters = self.snapshot(family).counters
+        return [0 if c is None else c[0] for c in match_occurrences(rules, counters)]
+
+def match_occurrences(rules, values_by_key):
+    # Identical rules share a key: the k-th occurrence in the ruleset gets the k-th kernel counter.
+    seen, matched = {}, []
+    for rule in rules:
+        key = rule.key
+        occurrence = seen.get(key, 0)
+        seen[key] = occurrence + 1
+        values = values_by_key.get(key, ())
+        matched.append(values[occurrence] if occurrence < len(values) else None)
+    return matched
+
+def hottest(rows, n):
+    return heapq.nlargest(n, rows, key=lambda row: -1 if row[1] is None else row[1][2])
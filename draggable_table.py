@@ -1,9 +1,7 @@
-from PyQt6.QtWidgets import QTableWidget, QAbstractItemView
-from PyQt6.QtCore import Qt, pyqtSignal
-
-class DraggableTableWidget(QTableWidget):
-    itemDropped = pyqtSignal(int, int)
+from PyQt6.QtWidgets import QTableView, QAbstractItemView
+from PyQt6.QtCore import Qt
 
+class DraggableTableView(QTableView):
     def __init__(self, parent=None):
         super().__init__(parent)
         self.setDragEnabled(True)
@@ -13,11 +11,8 @@ class DraggableTableWidget(QTableWidget):
         self.setSelectionMode(QAbstractItemView.SelectionMode.SingleSelection)
         self.setSelectionBehavior(QAbstractItemView.SelectionBehavior.SelectRows)
         self.setDragDropMode(QAbstractItemView.DragDropMode.InternalMove)
+        self.setDefaultDropAction(Qt.DropAction.MoveAction)
 
-    def dropEvent(self, event):
-        if not event.source() == self: return
-        source_row = self.currentRow()
-        drop_row = self.indexAt(event.position().toPoint()).row()
-        if drop_row == -1: drop_row = self.rowCount() - 1
-        super().dropEvent(event)
-        self.itemDropped.emit(source_row, drop_row)
+    def current_row(self):
+        index = self.currentIndex()
+        return index.row() if index.isValid() else -1
@@ -0,0 +1,127 @@
+import asyncio
+import json
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+from iptables_manager import IptablesManager, make_backend
+from profiling import traced
+from rule_diff import diff_rules
+from transport import FakeTransport, SSHTransport
+
+DEFAULT_CONCURRENCY = 8
+
+def load_hosts(path, fake_dir=None):
+    # A JSON list of host names or {"name", "host", "user", "port", "identity", "options"} objects.
+    # With fake_dir every host is served by a FakeTransport reading <fake_dir>/<name>.v4 and .v6.
+    with open(path) as f: doc = json.load(f)
+    if not isinstance(doc, list): raise ValueError(f"{path}: attesa una lista di host")
+    transports = []
+    for item in doc:
+        spec = {"host": item} if isinstance(item, str) else dict(item)
+        if "host" not in spec: raise ValueError(f"{path}: host mancante in {item}")
+        name = spec.pop("name", spec["host"])
+        if fake_dir: transport = FakeTransport(name, fixture_dir=fake_dir)
+        else: transport = SSHTransport(spec.pop("host"), **{k: spec[k] for k in ("user", "port", "identity", "options") if k in spec})
+        transport.name = name
+        transports.append(transport)
+    names = [t.name for t in transports]
+    if len(set(names)) != len(names): raise ValueError(f"{path}: nomi host duplicati")
+    return transports
+
+class HostResult:
+    def __init__(self, host):
+        self.host = host
+        self.ok = True
+        self.error = ""
+        self.rules = None
+        self.ops = []
+        self.compared = False
+        self.applied = False
+        self.report = None
+        self.elapsed = 0.0
+
+    @property
+    def drift(self):
+        return bool(self.ops)
+
+    def __str__(self):
+        if not self.ok: return f"{self.host}: ERRORE {self.error}"
+        if not self.compared: state = f"{len(self.rules)} regole"
+        else: state = f"{len(self.ops)} differenze" if self.ops else "allineato"
+        if self.applied: state = f"{len(self.ops)} operazioni applicate"
+        return f"{self.host}: {state} ({self.elapsed * 1000:.0f} ms)"
+
+class Fleet:
+    # One IptablesManager per host over its own transport; operations run on every host at once, at most
+    # `concurrency` at a time. Transports are blocking, so each host's work runs in a worker thread and the
+    # event loop only schedules, bounds and collects: the SSH round trips overlap, parsing does not.
+    def __init__(self, transports, backend=None, family="ipv4", concurrency=DEFAULT_CONCURRENCY, nft=None):
+        self.family = family
+        self.concurrency = max(1, concurrency)
+        self.transports = list(transports)
+        self.managers = {}
+        for transport in self.transports:
+            manager = IptablesManager(make_backend(backend, nft, transport))
+            manager.is_ipv6_mode = family == "ipv6"
+            self.managers[transport.name] = manager
+
+    @property
+    def hosts(self):
+        return list(self.managers)
+
+    async def _gather(self, task, hosts, *args):
+        loop = asyncio.get_running_loop()
+        limit = asyncio.Semaphore(self.concurrency)
+
+        async def one(pool, host):
+            result = HostResult(host)
+            async with limit:
+                started = time.perf_counter()
+                try: await loop.run_in_executor(pool, task, self.managers[host], result, *args)
+                except Exception as e: result.ok, result.error = False, str(e) or type(e).__name__
+                result.elapsed = time.perf_counter() - started
+            return result
+        # A pool of our own: the loop's default one is sized on the CPU count, not on how many hosts may wait on SSH.
+        with ThreadPoolExecutor(max_workers=min(self.concurrency, len(hosts)) or 1) as pool:
+            return await asyncio.gather(*(one(pool, host) for host in hosts))
+
+    def run(self, task, *args, hosts=None):
+        return asyncio.run(self._gather(task, self.hosts if hosts is None else hosts, *args))
+
+    def _read(self, manager, result):
+        result.rules = manager.kernel_rules(self.family)
+
+    def _diff(self, manager, result, golden):
+        self._read(manager, result)
+        result.ops = diff_rules(result.rules, golden)
+        result.compared = True
+
+    def _apply(self, manager, result, golden, persist, dry_run, test_first):
+        self._diff(manager, result, golden)
+        if dry_run: return
+        if result.ops:
+            ok, err = manager.apply_plan(result.ops, test_first, self.family)
+            if not ok: raise OSError(err)
+            result.applied = True
+        if persist:
+            # Persistence renders what the host's kernel holds after the apply, read back; both families, so the
+            # other one's boot file is rewritten from the kernel rather than dropped.
+            manager.refresh_all(force=True)
+            ok, report = manager.save_to_system()
+            if not ok: raise OSError(f"persistenza: {report}")
+            result.report = report
+
+    @traced("fleet.status")
+    def status(self, hosts=None):
+        return self.run(self._read, hosts=hosts)
+
+    @traced("fleet.diff")
+    def diff(self, golden, hosts=None):
+        return self.run(self._diff, golden, hosts=hosts)
+
+    @traced("fleet.apply")
+    def apply(self, golden, persist=False, dry_run=False, test_first=True, hosts=None):
+        return self.run(self._apply, golden, persist, dry_run, test_first, hosts=hosts)
+
+    def close(self):
+        for transport in self.transports: transport.close()
@@ -0,0 +1,188 @@
+import os
+
+from PyQt6.QtCore import Qt, QThreadPool
+from PyQt6.QtGui import QFont
+from PyQt6.QtWidgets import (QDialog, QVBoxLayout, QHBoxLayout, QLabel, QSpinBox, QPushButton, QCheckBox, QTableWidget,
+                             QTableWidgetItem, QHeaderView, QAbstractItemView, QPlainTextEdit, QFileDialog, QMessageBox, QSplitter)
+
+from fleet import Fleet, load_hosts, DEFAULT_CONCURRENCY
+from workers import Worker
+
+MAX_LISTED = 500
+
+class FleetDialog(QDialog):
+    HEADERS = ["HOST", "STATO", "REGOLE", "DIFFERENZE", "TEMPO"]
+
+    def __init__(self, window):
+        super().__init__(window)
+        self.window = window
+        self.fleet = None
+        self.path = None
+        self.worker = None
+        self.results = {}
+        self.setWindowTitle("Flotta")
+        self.resize(1000, 650)
+
+        layout = QVBoxLayout(self)
+        controls = QHBoxLayout()
+        load_btn = QPushButton("CARICA HOST")
+        load_btn.clicked.connect(self.choose_hosts)
+        controls.addWidget(load_btn)
+        controls.addWidget(QLabel("IN PARALLELO:"))
+        self.jobs_spin = QSpinBox()
+        self.jobs_spin.setRange(1, 256)
+        self.jobs_spin.setValue(DEFAULT_CONCURRENCY)
+        controls.addWidget(self.jobs_spin)
+        self.persist_check = QCheckBox("PERSISTENZA")
+        self.persist_check.setToolTip("Dopo l'applicazione aggiorna anche i file di avvio sugli host")
+        controls.addWidget(self.persist_check)
+        controls.addStretch()
+        self.status_label = QLabel()
+        controls.addWidget(self.status_label)
+        layout.addLayout(controls)
+
+        splitter = QSplitter(Qt.Orientation.Vertical)
+        self.table = QTableWidget(0, len(self.HEADERS))
+        self.table.setHorizontalHeaderLabels(self.HEADERS)
+        self.table.setEditTriggers(QAbstractItemView.EditTrigger.NoEditTriggers)
+        self.table.setSelectionBehavior(QAbstractItemView.SelectionBehavior.SelectRows)
+        self.table.horizontalHeader().setSectionResizeMode(QHeaderView.ResizeMode.Interactive)
+        self.table.horizontalHeader().setSectionResizeMode(1, QHeaderView.ResizeMode.Stretch)
+        self.table.verticalHeader().setVisible(False)
+        self.table.itemSelectionChanged.connect(self.show_details)
+        splitter.addWidget(self.table)
+        self.details = QPlainTextEdit()
+        self.details.setReadOnly(True)
+        self.details.setFont(QFont("Monospace", 9))
+        splitter.addWidget(self.details)
+        layout.addWidget(splitter, 1)
+
+        buttons = QHBoxLayout()
+        self.check_btn = QPushButton("VERIFICA")
+        self.check_btn.setToolTip("Confronta ogni host con le regole dell'editor")
+        self.check_btn.clicked.connect(self.check)
+        buttons.addWidget(self.check_btn)
+        buttons.addStretch()
+        close_btn = QPushButton("CHIUDI")
+        close_btn.clicked.connect(self.reject)
+        buttons.addWidget(close_btn)
+        self.apply_btn = QPushButton("APPLICA")
+        self.apply_btn.setObjectName("applyButton")
+        self.apply_btn.setToolTip("Applica le regole dell'editor agli host selezionati, o a tutti quelli non allineati")
+        self.apply_btn.clicked.connect(self.apply)
+        buttons.addWidget(self.apply_btn)
+        layout.addLayout(buttons)
+
+        # $FORGE_FLEET_FAKE serves every host from <dir>/<name>.v4 and .v6 fixtures instead of SSH.
+        self.fake_dir = os.environ.get("FORGE_FLEET_FAKE")
+        if os.environ.get("FORGE_FLEET_HOSTS"): self.load_hosts(os.environ["FORGE_FLEET_HOSTS"])
+        else: self.details.setPlainText("CARICA HOST: file JSON con la lista degli host, ad esempio\n"
+                                        '["web1", {"name": "db", "host": "10.0.0.5", "user": "root", "port": 22}]')
+        self.update_buttons()
+
+    def family(self):
+        return self.window.manager.family
+
+    def choose_hosts(self):
+        path, _ = QFileDialog.getOpenFileName(self, "Host della flotta", "", "JSON (*.json);;Tutti i file (*)")
+        if path: self.load_hosts(path)
+
+    def load_hosts(self, path):
+        try: transports = load_hosts(path, self.fake_dir)
+        except (OSError, ValueError) as e:
+            QMessageBox.critical(self, "Flotta", str(e))
+            return
+        if self.fleet is not None: self.fleet.close()
+        self.fleet = Fleet(transports, family=self.family(), concurrency=self.jobs_spin.value())
+        self.path, self.results = path, {}
+        self.table.setRowCount(len(self.fleet.hosts))
+        for row, host in enumerate(self.fleet.hosts):
+            self.table.setItem(row, 0, QTableWidgetItem(host))
+            for col in range(1, len(self.HEADERS)): self.table.setItem(row, col, QTableWidgetItem(""))
+        self.status_label.setText(f"{len(self.fleet.hosts)} host da {os.path.basename(path)}")
+        self.details.clear()
+        self.update_buttons()
+
+    def update_buttons(self):
+        idle = self.fleet is not None and self.worker is None
+        self.check_btn.setEnabled(idle)
+        self.apply_btn.setEnabled(idle)
+        self.jobs_spin.setEnabled(self.worker is None)
+
+    def selected_hosts(self):
+        return [self.table.item(index.row(), 0).text() for index in self.table.selectionModel().selectedRows()]
+
+    def run(self, label, fn, *args):
+        # Family and concurrency follow the main window and the spin box at the time of each run.
+        self.fleet.family = self.family()
+        self.fleet.concurrency = self.jobs_spin.value()
+        for manager in self.fleet.managers.values(): manager.is_ipv6_mode = self.fleet.family == "ipv6"
+        self.worker = Worker(lambda worker: fn(*args))
+        self.worker.signals.finished.connect(self.on_finished)
+        self.worker.signals.failed.connect(self.on_failed)
+        self.status_label.setText(label)
+        self.update_buttons()
+        QThreadPool.globalInstance().start(self.worker)
+
+    def check(self):
+        self.run("Verifica in corso...", self.fleet.diff, list(self.window.all_rules))
+
+    def apply(self):
+        hosts = self.selected_hosts() or [host for host, result in self.results.items() if result.ok and result.drift]
+        if not hosts:
+            QMessageBox.information(self, "Flotta", "Nessun host selezionato o non allineato: esegui prima VERIFICA.")
+            return
+        rules = list(self.window.all_rules)
+        text = f"Applicare le {len(rules)} regole {self.family().upper()} dell'editor a {len(hosts)} host?"
+        if self.persist_check.isChecked(): text += "\nLa persistenza verrà aggiornata su ogni host."
+        if QMessageBox.question(self, "Flotta", text) != QMessageBox.StandardButton.Yes: return
+        self.run(f"Applicazione su {len(hosts)} host...", self.fleet.apply, rules, self.persist_check.isChecked(), False, True, hosts)
+
+    def on_finished(self, results):
+        self.worker = None
+        rows = {host: row for row, host in enumerate(self.fleet.hosts)}
+        for result in results:
+            self.results[result.host] = result
+            row = rows[result.host]
+            if not result.ok: state = f"errore: {result.error.splitlines()[0] if result.error else ''}"
+            elif result.applied: state = "applicato" + (", persistenza aggiornata" if result.report is not None else "")
+            else: state = "non allineato" if result.drift else "allineato"
+            values = [state, "" if result.rules is None else str(len(result.rules)),
+                      str(len(result.ops)) if result.ok and not result.applied else "", f"{result.elapsed * 1000:.0f} ms"]
+            for col, value in enumerate(values, 1): self.table.item(row, col).setText(value)
+            self.table.item(row, 1).setForeground(Qt.GlobalColor.red if not result.ok or (result.drift and not result.applied)
+                                                  else Qt.GlobalColor.darkGreen)
+        failed = sum(not r.ok for r in results)
+        drifted = sum(r.ok and r.drift and not r.applied for r in results)
+        self.status_label.setText(f"{len(results)} host: {failed} errori, {drifted} non allineati")
+        self.update_buttons()
+        self.show_details()
+
+    def on_failed(self, err):
+        self.worker = None
+        self.status_label.setText(f"Errore: {err}")
+        self.update_buttons()
+
+    def show_details(self):
+        hosts = self.selected_hosts()
+        result = self.results.get(hosts[0]) if hosts else None
+        if result is None:
+            self.details.clear()
+            return
+        if not result.ok:
+            self.details.setPlainText(result.error)
+            return
+        lines = [f"[{op.table}] {op}" for op in result.ops[:MAX_LISTED]]
+        if len(result.ops) > MAX_LISTED: lines.append(f"... e altre {len(result.ops) - MAX_LISTED} operazioni")
+        head = f"{len(result.ops)} operazioni {'applicate su' if result.applied else 'per allineare'} {result.host}"
+        text = f"{head}:\n\n" + "\n".join(lines) if result.ops else f"{result.host} coincide con l'editor."
+        if result.report is not None: text += f"\n\n{result.report}"
+        self.details.setPlainText(text)
+
+    def reject(self):
+        # Also reached from Esc and the window's close button; closing ends the hosts' SSH control masters.
+        if self.worker is not None:
+            self.status_label.setText("Attendi la fine dell'operazione in corso.")
+            return
+        if self.fleet is not None: self.fleet.close()
+        super().reject()
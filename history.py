@@ -0,0 +1,281 @@
+import hashlib
+import json
+import os
+import time
+from contextlib import contextmanager
+
+from iptables_parser import parse_rule_line
+
+HISTORY_DIR = "/var/lib/iptables-forge"
+
+def ruleset_fingerprint(rules):
+    digest = hashlib.blake2b(digest_size=16)
+    for rule in rules: digest.update(f"{rule.table} {rule}\n".encode())
+    return digest.hexdigest()
+
+class Node:
+    # One undo step: only the positional delta against the parent, so history costs what was edited,
+    # not the size of the ruleset. Roots instead stand for a whole ruleset (a kernel read or a bulk rewrite)
+    # stored once per distinct content in a base file; their parent, if any, is where editing came from.
+    __slots__ = ("id", "parent", "label", "ops", "fp", "at")
+
+    def __init__(self, id, parent, label, ops=None, fp=None, at=None):
+        self.id = id
+        self.parent = parent
+        self.label = label
+        self.ops = ops
+        self.fp = fp
+        self.at = at or time.time()
+
+    @property
+    def is_root(self):
+        return self.ops is None
+
+def apply_ops(rules, ops):
+    for op in ops:
+        if op[0] == "i": rules.insert(op[1], op[2])
+        else: op[2] = rules.pop(op[1])
+    return rules
+
+class History:
+    def __init__(self, family, history_dir=HISTORY_DIR):
+        self.family = family
+        self.history_dir = history_dir
+        self.path = os.path.join(history_dir, f"history-{family}.jsonl") if history_dir else None
+        self.error = None
+        self.nodes = {}
+        self.snapshots = {}
+        self.head = None
+        self.redo_stack = []
+        self.store = None
+        self._store_fp = None
+        self._last_id = 0
+        self._file = None
+        self._pending = None
+        self._bases = {}
+        self._load()
+
+    def _base_path(self, fp):
+        return os.path.join(self.history_dir, f"base-{self.family}-{fp}.rules")
+
+    def _write(self, entry):
+        if self.path is None: return
+        try:
+            if self._file is None:
+                os.makedirs(self.history_dir, exist_ok=True)
+                # Line buffered: each step reaches the file as soon as it is recorded.
+                self._file = open(self.path, "a", buffering=1)
+            self._file.write(json.dumps(entry, separators=(",", ":")) + "\n")
+        except OSError as e:
+            # History on disk is a convenience: editing goes on in memory if the directory is not writable.
+            self.error, self.path = str(e), None
+
+    def _entry(self, node):
+        parent = node.parent.id if node.parent else None
+        if node.is_root: return {"root": node.id, "parent": parent, "fp": node.fp, "label": node.label, "at": node.at}
+        return {"node": node.id, "parent": parent, "label": node.label, "at": node.at,
+                "ops": [[pos, rule.table, str(rule)] if kind == "i" else [pos] for kind, pos, rule in node.ops]}
+
+    def _load(self):
+        if self.path is None: return
+        if not os.path.exists(self.path): return self._compact(0)
+        lines = 0
+        with open(self.path) as f:
+            for lines, line in enumerate(f, 1):
+                try: entry = json.loads(line)
+                except ValueError: continue
+                if "root" in entry:
+                    node = Node(entry["root"], self.nodes.get(entry.get("parent")), entry.get("label", ""), fp=entry["fp"], at=entry.get("at"))
+                elif "node" in entry and "ops" in entry:
+                    ops = [["i", op[0], parse_rule_line(op[2], op[1])] if len(op) == 3 else ["d", op[0], None] for op in entry["ops"]]
+                    node = Node(entry["node"], self.nodes.get(entry["parent"]), entry.get("label", ""), ops, at=entry.get("at"))
+                elif "snapshot" in entry:
+                    if entry["node"] in self.nodes: self.snapshots[entry["snapshot"]] = (self.nodes[entry["node"]], entry.get("at", 0))
+                    else: self.snapshots.pop(entry["snapshot"], None)
+                    continue
+                elif "head" in entry:
+                    self.head = self.nodes.get(entry["head"])
+                    continue
+                else: continue
+                self.nodes[node.id] = node
+                self.head = node
+                self._last_id = max(self._last_id, node.id)
+        self._compact(lines)
+
+    def _compact(self, lines):
+        # Redo does not survive a restart, so only the head's and the snapshots' ancestors can still be reached:
+        # the journal is rewritten with just those, and base files that no root left in it points at are removed.
+        keep = {}
+        for node in [self.head] + [node for node, _ in self.snapshots.values()]:
+            while node is not None and node.id not in keep:
+                keep[node.id] = node
+                node = node.parent
+        if lines > len(keep) + len(self.snapshots) + 1:
+            try:
+                with open(self.path + ".tmp", "w") as f:
+                    for node_id in sorted(keep): f.write(json.dumps(self._entry(keep[node_id]), separators=(",", ":")) + "\n")
+                    for name, (node, at) in self.snapshots.items():
+                        f.write(json.dumps({"snapshot": name, "node": node.id, "at": at}, separators=(",", ":")) + "\n")
+                    if self.head is not None: f.write(json.dumps({"head": self.head.id}) + "\n")
+                os.replace(self.path + ".tmp", self.path)
+            except OSError as e:
+                self.error = str(e)
+                return
+            self.nodes = keep
+        used = {os.path.basename(self._base_path(node.fp)) for node in self.nodes.values() if node.is_root}
+        prefix = f"base-{self.family}-"
+        try: names = os.listdir(self.history_dir)
+        except OSError: return
+        for name in names:
+            if name.startswith(prefix) and name not in used:
+                try: os.remove(os.path.join(self.history_dir, name))
+                except OSError: pass
+
+    def _next_id(self):
+        self._last_id += 1
+        return self._last_id
+
+    def _base(self, root):
+        rules = self._bases.get(root.fp)
+        if rules is None:
+            try:
+                with open(self._base_path(root.fp)) as f:
+                    rules = [parse_rule_line(text.rstrip("\n"), table) for table, _, text in (line.partition(" ") for line in f)]
+            except OSError:
+                raise ValueError(f"ruleset di partenza {root.fp} non disponibile")
+            self._bases[root.fp] = rules
+        return rules
+
+    def rules_at(self, node):
+        path = []
+        while not node.is_root:
+            path.append(node)
+            node = node.parent
+        rules = list(self._base(node))
+        for step in reversed(path): apply_ops(rules, step.ops)
+        return rules
+
+    def track(self, store, fp=None):
+        if self.store is not None: self.store.journal = None
+        self.store, self._store_fp = store, fp
+        store.journal = self
+
+    def _tracked_fp(self):
+        # Hashing is linear in the ruleset: the tracked store's fingerprint is kept until an edit or a replay.
+        if self._store_fp is None: self._store_fp = ruleset_fingerprint(self.store)
+        return self._store_fp
+
+    def attach(self, store, label="kernel"):
+        # A store that did not come out of this history: continue from it as a new root, unless it is
+        # exactly the ruleset at the head (an apply read back, or a restart with unapplied edits still in the log).
+        fp = ruleset_fingerprint(store)
+        if self.head is not None:
+            if self.store is not None and self._tracked_fp() == fp:
+                self.track(store, fp)
+                return
+            root = self.head
+            while not root.is_root: root = root.parent
+            if self.store is None and root.fp == fp:
+                path, node = [], self.head
+                while node is not root:
+                    path.append(node)
+                    node = node.parent
+                self.head, self.redo_stack = root, path
+                self._bases[fp] = list(store)
+                self._write({"head": root.id})
+                self.track(store, fp)
+                return
+        self._bases[fp] = list(store)
+        if self.path is not None and not os.path.exists(self._base_path(fp)):
+            try:
+                with open(self._base_path(fp) + ".tmp", "w") as f: f.writelines(f"{r.table} {r}\n" for r in store)
+                os.replace(self._base_path(fp) + ".tmp", self._base_path(fp))
+            except OSError as e: self.error = str(e)
+        node = Node(self._next_id(), self.head, label, fp=fp)
+        self.nodes[node.id] = node
+        self._write(self._entry(node))
+        self.head, self.redo_stack = node, []
+        self.track(store, fp)
+
+    def record(self, kind, pos, rule):
+        self._store_fp = None
+        if self._pending is None: self._push("modifica", [[kind, pos, rule]])
+        else: self._pending.append([kind, pos, rule])
+
+    @contextmanager
+    def step(self, label):
+        if self._pending is not None:
+            yield
+            return
+        self._pending = []
+        try:
+            yield
+        finally:
+            ops, self._pending = self._pending, None
+            if ops: self._push(label, ops)
+
+    def _push(self, label, ops):
+        node = Node(self._next_id(), self.head, label, ops)
+        self.nodes[node.id] = node
+        self._write(self._entry(node))
+        self.head, self.redo_stack = node, []
+
+    def _replay(self, ops, reverse=False):
+        self._store_fp = None
+        store, self.store.journal = self.store, None
+        try:
+            if reverse:
+                for kind, pos, rule in reversed(ops):
+                    if kind == "i": store.pop(pos)
+                    else: store.insert(pos, rule)
+            else:
+                for op in ops:
+                    if op[0] == "i": store.insert(op[1], op[2])
+                    else: op[2] = store.pop(op[1])
+        finally:
+            store.journal = self
+
+    def can_undo(self):
+        return self.head is not None and self.head.parent is not None
+
+    def can_redo(self):
+        return bool(self.redo_stack)
+
+    def undo(self):
+        # Returns None when the store was updated in place, or the full ruleset when the step crosses a root.
+        if not self.can_undo(): return None
+        node = self.head
+        self.redo_stack.append(node)
+        self.head = node.parent
+        self._write({"head": self.head.id})
+        if node.is_root: return self.rules_at(self.head)
+        self._replay(node.ops, reverse=True)
+        return None
+
+    def redo(self):
+        if not self.can_redo(): return None
+        node = self.redo_stack.pop()
+        self.head = node
+        self._write({"head": node.id})
+        if node.is_root: return self.rules_at(node)
+        self._replay(node.ops)
+        return None
+
+    def checkout(self, node):
+        rules = self.rules_at(node)
+        self.head, self.redo_stack = node, []
+        self._write({"head": node.id})
+        return rules
+
+    def snapshot(self, name):
+        self.snapshots[name] = (self.head, time.time())
+        self._write({"snapshot": name, "node": self.head.id, "at": self.snapshots[name][1]})
+
+    def drop_snapshot(self, name):
+        if self.snapshots.pop(name, None) is not None: self._write({"snapshot": name, "node": None})
+
+    def undo_label(self):
+        return self.head.label if self.can_undo() else ""
+
+    def redo_label(self):
+        return self.redo_stack[-1].label if self.redo_stack else ""
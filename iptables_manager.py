@@ -1,77 +1,372 @@
 import subprocess
 import os
+import re
+import time
+import hashlib
 from collections import defaultdict
 
-class Rule:
-    def __init__(self, chain, protocol="all", source="any", destination="any", 
-                 target="ACCEPT", sport=None, dport=None, state=None, 
-                 comment="", table='filter'):
-        self.table = table
-        self.chain = chain
-        self.protocol = protocol
-        self.source = source
-        self.destination = destination
-        self.target = target
-        self.sport = sport
-        self.dport = dport
-        self.state = state
-        self.comment = comment
-
-    def __str__(self):
-        parts = ["-A", self.chain]
-        if self.protocol and self.protocol != "all":
-            parts.extend(["-p", self.protocol])
-        any_addrs = ["0.0.0.0/0", "::/0", "anywhere", "any"]
-        if self.source and self.source not in any_addrs:
-            parts.extend(["-s", self.source])
-        if self.destination and self.destination not in any_addrs:
-            parts.extend(["-d", self.destination])
-        if self.sport: parts.extend(["--sport", str(self.sport)])
-        if self.dport: parts.extend(["--dport", str(self.dport)])
-        if self.state: parts.extend(["-m", "state", "--state", self.state])
-        if self.comment: parts.extend(["-m", "comment", "--comment", f'"{self.comment}"'])
-        parts.extend(["-j", self.target])
-        return " ".join(parts)
+from profiling import traced
+from rule import Rule
+from rule_diff import ChainOp, diff_rules
+from rule_store import RuleStore
+from iptables_parser import SaveParser
+from persistence import PersistenceWriter, RULES_FILES, service_content
+from transport import LOCAL
+
+BUILTIN_CHAINS = {
+    "filter": ["INPUT", "FORWARD", "OUTPUT"],
+    "nat": ["PREROUTING", "INPUT", "OUTPUT", "POSTROUTING"],
+    "mangle": ["PREROUTING", "INPUT", "FORWARD", "OUTPUT", "POSTROUTING"],
+    "raw": ["PREROUTING", "OUTPUT"]
+}
+
+FAMILIES = ("ipv4", "ipv6")
+SAVE_COMMANDS = {"ipv4": "iptables-save", "ipv6": "ip6tables-save"}
+RESTORE_COMMANDS = {"ipv4": "iptables-restore", "ipv6": "ip6tables-restore"}
+BACKENDS = ("iptables", "nft")
+
+def fingerprinted(lines, digest):
+    # Passes the lines through while hashing them. Comment lines carry timestamps and chain headers carry
+    # policy counters that tick with traffic: neither is ruleset state, so they are left out of the digest.
+    for line in lines:
+        if line[:1] != "#":
+            digest.update((line.rpartition(" [")[0] if line[:1] == ":" else line.rstrip("\n")).encode())
+            digest.update(b"\n")
+        yield line
+
+def fingerprint(lines):
+    digest = hashlib.blake2b(digest_size=16)
+    for _ in fingerprinted(lines, digest): pass
+    return digest.hexdigest()
+
+class FamilyState:
+    def __init__(self, family):
+        self.family = family
+        self.chains = {}
+        self.chain_counters = {}
+        self.fingerprint = None
+        self.checked_at = 0.0
+        self.kernel_changed = False
+        self.applied = []
+        self.set_rules((), dirty=False)
+
+    def set_rules(self, rules, dirty=True):
+        self.rules = RuleStore(rules)
+        self.rules.observe(self)
+        self.dirty = dirty
+
+    def rule_added(self, rule):
+        self.dirty = True
+
+    def rule_removed(self, rule):
+        self.dirty = True
+
+class IptablesBackend:
+    # A backend reads a family's ruleset (dump -> fingerprint/parse), applies diff plans and full rulesets
+    # in one transaction, and renders the files persistence writes at boot.
+    name = "iptables"
+    rules_files = tuple(RULES_FILES.values())
+
+    def __init__(self, transport=None):
+        self.transport = transport or LOCAL
+
+    def dump(self, family, counters=False):
+        cmd = SAVE_COMMANDS[family]
+        try:
+            with self.transport.stream([cmd, "-c"] if counters else [cmd]) as proc:
+                lines = proc.readlines()
+        except OSError:
+            return None
+        return lines if proc.returncode == 0 else None
+
+    def fingerprint(self, lines):
+        return fingerprint(lines)
+
+    @traced("iptables.parse")
+    def parse(self, lines, family):
+        parser = SaveParser()
+        rules = list(parser.parse(lines))
+        return rules, parser.chains, parser.chain_counters
+
+    @traced("iptables.read")
+    def read(self, family, counters=False):
+        # dump + fingerprint + parse in one pass: lines go from the pipe to the parser as iptables-save writes them.
+        cmd, parser, digest = SAVE_COMMANDS[family], SaveParser(), hashlib.blake2b(digest_size=16)
+        try:
+            with self.transport.stream([cmd, "-c"] if counters else [cmd]) as proc:
+                rules = list(parser.parse(fingerprinted(proc, digest)))
+        except OSError:
+            return None
+        if proc.returncode != 0: return None
+        return rules, parser.chains, parser.chain_counters, digest.hexdigest()
+
+    @staticmethod
+    def build_restore_payload(state, structured_data, counters=True):
+        lines, line_rules = [], {}
+        for table in dict.fromkeys([*state.chains, *structured_data]):
+            chains = dict(state.chains.get(table, {}))
+            for chain in BUILTIN_CHAINS.get(table, []): chains.setdefault(chain, "-")
+            for chain in structured_data.get(table, {}): chains.setdefault(chain, "-")
+            lines.append(f"*{table}")
+            for chain, policy in chains.items():
+                pkts, bytes = state.chain_counters.get((table, chain), (0, 0)) if counters else (0, 0)
+                lines.append(f":{chain} {policy} [{pkts}:{bytes}]")
+            for chain, rules in structured_data.get(table, {}).items():
+                for rule in rules:
+                    lines.append(str(rule))
+                    line_rules[len(lines)] = rule
+            lines.append("COMMIT")
+        return "\n".join(lines) + "\n", line_rules
+
+    @staticmethod
+    def build_noflush_payload(state, ops):
+        by_table = defaultdict(list)
+        for op in ops: by_table[op.table].append(op)
+        lines, line_ops = [], {}
+        for table, table_ops in by_table.items():
+            lines.append(f"*{table}")
+            known = set(state.chains.get(table, {})) | set(BUILTIN_CHAINS.get(table, []))
+            for op in table_ops:
+                if op.action != ":": continue
+                # Under --noflush this sets a built-in chain's policy; the counters are kept as read.
+                pkts, bytes = state.chain_counters.get((table, op.chain), (0, 0))
+                lines.append(f":{op.chain} {op.policy} [{pkts}:{bytes}]")
+                line_ops[len(lines)] = op
+                known.add(op.chain)
+            for chain in dict.fromkeys(op.chain for op in table_ops if op.action not in ("-D", ":")):
+                if chain not in known: lines.append(f":{chain} - [0:0]")
+            for op in table_ops:
+                if op.action == ":": continue
+                lines.append(str(op))
+                line_ops[len(lines)] = op
+            lines.append("COMMIT")
+        return "\n".join(lines) + "\n", line_ops
+
+    def _explain_restore_error(self, stderr, line_items):
+        match = re.search(r"line:?\s*(\d+)", stderr or "")
+        item = line_items.get(int(match.group(1))) if match else None
+        if item is None: return stderr or "iptables-restore failed"
+        return f"{stderr.strip()}\nRegola [{item.table}] {item}"
+
+    def _restore(self, family, payload, line_items, flags=(), test_first=True):
+        cmd = RESTORE_COMMANDS[family]
+        steps = [[cmd, *flags, "--test"], [cmd, *flags]] if test_first else [[cmd, *flags]]
+        for argv in steps:
+            try:
+                self.transport.run(argv, input=payload, text=True, capture_output=True, check=True)
+            except subprocess.CalledProcessError as e:
+                return False, self._explain_restore_error(e.stderr, line_items)
+            except OSError as e:
+                return False, str(e)
+        return True, ""
+
+    def apply_rules(self, family, state, structured_data, test_first=True):
+        payload, line_rules = self.build_restore_payload(state, structured_data)
+        return self._restore(family, payload, line_rules, test_first=test_first)
+
+    def apply_plan(self, family, state, ops, test_first=True):
+        payload, line_ops = self.build_noflush_payload(state, ops)
+        return self._restore(family, payload, line_ops, ("--noflush",), test_first)
+
+    def apply_sets(self, family, state, ipsets):
+        # Never flushed: set names are content-hashed (rule_optimizer.set_name), so an existing set already
+        # holds these members and may be matched by rules applied earlier.
+        lines = []
+        for name, (set_family, members) in ipsets.items():
+            lines.append(f"create {name} hash:net family {set_family} -exist")
+            lines.extend(f"add {name} {member} -exist" for member in members)
+        try:
+            self.transport.run(["ipset", "restore"], input="\n".join(lines) + "\n", text=True, capture_output=True, check=True)
+            return True, ""
+        except subprocess.CalledProcessError as e:
+            return False, e.stderr
+        except OSError as e:
+            return False, str(e)
+
+    def render(self, family, state, rules):
+        data = defaultdict(lambda: defaultdict(list))
+        for rule in rules: data[rule.table][rule.chain].append(rule)
+        return self.build_restore_payload(state, data, counters=False)[0]
+
+    def restore_argv(self, family, path):
+        return [RESTORE_COMMANDS[family], path]
+
+    def persistent_files(self, states):
+        # Rendered from the last state read back from the kernel, never from unapplied edits.
+        files = {}
+        for family, state in states.items():
+            if state.fingerprint is None: continue
+            files[RULES_FILES[family]] = self.render(family, state, state.applied)
+        return files
+
+    def service_content(self, filenames):
+        return service_content(filenames)
+
+def make_backend(name=None, nft=None, transport=None):
+    name = name or os.environ.get("FORGE_BACKEND", "iptables")
+    if name not in BACKENDS: raise ValueError(f"backend sconosciuto: {name}")
+    if name == "iptables": return IptablesBackend(transport)
+    from nft_backend import NftablesBackend
+    return NftablesBackend(nft or os.environ.get("FORGE_NFT", "nft"), transport)
 
 class IptablesManager:
-    def __init__(self):
+    def __init__(self, backend=None):
         self.is_ipv6_mode = False
+        self.backend = backend or IptablesBackend()
+        self.states = {family: FamilyState(family) for family in FAMILIES}
+        self.persistence = PersistenceWriter(transport=self.backend.transport)
+
+    @property
+    def family(self):
+        return "ipv6" if self.is_ipv6_mode else "ipv4"
+
+    @property
+    def state(self):
+        return self.states[self.family]
 
-    def load_rules(self):
-        cmd = "ip6tables-save" if self.is_ipv6_mode else "iptables-save"
+    @property
+    def chains(self):
+        return self.state.chains
+
+    @property
+    def chain_counters(self):
+        return self.state.chain_counters
+
+    @traced("manager.load_rules")
+    def load_rules(self, counters=False, family=None):
         try:
-            result = subprocess.run([cmd], capture_output=True, text=True, check=True)
-            return self._parse_output(result.stdout)
+            rules = self.kernel_rules(family, counters)
         except Exception:
             return {}
+        data = defaultdict(lambda: defaultdict(list))
+        for rule in rules: data[rule.table][rule.chain].append(rule)
+        return data
 
-    def _parse_output(self, output):
+    def iter_rules(self, lines, family=None):
+        parser = SaveParser()
+        yield from parser.parse(lines)
+        state = self.states[family or self.family]
+        state.chains, state.chain_counters = parser.chains, parser.chain_counters
+
+    def _collect(self, lines, family=None):
         data = defaultdict(lambda: defaultdict(list))
-        current_table = "filter"
-        for line in output.splitlines():
-            if line.startswith("*"): current_table = line[1:].strip()
-            elif line.startswith("-A"):
-                parts = line.split()
-                params = {"chain": parts[1], "table": current_table, "target": "ACCEPT"}
-                i = 2
-                while i < len(parts):
-                    arg = parts[i]
-                    if i + 1 < len(parts):
-                        val = parts[i+1]
-                        if arg == "-p": params["protocol"] = val; i += 2
-                        elif arg == "-s": params["source"] = val; i += 2
-                        elif arg == "-d": params["destination"] = val; i += 2
-                        elif arg == "-j": params["target"] = val; i += 2
-                        elif arg == "--sport": params["sport"] = val; i += 2
-                        elif arg == "--dport": params["dport"] = val; i += 2
-                        elif arg == "--state": params["state"] = val; i += 2
-                        elif arg == "--comment": params["comment"] = val.strip('"'); i += 2
-                        else: i += 1
-                    else: i += 1
-                data[current_table][params["chain"]].append(Rule(**params))
+        for rule in self.iter_rules(lines, family): data[rule.table][rule.chain].append(rule)
         return data
 
-    def apply_rules(self, structured_data):
+    def _parse_output(self, output):
+        return self._collect(output.splitlines())
+
+    def _parse_into(self, family, raw):
+        rules, chains, chain_counters = self.backend.parse(raw, family)
+        state = self.states[family]
+        state.chains, state.chain_counters = chains, chain_counters
+        return rules
+
+    def _read_into(self, family, counters=False):
+        read = self.backend.read(family, counters)
+        if read is None: return None
+        rules, chains, chain_counters, digest = read
+        state = self.states[family]
+        state.chains, state.chain_counters = chains, chain_counters
+        return rules, digest
+
+    def _loaded(self, family, rules, digest):
+        state = self.states[family]
+        state.set_rules(rules, dirty=False)
+        state.applied = rules
+        state.fingerprint = digest
+        state.kernel_changed = False
+
+    def _update_state(self, family, raw, force=False):
+        state = self.states[family]
+        state.checked_at = time.monotonic()
+        if raw is None: return False
+        digest = self.backend.fingerprint(raw)
+        if digest == state.fingerprint and not force: return False
+        if state.dirty and not force:
+            # Unsaved edits win over a kernel that moved on; the caller decides whether to discard them.
+            state.kernel_changed = True
+            return False
+        self._loaded(family, self._parse_into(family, raw), digest)
+        return True
+
+    @traced("manager.kernel_rules")
+    def kernel_rules(self, family=None, counters=False):
+        family = family or self.family
+        read = self._read_into(family, counters)
+        if read is None: raise OSError(f"{self.backend.name}: lettura regole {family} non riuscita")
+        return read[0]
+
+    @traced("manager.refresh")
+    def refresh(self, family=None, force=False):
+        family = family or self.family
+        state = self.states[family]
+        # A periodic check buffers the dump so that an unchanged fingerprint skips the parse; a first load or a
+        # forced reload parses anyway, so it streams from the pipe instead.
+        if not force and (state.fingerprint is not None or state.dirty):
+            return self._update_state(family, self.backend.dump(family), force)
+        state.checked_at = time.monotonic()
+        read = self._read_into(family)
+        if read is None: return False
+        self._loaded(family, *read)
+        return True
+
+    @traced("manager.refresh_all")
+    def refresh_all(self, force=False):
+        # Both families are read concurrently: the two save processes and pipes overlap, parsing is bound by the GIL.
+        # Imported here: concurrent.futures pulls in logging, which the CLI cold start does not need.
+        from concurrent.futures import ThreadPoolExecutor
+        with ThreadPoolExecutor(max_workers=len(FAMILIES)) as pool:
+            return dict(zip(FAMILIES, pool.map(lambda family: self.refresh(family, force), FAMILIES)))
+
+    def build_restore_payload(self, structured_data, family=None, counters=True):
+        return IptablesBackend.build_restore_payload(self.states[family or self.family], structured_data, counters)
+
+    @traced("manager.apply_rules")
+    def apply_rules(self, structured_data, batch=True, test_first=True):
+        if not batch: return self._apply_rules_one_by_one(structured_data)
+        return self.backend.apply_rules(self.family, self.state, structured_data, test_first)
+
+    @traced("manager.plan_changes")
+    def plan_changes(self, rules, chains=None):
+        # A failed read must not look like an empty kernel: that would plan to re-insert every rule.
+        kernel = self.kernel_rules()
+        if chains is None: return diff_rules(kernel, rules)
+        # With the {table: {chain: policy}} a save file declares, plan what iptables-restore --noflush would do:
+        # tables the file leaves out are not touched, new chains are created and built-in policies are set.
+        ops = []
+        for table, declared in chains.items():
+            known = {chain: "ACCEPT" for chain in BUILTIN_CHAINS.get(table, [])}
+            known.update(self.chains.get(table, {}))
+            for chain, policy in declared.items():
+                # Declaring an existing user chain under --noflush would flush it.
+                if chain not in known or policy not in ("-", known[chain]): ops.append(ChainOp(":", table, chain, None, policy=policy))
+        return ops + diff_rules([rule for rule in kernel if rule.table in chains], rules)
+
+    @traced("manager.apply_plan")
+    def apply_plan(self, ops, test_first=True, family=None):
+        if not ops: return True, ""
+        family = family or self.family
+        return self.backend.apply_plan(family, self.states[family], ops, test_first)
+
+    @traced("manager.mark_applied")
+    def mark_applied(self, family):
+        # Reads the kernel back after a change made behind the editor's back (live mode) without replacing
+        # the editor's store: only the applied baseline, the fingerprint and backend bookkeeping move on.
+        read = self._read_into(family)
+        if read is None: return False
+        state = self.states[family]
+        state.applied, state.fingerprint = read
+        state.checked_at = time.monotonic()
+        state.kernel_changed = False
+        return True
+
+    @traced("manager.apply_ipsets")
+    def apply_ipsets(self, ipsets):
+        if not ipsets: return True, ""
+        return self.backend.apply_sets(self.family, self.state, ipsets)
+
+    def _apply_rules_one_by_one(self, structured_data):
         ipt_cmd = "ip6tables" if self.is_ipv6_mode else "iptables"
         commands = []
         for table in structured_data:
@@ -80,53 +375,26 @@ class IptablesManager:
                 for rule in structured_data[table][chain]:
                     commands.append(f"{ipt_cmd} -t {table} {str(rule)}")
         try:
-            for c in commands: subprocess.run(c, shell=True, check=True, capture_output=True)
+            for c in commands: self.backend.transport.run(["sh", "-c", c], check=True, capture_output=True)
             return True, ""
         except subprocess.CalledProcessError as e:
             return False, e.stderr.decode()
 
+    @traced("manager.save_to_system")
     def save_to_system(self):
         try:
-            os.makedirs("/etc/iptables", exist_ok=True)
-            with open("/etc/iptables/rules.v4", "w") as f:
-                subprocess.run(["iptables-save"], stdout=f, check=True)
-            with open("/etc/iptables/rules.v6", "w") as f:
-                subprocess.run(["ip6tables-save"], stdout=f, check=True)
-            return self._setup_systemd_service()
+            files = self.backend.persistent_files(self.states)
+            # The unit restores only files that will be on disk: the ones written now, plus any an earlier save
+            # left for a family that was not read this time.
+            present = [name for name in self.backend.rules_files if name in files or self.persistence.exists(name)]
+            if not present: return False, "Nessuna regola letta dal kernel da salvare"
+            return True, self.persistence.save(files, self.backend.service_content(present))
         except Exception as e:
             return False, str(e)
 
-    def _setup_systemd_service(self):
-        service_content = """[Unit]
-Description=Restore IPTables Rules (Forge GUI)
-After=network-online.target
-Wants=network-online.target
-
-[Service]
-Type=oneshot
-ExecStart=/sbin/iptables-restore /etc/iptables/rules.v4
-ExecStart=/sbin/ip6tables-restore /etc/iptables/rules.v6
-RemainAfterExit=yes
-
-[Install]
-WantedBy=multi-user.target
-"""
-        service_path = "/etc/systemd/system/iptables-forge.service"
-        try:
-            with open(service_path, "w") as f:
-                f.write(service_content)
-            subprocess.run(["systemctl", "daemon-reload"], check=True)
-            subprocess.run(["systemctl", "enable", "iptables-forge.service"], check=True)
-            return True, ""
-        except Exception as e:
-            return False, f"Systemd Error: {str(e)}"
-
+    @traced("manager.disable_persistence")
     def disable_persistence(self):
         try:
-            subprocess.run(["systemctl", "disable", "iptables-forge.service"], capture_output=True)
-            path = "/etc/systemd/system/iptables-forge.service"
-            if os.path.exists(path): os.remove(path)
-            subprocess.run(["systemctl", "daemon-reload"], check=True)
-            return True, ""
+            return True, self.persistence.disable()
         except Exception:
             return False, "Failed to disable service"
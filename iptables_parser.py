@@ -0,0 +1,122 @@
+import gc
+import re
+from collections import defaultdict
+from itertools import islice
+
+from rule import Rule
+
+FIELD_OPTIONS = {
+    "-p": "protocol", "--protocol": "protocol",
+    "-s": "source", "--source": "source",
+    "-d": "destination", "--destination": "destination",
+    "-i": "in_iface", "--in-interface": "in_iface",
+    "-o": "out_iface", "--out-interface": "out_iface",
+    "--sport": "sport", "--source-port": "sport", "--sports": "sport", "--source-ports": "sport",
+    "--dport": "dport", "--destination-port": "dport", "--dports": "dport", "--destination-ports": "dport",
+    "--state": "state",
+    "--comment": "comment",
+}
+# Modules whose options map onto Rule fields; Rule.spec() re-emits them when rendering.
+IMPLIED_MODULES = {"tcp", "udp", "multiport", "state", "comment"}
+
+PARSE_CHUNK = 2048
+_TOKEN = re.compile(r'"((?:[^"\\]|\\.)*)"|(\S+)')
+_UNESCAPE = re.compile(r"\\(.)")
+# The shape iptables-save prints for the common rule: parsed by one regex instead of the token loop.
+_FAST_RULE = re.compile(
+    r"-A (\S+)(?: -s (\S+))?(?: -d (\S+))?(?: -i (\S+))?(?: -o (\S+))?(?: -p (\S+))?"
+    r"(?: -m (?:tcp|udp|multiport))?(?: --sports? (\S+))?(?: --dports? (\S+))?(?: -m state --state (\S+))?"
+    r'(?: -m comment --comment (?:"([^"\\]*)"|([^\s"]+)))?(?: -j (\S+))?$')
+
+def tokenize(line):
+    if '"' not in line: return line.split()
+    if "\\" not in line:
+        tokens = []
+        for i, segment in enumerate(line.split('"')):
+            if i % 2: tokens.append(segment)
+            else: tokens.extend(segment.split())
+        return tokens
+    return [_UNESCAPE.sub(r"\1", m.group(1)) if m.group(1) is not None else m.group(2)
+            for m in _TOKEN.finditer(line)]
+
+def parse_rule_tokens(tokens, table, pkts=0, bytes=0):
+    fields = {}
+    extra, target_extra = [], []
+    target, module, negate = "", None, False
+    i, n = 2, len(tokens)
+    while i < n:
+        tok = tokens[i]
+        if tok == "!":
+            negate = True; i += 1
+            continue
+        if tok == "-m" and i + 1 < n:
+            if tokens[i + 1] in IMPLIED_MODULES: module = tokens[i + 1]
+            else: extra.extend(("-m", tokens[i + 1])); module = None
+            i += 2
+            continue
+        if tok == "-j" and i + 1 < n:
+            target = tokens[i + 1]
+            target_extra = tokens[i + 2:]
+            break
+        field = FIELD_OPTIONS.get(tok)
+        if field is not None and i + 1 < n and field not in fields:
+            fields[field] = "! " + tokens[i + 1] if negate else tokens[i + 1]
+            negate = False; i += 2
+            continue
+        if module is not None:
+            extra.extend(("-m", module)); module = None
+        if negate:
+            extra.append("!"); negate = False
+        extra.append(tok); i += 1
+        while i < n and tokens[i][:1] not in ("-", "!"):
+            extra.append(tokens[i]); i += 1
+    return Rule(tokens[1], table=table, target=target, extra=extra, target_extra=target_extra,
+                pkts=pkts, bytes=bytes, **fields)
+
+def parse_rule_line(line, table, pkts=0, bytes=0):
+    m = _FAST_RULE.match(line)
+    if m is None: return parse_rule_tokens(tokenize(line), table, pkts, bytes)
+    chain, src, dst, iif, oif, proto, sport, dport, state, comment, bare_comment, target = m.groups()
+    return Rule(chain, proto or "all", src or "any", dst or "any", target or "", sport, dport, state,
+                comment if comment is not None else bare_comment or "", table, iif, oif, (), (), pkts, bytes)
+
+class SaveParser:
+    def __init__(self):
+        self.chains = defaultdict(dict)
+        self.chain_counters = {}
+
+    def parse(self, lines):
+        # Rules are never cyclic, so the collector is paused while a chunk of rules is parsed instead of rescanning
+        # the young ones over and over. It is switched back on before every chunk is yielded: an abandoned
+        # generator, or another thread, never finds it off for longer than one chunk.
+        rules = self._parse(lines)
+        while True:
+            enabled = gc.isenabled()
+            gc.disable()
+            try: chunk = list(islice(rules, PARSE_CHUNK))
+            finally:
+                if enabled: gc.enable()
+            yield from chunk
+            if len(chunk) < PARSE_CHUNK: return
+
+    def _parse(self, lines):
+        table = "filter"
+        chains = self.chains
+        for line in lines:
+            first = line[:1]
+            if first == "-" or first == "[":
+                pkts = bytes = 0
+                if first == "[":
+                    counters, _, line = line.partition("] ")
+                    pkts, _, bytes = counters[1:].partition(":")
+                    pkts, bytes = int(pkts), int(bytes)
+                line = line.rstrip("\n")
+                if line.startswith("-A "): yield parse_rule_line(line, table, pkts, bytes)
+            elif first == "*": table = line[1:].strip()
+            elif first == ":":
+                parts = line[1:].split()
+                if len(parts) < 2: continue
+                chains[table][parts[0]] = parts[1]
+                if len(parts) > 2 and parts[2].startswith("["):
+                    pkts, _, bytes = parts[2].strip("[]").partition(":")
+                    self.chain_counters[(table, parts[0])] = (int(pkts), int(bytes))
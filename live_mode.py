@@ -0,0 +1,190 @@
+import os
+import signal
+import subprocess
+import tempfile
+
+from PyQt6.QtCore import QCoreApplication, QObject, QThreadPool, QTimer
+
+from rule_diff import diff_rules
+from workers import Worker
+
+DEBOUNCE_MS = 400
+CONFIRM_SECONDS = 30
+# The detached watchdog fires a little after the in-app countdown, so it only acts if the GUI is gone.
+WATCHDOG_GRACE = 10
+
+class Watchdog:
+    # A process outside the GUI that restores the last confirmed ruleset after a delay: it still runs if the
+    # GUI, the X forwarding or the SSH session dies, which is what keeps a remote admin from being locked out.
+    def __init__(self, argv, path, delay):
+        self.path = path
+        self.proc = subprocess.Popen(["sh", "-c", f'sleep {delay} && exec "$0" "$@"', *argv], start_new_session=True,
+                                     stdin=subprocess.DEVNULL, stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL)
+
+    def cancel(self):
+        try: os.killpg(self.proc.pid, signal.SIGTERM)
+        except ProcessLookupError: pass
+        self.proc.wait()
+
+    def discard(self):
+        self.cancel()
+        try: os.remove(self.path)
+        except OSError: pass
+
+class LiveApplier(QObject):
+    def __init__(self, window, debounce_ms=DEBOUNCE_MS, confirm_seconds=CONFIRM_SECONDS):
+        super().__init__(window)
+        self.window = window
+        self.manager = window.manager
+        self.confirm_seconds = confirm_seconds
+        self.enabled = False
+        self.worker = None
+        self.generation = 0
+        # Last ruleset the user confirmed, per family, with the watchdog guarding it while changes are unconfirmed.
+        self.last_good = None
+        self.watchdog = None
+        self.first_batch = False
+        self.remaining = 0
+        self.debounce = QTimer(self)
+        self.debounce.setSingleShot(True)
+        self.debounce.setInterval(debounce_ms)
+        self.debounce.timeout.connect(self.flush)
+        self.countdown = QTimer(self)
+        self.countdown.setInterval(1000)
+        self.countdown.timeout.connect(self.tick)
+
+    @property
+    def pending_confirmation(self):
+        return self.last_good is not None
+
+    def set_enabled(self, enabled):
+        self.enabled = enabled
+        if enabled: self.schedule()
+        else: self.debounce.stop()
+
+    def schedule(self, *_):
+        self.generation += 1
+        if self.enabled: self.debounce.start()
+
+    def flush(self):
+        if self.worker is not None or self.window.worker is not None:
+            self.debounce.start()
+            return
+        family = self.manager.family
+        if self.last_good is not None and self.last_good[0] != family:
+            self.window.status_label.setText(f"Live: conferma prima le modifiche {self.last_good[0].upper()}.")
+            return
+        state = self.manager.states[family]
+        rules = list(state.rules)
+        ops = diff_rules(state.applied, rules)
+        if not ops: return
+        self.first_batch = self.last_good is None
+        if self.first_batch: self._arm(family, state)
+        # Armed before the batch is sent: if it cuts the session off or the GUI hangs while it is applied,
+        # the watchdog still puts the confirmed ruleset back.
+        self._restart_watchdog()
+        self._start(Worker(self._apply_task, family, ops, self.generation), self.on_applied, self.on_failed)
+        self.window.status_label.setText(f"Live: invio di {len(ops)} operazioni...")
+
+    def _start(self, worker, on_finished, on_failed):
+        self.worker = worker
+        worker.signals.finished.connect(on_finished)
+        worker.signals.failed.connect(on_failed)
+        QThreadPool.globalInstance().start(worker)
+
+    def _arm(self, family, state):
+        # The baseline is what the kernel holds now: everything sent from here on is unconfirmed.
+        fd, path = tempfile.mkstemp(prefix=f"forge-live-{family}-")
+        with os.fdopen(fd, "w") as f: f.write(self.manager.backend.render(family, state, state.applied))
+        self.last_good = (family, list(state.applied), path)
+
+    def _restart_watchdog(self):
+        # The new watchdog is running before the old one is stopped, so the kernel is never left unguarded.
+        family, _, path = self.last_good
+        previous = self.watchdog
+        self.watchdog = Watchdog(self.manager.backend.restore_argv(family, path), path, self.confirm_seconds + WATCHDOG_GRACE)
+        if previous is not None: previous.cancel()
+        self.remaining = self.confirm_seconds
+        self.countdown.start()
+        self.window.update_live_controls()
+
+    def _disarm(self):
+        self.countdown.stop()
+        if self.watchdog is not None: self.watchdog.discard()
+        self.watchdog, self.last_good = None, None
+        self.window.update_live_controls()
+
+    def _apply_task(self, worker, family, ops, generation):
+        ok, err = self.manager.apply_plan(ops, family=family)
+        if ok: self.manager.mark_applied(family)
+        return ok, err, family, len(ops), generation
+
+    def on_applied(self, result):
+        self.worker = None
+        ok, err, family, count, generation = result
+        if not ok:
+            self.on_failed(err)
+            return
+        state = self.manager.states[family]
+        if generation == self.generation: state.dirty = False
+        self.window.status_label.setText(f"Live: {count} operazioni applicate, da confermare entro {self.remaining}s.")
+        self.window.update_state_label()
+        if generation != self.generation: self.schedule()
+
+    def on_failed(self, err):
+        self.worker = None
+        # A batch is all or nothing: if it was the first one, nothing of this session reached the kernel.
+        if self.first_batch: self._disarm()
+        self.window.live_failed(err)
+
+    def tick(self):
+        self.remaining -= 1
+        self.window.update_live_controls()
+        if self.remaining <= 0 and self.worker is None: self.revert()
+
+    def confirm(self):
+        if self.watchdog is None or self.worker is not None: return
+        self._disarm()
+        self.window.status_label.setText("Live: modifiche confermate.")
+
+    def revert(self):
+        if self.watchdog is None or self.worker is not None: return
+        self.countdown.stop()
+        self.debounce.stop()
+        self._start(Worker(self._revert_task), self.on_reverted, self.on_revert_failed)
+        self.window.status_label.setText("Live: ripristino in corso...")
+
+    def _revert_task(self, worker):
+        family, rules, _ = self.last_good
+        ops = diff_rules(self.manager.states[family].applied, rules)
+        ok, err = self.manager.apply_plan(ops, family=family)
+        if ok: self.manager.mark_applied(family)
+        return ok, err, len(ops)
+
+    def on_reverted(self, result):
+        self.worker = None
+        ok, err, count = result
+        if not ok:
+            self.on_revert_failed(err)
+            return
+        family, rules, _ = self.last_good
+        self._disarm()
+        self.window.live_reverted(family, rules, count)
+
+    def on_revert_failed(self, err):
+        self.worker = None
+        # Leave the watchdog armed: it restores the full ruleset from file even when a diff batch cannot.
+        self.window.live_failed(f"Ripristino non riuscito, interverrà il watchdog: {err}")
+
+    def shutdown(self):
+        # Closing the window is not a confirmation: unconfirmed changes are rolled back right away. A batch
+        # still in flight is waited for first, so the rollback covers it too; the rollback itself runs here,
+        # blocking, since the window is going away.
+        self.enabled = False
+        self.debounce.stop()
+        if self.worker is not None:
+            QThreadPool.globalInstance().waitForDone()
+            QCoreApplication.processEvents()
+        if self.watchdog is None or self.worker is not None: return
+        self.countdown.stop()
+        self.on_reverted(self._revert_task(None))
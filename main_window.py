@@ -0,0 +1,549 @@
+import time
+from PyQt6.QtCore import Qt, QThreadPool, QTimer
+from PyQt6.QtWidgets import *
+from PyQt6.QtGui import QFont, QKeySequence, QShortcut
+
+from iptables_manager import IptablesManager, Rule, make_backend
+from draggable_table import DraggableTableView
+from rule_model import RuleTableModel, ALL_CHAINS
+from rule_index import RuleIndex
+from rule_dialog import RuleDialog
+from workers import Worker
+import profiling
+from monitor_dialog import MonitorDialog
+from counter_monitor import CounterMonitor
+from rule_optimizer import optimize
+from optimize_dialog import OptimizeDialog
+from packet_dialog import PacketDialog
+from snapshot_dialog import SnapshotDialog
+from fleet_dialog import FleetDialog
+from history import History, HISTORY_DIR
+from live_mode import LiveApplier
+
+REFRESH_INTERVAL = 5.0
+
+class MainWindow(QMainWindow):
+    def __init__(self):
+        super().__init__()
+        self.setWindowTitle("IPTables Forge - Firewall Manager")
+        self.resize(1200, 800)
+        
+        QApplication.setFont(QFont("Segoe UI", 10))
+
+        self.manager = IptablesManager(make_backend())
+        self.all_rules = self.manager.state.rules
+        self.model = RuleTableModel(self.all_rules)
+        self.is_dark_mode = True
+        self.worker = None
+        self.rule_indexes = {}
+        self.monitor_dialog = None
+        self.pending_ipsets = {}
+        self.histories = {}
+        self.history_dir = HISTORY_DIR
+
+        self.live = LiveApplier(self)
+
+        self.setup_ui()
+        self.apply_theme()
+        self.load_initial_rules()
+
+    def setup_ui(self):
+        central = QWidget()
+        layout = QVBoxLayout(central)
+        layout.setContentsMargins(15, 15, 15, 15)
+        layout.setSpacing(10)
+        
+        top = QHBoxLayout()
+        self.add_btn = QPushButton("+ AGGIUNGI")
+        self.add_btn.setMinimumHeight(38)
+        self.add_btn.clicked.connect(self.add_rule)
+        
+        self.edit_btn = QPushButton("✎ MODIFICA")
+        self.edit_btn.setMinimumHeight(38)
+        self.edit_btn.clicked.connect(self.edit_rule)
+
+        self.remove_btn = QPushButton("RIMUOVI")
+        self.remove_btn.setMinimumHeight(38)
+        self.remove_btn.clicked.connect(self.remove_rule)
+        
+        self.packet_btn = QPushButton("TEST PACCHETTO")
+        self.packet_btn.setMinimumHeight(38)
+        self.packet_btn.clicked.connect(self.test_packet)
+
+        top.addWidget(self.add_btn)
+        top.addWidget(self.edit_btn)
+        top.addWidget(self.remove_btn)
+        top.addWidget(self.packet_btn)
+
+        self.monitor_btn = QPushButton("MONITOR")
+        self.monitor_btn.setMinimumHeight(38)
+        self.monitor_btn.clicked.connect(self.open_monitor)
+        top.addWidget(self.monitor_btn)
+
+        self.optimize_btn = QPushButton("OTTIMIZZA")
+        self.optimize_btn.setMinimumHeight(38)
+        self.optimize_btn.clicked.connect(self.optimize_rules)
+        top.addWidget(self.optimize_btn)
+
+        self.fleet_btn = QPushButton("FLOTTA")
+        self.fleet_btn.setMinimumHeight(38)
+        self.fleet_btn.setToolTip("Confronta e applica le regole dell'editor su più host via SSH")
+        self.fleet_btn.clicked.connect(self.open_fleet)
+        top.addWidget(self.fleet_btn)
+
+        self.undo_btn = QPushButton("↶")
+        self.undo_btn.setMinimumHeight(38)
+        self.undo_btn.clicked.connect(self.undo)
+        self.redo_btn = QPushButton("↷")
+        self.redo_btn.setMinimumHeight(38)
+        self.redo_btn.clicked.connect(self.redo)
+        QShortcut(QKeySequence.StandardKey.Undo, self, self.undo)
+        QShortcut(QKeySequence.StandardKey.Redo, self, self.redo)
+        self.snapshot_btn = QPushButton("SNAPSHOT")
+        self.snapshot_btn.setMinimumHeight(38)
+        self.snapshot_btn.clicked.connect(self.open_snapshots)
+        top.addWidget(self.undo_btn)
+        top.addWidget(self.redo_btn)
+        top.addWidget(self.snapshot_btn)
+        top.addSpacing(30)
+        
+        top.addWidget(QLabel("CHAIN:"))
+        self.chain_filter = QComboBox()
+        self.chain_filter.setMinimumWidth(180)
+        self.chain_filter.setMinimumHeight(38)
+        self.chain_filter.addItem(ALL_CHAINS)
+        self.chain_filter.currentTextChanged.connect(self.populate_table)
+        top.addWidget(self.chain_filter)
+        
+        top.addStretch()
+        
+        self.persistence_check = QCheckBox("PERSISTENZA")
+        self.persistence_check.setChecked(True)
+        top.addWidget(self.persistence_check)
+
+        self.live_check = QCheckBox("LIVE")
+        self.live_check.setToolTip("Applica subito ogni modifica al kernel; senza conferma viene annullata automaticamente")
+        self.live_check.toggled.connect(self.live.set_enabled)
+        top.addWidget(self.live_check)
+
+        self.ipv6_check = QCheckBox("IPv6")
+        self.ipv6_check.stateChanged.connect(self.toggle_ipv6)
+        top.addWidget(self.ipv6_check)
+        
+        self.theme_btn = QPushButton("MODALITÀ CHIARA")
+        self.theme_btn.setMinimumHeight(38)
+        self.theme_btn.clicked.connect(self.toggle_theme)
+        top.addWidget(self.theme_btn)
+        
+        self.preview_btn = QPushButton("ANTEPRIMA")
+        self.preview_btn.setMinimumHeight(38)
+        self.preview_btn.clicked.connect(self.preview_changes)
+        top.addWidget(self.preview_btn)
+
+        self.apply_btn = QPushButton("APPLICA E SALVA")
+        self.apply_btn.setObjectName("applyButton")
+        self.apply_btn.setMinimumHeight(38)
+        self.apply_btn.setMinimumWidth(180)
+        self.apply_btn.clicked.connect(self.apply_changes)
+        top.addWidget(self.apply_btn)
+        
+        layout.addLayout(top)
+
+        self.search_input = QLineEdit()
+        self.search_input.setMinimumHeight(34)
+        self.search_input.setPlaceholderText("CERCA: 10.2.3.4:443/tcp  src:10.0.0.0/8  dport:22  proto:udp  customer-x")
+        self.search_input.setClearButtonEnabled(True)
+        self.search_timer = QTimer(self)
+        self.search_timer.setSingleShot(True)
+        self.search_timer.setInterval(150)
+        self.search_timer.timeout.connect(self.populate_table)
+        self.search_input.textChanged.connect(self.search_timer.start)
+        layout.addWidget(self.search_input)
+        
+        self.rules_table = DraggableTableView()
+        self.rules_table.setModel(self.model)
+        self.rules_table.verticalHeader().setDefaultSectionSize(28)
+        self.rules_table.horizontalHeader().setSectionResizeMode(QHeaderView.ResizeMode.Stretch)
+        self.rules_table.setAlternatingRowColors(True)
+        self.rules_table.setShowGrid(False)
+        self.rules_table.doubleClicked.connect(self.edit_rule)
+        layout.addWidget(self.rules_table)
+        
+        self.setCentralWidget(central)
+
+        self.status_label = QLabel()
+        self.progress_bar = QProgressBar()
+        self.progress_bar.setMaximumWidth(260)
+        self.cancel_btn = QPushButton("ANNULLA")
+        self.cancel_btn.clicked.connect(self.cancel_task)
+        self.state_label = QLabel()
+        self.confirm_btn = QPushButton()
+        self.confirm_btn.setObjectName("applyButton")
+        self.confirm_btn.clicked.connect(self.live.confirm)
+        self.revert_btn = QPushButton("RIPRISTINA ORA")
+        self.revert_btn.clicked.connect(self.live.revert)
+        self.statusBar().addWidget(self.status_label, 1)
+        self.statusBar().addPermanentWidget(self.state_label)
+        self.statusBar().addPermanentWidget(self.confirm_btn)
+        self.statusBar().addPermanentWidget(self.revert_btn)
+        self.confirm_btn.hide()
+        self.revert_btn.hide()
+        self.statusBar().addPermanentWidget(self.progress_bar)
+        self.statusBar().addPermanentWidget(self.cancel_btn)
+        self.progress_bar.hide()
+        self.cancel_btn.hide()
+        self.profile_label = None
+        if profiling.current() is not None:
+            # Only with --profile: totals since start, the full breakdown in the tooltip.
+            self.profile_label = QLabel()
+            self.statusBar().addPermanentWidget(self.profile_label)
+            self.profile_timer = QTimer(self)
+            self.profile_timer.setInterval(1000)
+            self.profile_timer.timeout.connect(self.update_profile_label)
+            self.profile_timer.start()
+        self.busy_widgets = [self.add_btn, self.edit_btn, self.remove_btn, self.ipv6_check, self.undo_btn, self.redo_btn, self.snapshot_btn,
+                             self.optimize_btn, self.preview_btn, self.apply_btn, self.rules_table]
+        for signal in (self.model.rowsInserted, self.model.rowsRemoved, self.model.rowsMoved, self.model.dataChanged):
+            signal.connect(self.update_state_label)
+            signal.connect(self.update_history_buttons)
+            signal.connect(self.live.schedule)
+
+    def apply_theme(self):
+        if self.is_dark_mode:
+            self.theme_btn.setText("MODALITÀ CHIARA")
+            style = """
+                QMainWindow, QDialog { background-color: #1a1b1e; color: #e0e0e0; }
+                QWidget { background-color: #1a1b1e; color: #e0e0e0; }
+                QTableView { background-color: #25262b; alternate-background-color: #2c2e33; color: #e0e0e0; gridline-color: transparent; border: 1px solid #373a40; border-radius: 8px; }
+                QHeaderView::section { background-color: #1a1b1e; color: #909296; padding: 10px; border: none; font-weight: bold; }
+                QLineEdit, QComboBox { background-color: #25262b; color: #ffffff; border: 1px solid #373a40; border-radius: 4px; padding: 5px; }
+                QPushButton { background-color: #373a40; color: white; border-radius: 4px; padding: 5px 15px; border: 1px solid #4d4f56; font-weight: bold; }
+                #applyButton { background-color: #2b8a3e; border: none; }
+                QCheckBox { color: #e0e0e0; font-weight: bold; }
+                QCheckBox::indicator { width: 18px; height: 18px; background-color: #373a40; border: 2px solid #4d4f56; border-radius: 4px; }
+                QCheckBox::indicator:checked { background-color: #339af0; border: 2px solid #339af0; }
+            """
+        else:
+            self.theme_btn.setText("MODALITÀ SCURA")
+            style = """
+                QMainWindow, QDialog { background-color: #f8f9fa; color: #212529; }
+                QTableView { background-color: #ffffff; alternate-background-color: #f1f3f5; color: #212529; border: 1px solid #dee2e6; }
+                QPushButton { background-color: #f1f3f5; border: 1px solid #ced4da; color: #495057; font-weight: bold; }
+                #applyButton { background-color: #40c057; color: white; }
+                QCheckBox { color: #495057; font-weight: bold; }
+            """
+        QApplication.instance().setStyleSheet(style)
+
+    def update_chain_filter_list(self):
+        chains = {"INPUT", "FORWARD", "OUTPUT", "PREROUTING", "POSTROUTING"}
+        chains |= self.all_rules.chains()
+        self.chain_filter.blockSignals(True)
+        current = self.chain_filter.currentText()
+        self.chain_filter.clear()
+        self.chain_filter.addItem(ALL_CHAINS)
+        self.chain_filter.addItems(sorted(list(chains)))
+        if current in chains or current == ALL_CHAINS: self.chain_filter.setCurrentText(current)
+        self.chain_filter.blockSignals(False)
+        if self.chain_filter.currentText() != self.model.chain_filter: self.populate_table()
+
+    def update_profile_label(self):
+        profiler = profiling.current()
+        if profiler is None or self.profile_label is None: return
+        self.profile_label.setText(profiler.summary())
+        self.profile_label.setToolTip(f"<pre>{profiler.report()}</pre>")
+
+    def run_task(self, fn, on_done, *args):
+        if self.worker is not None: return
+        self.worker = Worker(fn, *args)
+        self.worker.signals.progress.connect(self.on_task_progress)
+        self.worker.signals.finished.connect(lambda result: self.on_task_end(on_done, result))
+        self.worker.signals.failed.connect(lambda err: self.on_task_end(self.on_task_failed, err))
+        self.worker.signals.cancelled.connect(lambda: self.on_task_end(self.on_task_cancelled, None))
+        for w in self.busy_widgets: w.setEnabled(False)
+        self.progress_bar.setValue(0)
+        self.progress_bar.show()
+        self.cancel_btn.setEnabled(True)
+        self.cancel_btn.show()
+        QThreadPool.globalInstance().start(self.worker)
+
+    def cancel_task(self):
+        if self.worker is not None:
+            self.worker.cancel()
+            self.cancel_btn.setEnabled(False)
+            self.status_label.setText("Annullamento in corso...")
+
+    def on_task_progress(self, percent, message):
+        self.progress_bar.setValue(percent)
+        self.status_label.setText(message)
+
+    def on_task_end(self, callback, result):
+        self.worker = None
+        for w in self.busy_widgets: w.setEnabled(True)
+        self.update_history_buttons()
+        self.progress_bar.hide()
+        self.cancel_btn.hide()
+        self.status_label.setText("")
+        callback(result)
+
+    def on_task_failed(self, err):
+        QMessageBox.critical(self, "Errore", err)
+
+    def on_task_cancelled(self, _):
+        self.status_label.setText("Operazione annullata.")
+
+    def load_initial_rules(self):
+        self.run_task(self._load_task, self.on_rules_loaded)
+
+    def _load_task(self, worker):
+        worker.report(10, "Lettura regole IPv4 e IPv6...")
+        with profiling.span("gui.load"): return self.manager.refresh_all()
+
+    def on_rules_loaded(self, _):
+        self.show_family()
+
+    def show_family(self, origin="kernel"):
+        with profiling.span("gui.show_family"):
+            self.all_rules = self.manager.state.rules
+            history = self.history()
+            if history.store is not self.all_rules: history.attach(self.all_rules, origin)
+            self.model.search_ids = None
+            self.model.set_rules(self.all_rules)
+            self.update_chain_filter_list()
+            if self.search_input.text().strip(): self.populate_table()
+            self.update_state_label()
+            self.update_history_buttons()
+
+    def history(self):
+        family = self.manager.family
+        if family not in self.histories: self.histories[family] = History(family, self.history_dir)
+        return self.histories[family]
+
+    def update_history_buttons(self, *_):
+        history = self.history()
+        self.undo_btn.setEnabled(self.worker is None and history.can_undo())
+        self.redo_btn.setEnabled(self.worker is None and history.can_redo())
+        self.undo_btn.setToolTip(f"Annulla: {history.undo_label()}" if history.can_undo() else "Niente da annullare")
+        self.redo_btn.setToolTip(f"Ripeti: {history.redo_label()}" if history.can_redo() else "Niente da ripetere")
+        self.snapshot_btn.setToolTip(f"Cronologia solo in memoria: {history.error}" if history.error else "")
+
+    def undo(self):
+        self._navigate(self.history().undo)
+
+    def redo(self):
+        self._navigate(self.history().redo)
+
+    def _navigate(self, move):
+        if self.worker is not None: return
+        try: rules = move()
+        except ValueError as e:
+            QMessageBox.critical(self, "Cronologia", str(e))
+            return
+        if rules is not None: self._load_history_rules(rules)
+        else:
+            # The step was replayed on the store itself: only the view needs to catch up.
+            self.update_chain_filter_list()
+            self.populate_table()
+            self.update_state_label()
+        self.update_history_buttons()
+        self.live.schedule()
+
+    def _load_history_rules(self, rules):
+        self.manager.state.set_rules(rules)
+        self.history().track(self.manager.state.rules)
+        self.show_family()
+
+    def open_snapshots(self):
+        history = self.history()
+        dialog = SnapshotDialog(self, history, list(self.all_rules))
+        if not dialog.exec() or dialog.selected is None: return
+        try: self._load_history_rules(history.checkout(dialog.selected))
+        except ValueError as e:
+            QMessageBox.critical(self, "Snapshot", str(e))
+            return
+        self.apply_changes()
+
+    def update_state_label(self, *_):
+        state = self.manager.state
+        text = "modifiche non applicate" if state.dirty else ""
+        if state.kernel_changed: text += " (regole nel kernel cambiate)"
+        self.state_label.setText(f"{state.family.upper()}: {text}" if text else "")
+
+    def refresh_family(self):
+        self.run_task(self._refresh_task, self.on_family_refreshed, self.manager.family)
+
+    def _refresh_task(self, worker, family):
+        worker.report(10, "Controllo regole nel kernel...")
+        return family, self.manager.refresh(family)
+
+    def on_family_refreshed(self, result):
+        family, changed = result
+        if changed and family == self.manager.family: self.show_family()
+        else: self.update_state_label()
+
+    def search_index(self):
+        # One index per family, rebuilt only when that family's store is replaced.
+        store, index = self.rule_indexes.get(self.manager.family, (None, None))
+        if store is not self.all_rules:
+            store, index = self.all_rules, RuleIndex()
+            store.observe(index)
+            self.rule_indexes[self.manager.family] = (store, index)
+        return index
+
+    def populate_table(self):
+        query = self.search_input.text().strip()
+        search_ids = None
+        with profiling.span("gui.populate"):
+            if query:
+                try:
+                    search_ids = self.search_index().search(query)
+                    self.search_input.setToolTip("")
+                except ValueError as e:
+                    self.search_input.setToolTip(str(e))
+                    return
+            self.model.set_filters(self.chain_filter.currentText(), search_ids)
+
+    def handle_reorder(self, src_row, dst_row):
+        with profiling.span("gui.reorder"): self.model.move_row(src_row, dst_row)
+
+    def add_rule(self):
+        dialog = RuleDialog(self)
+        if dialog.exec():
+            self.model.append_rule(dialog.get_rule())
+            self.update_chain_filter_list()
+            if self.model.search_ids is not None: self.populate_table()
+
+    def edit_rule(self):
+        row = self.rules_table.current_row()
+        if row < 0: return
+        dialog = RuleDialog(self, rule=self.model.rule_at(row))
+        if dialog.exec():
+            self.model.replace_row(row, dialog.get_rule())
+            self.update_chain_filter_list()
+            if self.model.search_ids is not None: self.populate_table()
+
+    def remove_rule(self):
+        row = self.rules_table.current_row()
+        if row >= 0:
+            self.model.remove_row(row)
+            self.update_chain_filter_list()
+
+    def test_packet(self):
+        PacketDialog(self, list(self.all_rules), self.manager.chains).exec()
+
+    def preview_changes(self):
+        self.run_task(self._plan_task, self.on_preview_ready, list(self.all_rules))
+
+    def _plan_task(self, worker, rules):
+        worker.report(20, "Calcolo differenze...")
+        return self.manager.plan_changes(rules)
+
+    def on_preview_ready(self, ops):
+        if not ops:
+            QMessageBox.information(self, "Anteprima", "Nessuna modifica da applicare.")
+            return
+        lines = [f"[{op.table}] {op}" for op in ops[:200]]
+        if len(ops) > 200: lines.append(f"... e altre {len(ops) - 200} operazioni")
+        QMessageBox.information(self, "Anteprima", f"{len(ops)} operazioni pianificate:\n\n" + "\n".join(lines))
+
+    def update_live_controls(self):
+        pending = self.live.watchdog is not None
+        self.confirm_btn.setText(f"CONFERMA ({max(self.live.remaining, 0)}s)")
+        self.confirm_btn.setVisible(pending)
+        self.revert_btn.setVisible(pending)
+
+    def live_failed(self, err):
+        self.live_check.setChecked(False)
+        self.update_live_controls()
+        QMessageBox.critical(self, "Live", f"{err}\n\nModalità live disattivata.")
+
+    def live_reverted(self, family, rules, count):
+        self.live_check.setChecked(False)
+        state = self.manager.states[family]
+        state.set_rules(state.applied, dirty=False)
+        if family == self.manager.family: self.show_family("ripristino live")
+        self.update_live_controls()
+        self.status_label.setText(f"Live: modifiche non confermate annullate ({count} operazioni). Modalità live disattivata.")
+
+    def closeEvent(self, event):
+        self.live.shutdown()
+        super().closeEvent(event)
+
+    def apply_changes(self):
+        if self.live.pending_confirmation:
+            QMessageBox.warning(self, "Live", "Conferma o ripristina prima le modifiche live.")
+            return
+        self.run_task(self._apply_task, self.on_changes_applied, list(self.all_rules), self.persistence_check.isChecked(),
+                      dict(self.pending_ipsets))
+
+    def _apply_task(self, worker, rules, persist, ipsets):
+        with profiling.span("gui.apply"): return self._apply(worker, rules, persist, ipsets)
+
+    def _apply(self, worker, rules, persist, ipsets):
+        if ipsets:
+            worker.report(5, f"Creazione di {len(ipsets)} ipset...")
+            ok, err = self.manager.apply_ipsets(ipsets)
+            if not ok: return False, f"Errore ipset: {err}"
+        worker.report(10, "Calcolo differenze...")
+        ops = self.manager.plan_changes(rules)
+        worker.report(40, f"Applicazione di {len(ops)} operazioni...")
+        ok, err = self.manager.apply_plan(ops)
+        if not ok: return False, err
+        msg = f"Configurazione kernel aggiornata ({len(ops)} operazioni)."
+        worker.report(60, "Rilettura regole...", cancellable=False)
+        # The boot files are rendered from what was read back: after a failed read they would be the previous ruleset.
+        if not self.manager.refresh(force=True): return True, msg + "\n⚠️ Persistenza non aggiornata: rilettura delle regole non riuscita."
+        if worker.is_cancelled: return True, msg + "\n⚠️ Persistenza non aggiornata (operazione annullata)."
+        worker.report(70, "Aggiornamento persistenza...", cancellable=False)
+        if persist:
+            save_ok, report = self.manager.save_to_system()
+            msg += f"\n✅ {report}" if save_ok else f"\n❌ Errore Systemd: {report}"
+        else:
+            off_ok, removed = self.manager.disable_persistence()
+            if not off_ok: msg += f"\n❌ {removed}"
+            elif removed: msg += "\n⚠️ Persistenza disabilitata e servizio rimosso."
+        return True, msg
+
+    def on_changes_applied(self, result):
+        ok, msg = result
+        # Cleared here, on the GUI thread: the sets exist in the kernel now. After a failure the next apply retries them.
+        if ok: self.pending_ipsets = {}
+        if ok: self.show_family()
+        if ok: QMessageBox.information(self, "Firewall", msg)
+        else: QMessageBox.critical(self, "Errore", msg)
+
+    def optimize_rules(self):
+        self.run_task(self._optimize_task, self.on_optimize_ready, list(self.all_rules))
+
+    def _optimize_task(self, worker, rules):
+        family = self.manager.family
+        worker.report(10, "Lettura contatori...")
+        try: hits = CounterMonitor().packet_counts(family, rules)
+        except OSError: hits = [0] * len(rules)
+        policy_hits = {key: pkts for key, (pkts, _) in self.manager.chain_counters.items()}
+        worker.report(40, "Analisi ruleset...")
+        return optimize(rules, hits, policy_hits, family)
+
+    def on_optimize_ready(self, plan):
+        if not OptimizeDialog(self, plan).exec(): return
+        self.manager.state.set_rules(plan.rules)
+        self.show_family("ottimizzazione")
+        self.pending_ipsets = plan.ipsets
+        self.apply_changes()
+
+    def open_monitor(self):
+        if self.monitor_dialog is None: self.monitor_dialog = MonitorDialog(self)
+        elif not self.monitor_dialog.timer.isActive(): self.monitor_dialog.toggle_polling()
+        self.monitor_dialog.show()
+        self.monitor_dialog.raise_()
+
+    def open_fleet(self):
+        FleetDialog(self).exec()
+
+    def toggle_theme(self):
+        self.is_dark_mode = not self.is_dark_mode
+        self.apply_theme()
+
+    def toggle_ipv6(self, state):
+        self.manager.is_ipv6_mode = (state == Qt.CheckState.Checked.value)
+        self.show_family()
+        if time.monotonic() - self.manager.state.checked_at > REFRESH_INTERVAL: self.refresh_family()
@@ -0,0 +1,159 @@
+from PyQt6.QtCore import Qt, QAbstractTableModel, QModelIndex, QThreadPool, QTimer
+from PyQt6.QtWidgets import (QDialog, QVBoxLayout, QHBoxLayout, QLabel, QSpinBox, QPushButton,
+                             QTableView, QHeaderView, QAbstractItemView)
+
+from counter_monitor import CounterMonitor, hottest
+from workers import Worker
+
+def _human(value):
+    if isinstance(value, int) and value < 1000: return str(value)
+    for unit in ("", "K", "M", "G"):
+        if value < 1000: return f"{value:.1f}{unit}"
+        value /= 1000
+    return f"{value:.1f}T"
+
+class CounterTableModel(QAbstractTableModel):
+    HEADERS = ["TABELLA", "CHAIN", "REGOLA", "PACCHETTI", "BYTE", "PKT/S", "BYTE/S"]
+
+    def __init__(self, parent=None):
+        super().__init__(parent)
+        self.rows = []
+        self.sort_column = 5
+        self.sort_order = Qt.SortOrder.DescendingOrder
+
+    def set_rows(self, rows):
+        self.beginResetModel()
+        self.rows = rows
+        self._sort()
+        self.endResetModel()
+
+    def rowCount(self, parent=QModelIndex()):
+        return 0 if parent.isValid() else len(self.rows)
+
+    def columnCount(self, parent=QModelIndex()):
+        return 0 if parent.isValid() else len(self.HEADERS)
+
+    def headerData(self, section, orientation, role=Qt.ItemDataRole.DisplayRole):
+        if role == Qt.ItemDataRole.DisplayRole and orientation == Qt.Orientation.Horizontal:
+            return self.HEADERS[section]
+        return None
+
+    def data(self, index, role=Qt.ItemDataRole.DisplayRole):
+        if not index.isValid(): return None
+        rule, stats = self.rows[index.row()]
+        col = index.column()
+        if role == Qt.ItemDataRole.DisplayRole:
+            if col == 0: return rule.table
+            if col == 1: return rule.chain
+            if col == 2: return rule.spec()
+            if stats is None: return "-"
+            return _human(stats[col - 3])
+        if role == Qt.ItemDataRole.TextAlignmentRole and col >= 3:
+            return Qt.AlignmentFlag.AlignRight | Qt.AlignmentFlag.AlignVCenter
+        return None
+
+    def _sort_key(self, row):
+        rule, stats = row
+        col = self.sort_column
+        if col == 0: return rule.table
+        if col == 1: return rule.chain
+        if col == 2: return rule.spec()
+        return -1 if stats is None else stats[col - 3]
+
+    def _sort(self):
+        self.rows.sort(key=self._sort_key, reverse=self.sort_order == Qt.SortOrder.DescendingOrder)
+
+    def sort(self, column, order=Qt.SortOrder.AscendingOrder):
+        self.sort_column, self.sort_order = column, order
+        self.layoutAboutToBeChanged.emit()
+        self._sort()
+        self.layoutChanged.emit()
+
+class MonitorDialog(QDialog):
+    def __init__(self, window):
+        super().__init__(window)
+        self.window = window
+        self.monitor = CounterMonitor()
+        self.worker = None
+        self.setWindowTitle("Monitor Contatori")
+        self.resize(1000, 600)
+
+        layout = QVBoxLayout(self)
+        controls = QHBoxLayout()
+        controls.addWidget(QLabel("INTERVALLO (s):"))
+        self.interval_spin = QSpinBox()
+        self.interval_spin.setRange(1, 60)
+        self.interval_spin.setValue(2)
+        self.interval_spin.valueChanged.connect(lambda v: self.timer.setInterval(v * 1000))
+        controls.addWidget(self.interval_spin)
+        controls.addWidget(QLabel("TOP N (0 = tutte):"))
+        self.top_spin = QSpinBox()
+        self.top_spin.setRange(0, 100000)
+        self.top_spin.setValue(20)
+        self.top_spin.valueChanged.connect(self.refresh)
+        controls.addWidget(self.top_spin)
+        controls.addStretch()
+        self.status_label = QLabel()
+        controls.addWidget(self.status_label)
+        self.toggle_btn = QPushButton("FERMA")
+        self.toggle_btn.clicked.connect(self.toggle_polling)
+        controls.addWidget(self.toggle_btn)
+        layout.addLayout(controls)
+
+        self.model = CounterTableModel(self)
+        self.view = QTableView()
+        self.view.setModel(self.model)
+        self.view.horizontalHeader().setSortIndicator(self.model.sort_column, self.model.sort_order)
+        self.view.setSortingEnabled(True)
+        self.view.setSelectionBehavior(QAbstractItemView.SelectionBehavior.SelectRows)
+        self.view.horizontalHeader().setSectionResizeMode(QHeaderView.ResizeMode.Interactive)
+        self.view.horizontalHeader().setSectionResizeMode(2, QHeaderView.ResizeMode.Stretch)
+        layout.addWidget(self.view)
+
+        self.timer = QTimer(self)
+        self.timer.setInterval(self.interval_spin.value() * 1000)
+        self.timer.timeout.connect(self.poll)
+        self.timer.start()
+        self.poll()
+
+    def family(self):
+        return self.window.manager.family
+
+    def toggle_polling(self):
+        if self.timer.isActive():
+            self.timer.stop()
+            self.toggle_btn.setText("AVVIA")
+        else:
+            self.timer.start()
+            self.toggle_btn.setText("FERMA")
+            self.poll()
+
+    def poll(self):
+        if self.worker is not None: return
+        self.worker = Worker(lambda worker: self.monitor.poll())
+        self.worker.signals.finished.connect(self.on_polled)
+        self.worker.signals.failed.connect(self.on_poll_failed)
+        QThreadPool.globalInstance().start(self.worker)
+
+    def on_polled(self, _):
+        self.worker = None
+        self.refresh()
+
+    def on_poll_failed(self, err):
+        self.worker = None
+        self.status_label.setText(f"Errore: {err}")
+
+    def refresh(self):
+        rules = list(self.window.all_rules)
+        stats = self.monitor.rule_stats(self.family(), rules)
+        rows = list(zip(rules, stats))
+        top = self.top_spin.value()
+        if top: rows = hottest(rows, top)
+        self.model.set_rows(rows)
+        self.status_label.setText(f"{len(rules)} regole monitorate")
+
+    def done(self, result):
+        # Every way out goes through here (Esc, the close button, closeEvent): reject() only hides the dialog,
+        # so the timer would otherwise keep spawning iptables-save -c in the background.
+        if self.timer.isActive(): self.toggle_polling()
+        super().done(result)
@@ -0,0 +1,455 @@
+import hashlib
+import json
+import subprocess
+
+from profiling import traced
+from rule import Rule, ANY_ADDRS
+from rule_index import parse_ports
+from transport import LOCAL
+
+NFT_FAMILIES = {"ipv4": "ip", "ipv6": "ip6"}
+SET_TYPES = {"ipv4": "ipv4_addr", "ipv6": "ipv6_addr"}
+# iptables-nft naming: the same table and chain names, hooked at the same priorities.
+BASE_CHAINS = {
+    ("filter", "INPUT"): ("filter", "input", 0), ("filter", "FORWARD"): ("filter", "forward", 0),
+    ("filter", "OUTPUT"): ("filter", "output", 0),
+    ("nat", "PREROUTING"): ("nat", "prerouting", -100), ("nat", "INPUT"): ("nat", "input", 100),
+    ("nat", "OUTPUT"): ("nat", "output", -100), ("nat", "POSTROUTING"): ("nat", "postrouting", 100),
+    ("mangle", "PREROUTING"): ("filter", "prerouting", -150), ("mangle", "INPUT"): ("filter", "input", -150),
+    ("mangle", "FORWARD"): ("filter", "forward", -150), ("mangle", "OUTPUT"): ("route", "output", -150),
+    ("mangle", "POSTROUTING"): ("filter", "postrouting", -150),
+    ("raw", "PREROUTING"): ("filter", "prerouting", -300), ("raw", "OUTPUT"): ("filter", "output", -300),
+}
+VERDICTS = {"ACCEPT": "accept", "DROP": "drop", "RETURN": "return"}
+# --reject-with as iptables-save prints it, to nft's reject type and code; the short forms iptables also accepts.
+REJECT_TYPES = {
+    "tcp-reset": ("tcp reset", None),
+    "icmp-net-unreachable": ("icmp", "net-unreachable"), "icmp-host-unreachable": ("icmp", "host-unreachable"),
+    "icmp-port-unreachable": ("icmp", "port-unreachable"), "icmp-proto-unreachable": ("icmp", "prot-unreachable"),
+    "icmp-net-prohibited": ("icmp", "net-prohibited"), "icmp-host-prohibited": ("icmp", "host-prohibited"),
+    "icmp-admin-prohibited": ("icmp", "admin-prohibited"),
+    "icmp6-no-route": ("icmpv6", "no-route"), "icmp6-adm-prohibited": ("icmpv6", "admin-prohibited"),
+    "icmp6-addr-unreachable": ("icmpv6", "addr-unreachable"), "icmp6-port-unreachable": ("icmpv6", "port-unreachable"),
+}
+REJECT_NAMES = {value: name for name, value in REJECT_TYPES.items()}
+REJECT_ALIASES = {"net-unreach": "icmp-net-unreachable", "host-unreach": "icmp-host-unreachable", "port-unreach": "icmp-port-unreachable",
+                  "proto-unreach": "icmp-proto-unreachable", "net-prohib": "icmp-net-prohibited", "host-prohib": "icmp-host-prohibited",
+                  "admin-prohib": "icmp-admin-prohibited", "no-route": "icmp6-no-route", "adm-prohibited": "icmp6-adm-prohibited",
+                  "addr-unreach": "icmp6-addr-unreachable"}
+REJECT_FAMILIES = {"icmp": "ipv4", "icmpv6": "ipv6"}
+PORT_PROTOCOLS = {"tcp", "udp", "sctp", "dccp", "udplite"}
+LIMIT_UNITS = {"s": "second", "sec": "second", "second": "second", "m": "minute", "min": "minute",
+               "minute": "minute", "h": "hour", "hour": "hour", "d": "day", "day": "day"}
+LIMIT_SHORT = {"second": "sec", "minute": "min", "hour": "hour", "day": "day"}
+# Expressions with no Rule field are carried verbatim in Rule.extra behind this pseudo-match.
+RAW_EXPR = ("-m", "nft", "--expr")
+CONFIG_FILE = "forge.nft.json"
+SERVICE_CONTENT = f"""[Unit]
+Description=Restore nftables Rules (Forge GUI)
+After=network-online.target
+Wants=network-online.target
+
+[Service]
+Type=oneshot
+ExecStart=/usr/sbin/nft -j -f /etc/iptables/{CONFIG_FILE}
+RemainAfterExit=yes
+
+[Install]
+WantedBy=multi-user.target
+"""
+
+def _negation(value):
+    value = str(value)
+    return (True, value[1:].strip()) if value.startswith("!") else (False, value)
+
+def _match(left, right, negated=False, op="=="):
+    return {"match": {"op": "!=" if negated else op, "left": left, "right": right}}
+
+def _addr(value):
+    addr, _, plen = value.partition("/")
+    if not plen or plen in ("32", "128"): return addr
+    return {"prefix": {"addr": addr, "len": int(plen)}}
+
+def _ports(value):
+    ranges = parse_ports(value)
+    if ranges is None: raise ValueError(f"porte non valide: {value}")
+    items = [lo if lo == hi else {"range": [lo, hi]} for lo, hi in ranges]
+    return items[0] if len(items) == 1 else {"set": items}
+
+def _iface(value):
+    return value[:-1] + "*" if value.endswith("+") else value
+
+def _split_extra(tokens):
+    # iptables match tokens grouped per "-m module" so each module can be translated on its own.
+    groups, i = [], 0
+    while i < len(tokens):
+        if tokens[i] == "-m" and i + 1 < len(tokens):
+            groups.append([tokens[i + 1]])
+            i += 2
+            continue
+        if not groups: raise ValueError(f"estensione non supportata da nftables: {' '.join(tokens)}")
+        groups[-1].append(tokens[i])
+        i += 1
+    return groups
+
+def _option_values(args):
+    values, negated = {}, False
+    for i, token in enumerate(args):
+        if token == "!": negated = True
+        elif token.startswith("--"):
+            value = args[i + 1] if i + 1 < len(args) and not args[i + 1].startswith("--") else None
+            values[token] = (negated, value)
+            negated = False
+    return values
+
+def _extra_exprs(rule, l3):
+    exprs = []
+    for module, *args in _split_extra(list(rule.extra)):
+        options = _option_values(args)
+        if module == "nft" and "--expr" in options: exprs.append(json.loads(options["--expr"][1]))
+        elif module == "conntrack" and "--ctstate" in options:
+            negated, value = options["--ctstate"]
+            exprs.append(_state_expr(value, negated))
+        elif module == "limit" and "--limit" in options:
+            rate, _, unit = options["--limit"][1].partition("/")
+            limit = {"rate": int(rate), "per": LIMIT_UNITS.get(unit, "second")}
+            if "--limit-burst" in options: limit["burst"] = int(options["--limit-burst"][1])
+            exprs.append({"limit": limit})
+        elif module == "set" and "--match-set" in options:
+            negated, name = options["--match-set"]
+            direction = args[args.index(name) + 1] if args.index(name) + 1 < len(args) else "src"
+            field = "daddr" if direction.split(",")[0] == "dst" else "saddr"
+            exprs.append(_match({"payload": {"protocol": l3, "field": field}}, f"@{name}", negated))
+        else: raise ValueError(f"estensione non supportata da nftables: -m {module} {' '.join(args)}")
+    return exprs
+
+def _state_expr(value, negated=False):
+    states = [s.lower() for s in value.split(",")]
+    if len(states) == 1: return _match({"ct": {"key": "state"}}, states[0], negated)
+    return _match({"ct": {"key": "state"}}, states, negated, "in")
+
+def _reject_expr(with_, family):
+    if with_ is None: return {"reject": None}
+    # port-unreach is the one short form both families accept.
+    if with_ == "port-unreach" and family == "ipv6": with_ = "icmp6-port-unreachable"
+    with_ = REJECT_ALIASES.get(with_, with_)
+    if with_ not in REJECT_TYPES: raise ValueError(f"--reject-with non supportato da nftables: {with_}")
+    kind, code = REJECT_TYPES[with_]
+    if REJECT_FAMILIES.get(kind, family) != family: raise ValueError(f"--reject-with {with_} non valido per {family}")
+    return {"reject": {"type": kind} if code is None else {"type": kind, "expr": code}}
+
+def _target_exprs(rule, family):
+    target, args = rule.target, list(rule.target_extra)
+    options = _option_values(args)
+    if not target: return []
+    if target in VERDICTS and not args: return [{VERDICTS[target]: None}]
+    if target == "REJECT": return [_reject_expr(options.get("--reject-with", (False, None))[1], family)]
+    if target == "LOG":
+        log = {}
+        if "--log-prefix" in options: log["prefix"] = options["--log-prefix"][1]
+        if "--log-level" in options: log["level"] = options["--log-level"][1]
+        return [{"log": log or None}]
+    if target == "MASQUERADE" and not args: return [{"masquerade": None}]
+    if target in ("DNAT", "SNAT"):
+        key = "--to-destination" if target == "DNAT" else "--to-source"
+        value = options.get(key, (False, None))[1] or ""
+        addr, _, port = value.rpartition(":") if value.count(":") == 1 else (value, "", "")
+        if not addr: raise ValueError(f"{target} senza {key}: {rule}")
+        nat = {"addr": addr}
+        if port: nat["port"] = int(port) if port.isdigit() else port
+        return [{target.lower(): nat}]
+    if target == "REDIRECT" and "--to-ports" in options:
+        port = options["--to-ports"][1]
+        return [{"redirect": {"port": int(port) if port.isdigit() else port}}]
+    if not args: return [{"jump": {"target": target}}]
+    raise ValueError(f"target non supportato da nftables: {target} {' '.join(args)}")
+
+def rule_exprs(rule, family):
+    l3 = NFT_FAMILIES[family]
+    exprs = []
+    negated, protocol = _negation(rule.protocol or "all")
+    if protocol != "all": exprs.append(_match({"meta": {"key": "l4proto"}}, protocol, negated))
+    for value, field in ((rule.source, "saddr"), (rule.destination, "daddr")):
+        if not value or value in ANY_ADDRS: continue
+        negated, value = _negation(value)
+        items = [_addr(v) for v in value.split(",")]
+        exprs.append(_match({"payload": {"protocol": l3, "field": field}}, items[0] if len(items) == 1 else {"set": items}, negated))
+    for value, key in ((rule.in_iface, "iifname"), (rule.out_iface, "oifname")):
+        if not value: continue
+        negated, value = _negation(value)
+        exprs.append(_match({"meta": {"key": key}}, _iface(value), negated))
+    l4 = protocol if protocol in PORT_PROTOCOLS and not rule.protocol.startswith("!") else "th"
+    for value, field in ((rule.sport, "sport"), (rule.dport, "dport")):
+        if not value: continue
+        negated, value = _negation(value)
+        exprs.append(_match({"payload": {"protocol": l4, "field": field}}, _ports(value), negated))
+    if rule.state:
+        negated, value = _negation(rule.state)
+        exprs.append(_state_expr(value, negated))
+    exprs.extend(_extra_exprs(rule, l3))
+    exprs.append({"counter": None})
+    exprs.extend(_target_exprs(rule, family))
+    return exprs
+
+def _from_addr(right):
+    if isinstance(right, dict) and "prefix" in right: return f"{right['prefix']['addr']}/{right['prefix']['len']}"
+    if isinstance(right, str): return right if "/" in right else right + ("/128" if ":" in right else "/32")
+    return None
+
+def _from_ports(right):
+    items = right["set"] if isinstance(right, dict) and "set" in right else [right]
+    out = []
+    for item in items:
+        if isinstance(item, int): out.append(str(item))
+        elif isinstance(item, dict) and "range" in item: out.append(f"{item['range'][0]}:{item['range'][1]}")
+        else: return None
+    return ",".join(out)
+
+def rule_from_nft(obj):
+    fields = {"chain": obj["chain"], "table": obj["table"], "target": "", "comment": obj.get("comment", "")}
+    extra, target_extra, pkts, bytes = [], [], 0, 0
+    for expr in obj.get("expr", []):
+        if "counter" in expr:
+            counter = expr["counter"] or {}
+            pkts, bytes = counter.get("packets", 0), counter.get("bytes", 0)
+            continue
+        handled = _field_from_expr(expr, fields, extra, target_extra)
+        if not handled: extra.extend((*RAW_EXPR, json.dumps(expr, sort_keys=True, separators=(",", ":"))))
+    return Rule(extra=extra, target_extra=target_extra, pkts=pkts, bytes=bytes, **fields)
+
+def _field_from_expr(expr, fields, extra, target_extra):
+    for verdict, name in VERDICTS.items():
+        if name in expr and expr[name] is None:
+            fields["target"] = verdict
+            return True
+    if "jump" in expr:
+        fields["target"] = expr["jump"]["target"]
+        return True
+    if "reject" in expr:
+        # icmpx and any other reject with no iptables spelling stay a raw expression, target included.
+        reject = expr["reject"] or {}
+        name = REJECT_NAMES.get((reject.get("type"), reject.get("expr")))
+        if reject and (name is None or set(reject) - {"type", "expr"}): return False
+        fields["target"] = "REJECT"
+        if name: target_extra.extend(("--reject-with", name))
+        return True
+    if "log" in expr:
+        fields["target"] = "LOG"
+        log = expr["log"] or {}
+        if "prefix" in log: target_extra.extend(("--log-prefix", log["prefix"]))
+        if "level" in log: target_extra.extend(("--log-level", log["level"]))
+        return set(log) <= {"prefix", "level"}
+    if "masquerade" in expr and expr["masquerade"] is None:
+        fields["target"] = "MASQUERADE"
+        return True
+    for name in ("dnat", "snat"):
+        if name in expr and set(expr[name] or {}) <= {"addr", "port"}:
+            fields["target"] = name.upper()
+            value = expr[name]["addr"] + (f":{expr[name]['port']}" if "port" in expr[name] else "")
+            target_extra.extend(("--to-destination" if name == "dnat" else "--to-source", value))
+            return True
+    if "redirect" in expr and set(expr["redirect"] or {}) == {"port"}:
+        fields["target"] = "REDIRECT"
+        target_extra.extend(("--to-ports", str(expr["redirect"]["port"])))
+        return True
+    if "limit" in expr and set(expr["limit"]) <= {"rate", "per", "burst"} and expr["limit"].get("per") in LIMIT_SHORT:
+        extra.extend(("-m", "limit", "--limit", f"{expr['limit']['rate']}/{LIMIT_SHORT[expr['limit']['per']]}"))
+        if "burst" in expr["limit"]: extra.extend(("--limit-burst", str(expr["limit"]["burst"])))
+        return True
+    if "match" not in expr: return False
+    op, left, right = expr["match"]["op"], expr["match"]["left"], expr["match"]["right"]
+    prefix = "! " if op == "!=" else ""
+    if op not in ("==", "!=", "in"): return False
+    if left == {"meta": {"key": "l4proto"}} and isinstance(right, str):
+        fields["protocol"] = prefix + right
+        return True
+    if isinstance(left, dict) and "meta" in left and left["meta"].get("key") in ("iifname", "oifname") and isinstance(right, str):
+        name = right[:-1] + "+" if right.endswith("*") else right
+        fields["in_iface" if left["meta"]["key"] == "iifname" else "out_iface"] = prefix + name
+        return True
+    if left == {"ct": {"key": "state"}}:
+        states = right if isinstance(right, list) else [right]
+        if not all(isinstance(s, str) for s in states): return False
+        fields["state"] = prefix + ",".join(s.upper() for s in states)
+        return True
+    payload = left.get("payload") if isinstance(left, dict) else None
+    if not payload: return False
+    if payload.get("field") in ("saddr", "daddr") and payload.get("protocol") in ("ip", "ip6"):
+        if isinstance(right, str) and right.startswith("@"):
+            extra.extend(("-m", "set", *(("!",) if prefix else ()), "--match-set", right[1:],
+                          "src" if payload["field"] == "saddr" else "dst"))
+            return True
+        items = right["set"] if isinstance(right, dict) and "set" in right else [right]
+        values = [_from_addr(item) for item in items]
+        if None in values: return False
+        fields["source" if payload["field"] == "saddr" else "destination"] = prefix + ",".join(values)
+        return True
+    if payload.get("field") in ("sport", "dport"):
+        value = _from_ports(right)
+        if value is None: return False
+        fields[payload["field"]] = prefix + value
+        return True
+    return False
+
+class NftablesBackend:
+    name = "nftables"
+    rules_files = (CONFIG_FILE,)
+
+    def __init__(self, nft="nft", transport=None):
+        self.nft = nft
+        self.transport = transport or LOCAL
+        # Rule handles per family and (table, chain), in chain order, from the last read.
+        self.handles = {}
+
+    def _run(self, args, payload=None):
+        return self.transport.run([self.nft, *args], input=payload, text=True, capture_output=True, check=True)
+
+    def dump(self, family, counters=False):
+        try: doc = json.loads(self._run(["-j", "list", "ruleset"]).stdout or "{}")
+        except (OSError, subprocess.CalledProcessError, ValueError): return None
+        l3 = NFT_FAMILIES[family]
+        return [obj for obj in doc.get("nftables", []) if next(iter(obj.values())).get("family") == l3]
+
+    def fingerprint(self, objects):
+        # Handles and counter values change without the ruleset changing.
+        digest = hashlib.blake2b(digest_size=16)
+        for obj in objects:
+            kind, body = next(iter(obj.items()))
+            if kind == "metainfo": continue
+            body = {k: v for k, v in body.items() if k != "handle"}
+            if kind == "rule": body["expr"] = [e for e in body.get("expr", []) if "counter" not in e]
+            digest.update(json.dumps([kind, body], sort_keys=True).encode())
+        return digest.hexdigest()
+
+    @traced("nft.parse")
+    def parse(self, objects, family):
+        rules, chains, handles = [], {}, {}
+        for obj in objects:
+            if "chain" in obj:
+                chain = obj["chain"]
+                policy = chain.get("policy", "").upper() if "hook" in chain else "-"
+                chains.setdefault(chain["table"], {})[chain["name"]] = policy or "ACCEPT"
+            elif "rule" in obj:
+                rule = obj["rule"]
+                rules.append(rule_from_nft(rule))
+                handles.setdefault((rule["table"], rule["chain"]), []).append(rule.get("handle"))
+        self.handles[family] = handles
+        return rules, chains, {}
+
+    def read(self, family, counters=False):
+        # nft -j writes one JSON document, so there is nothing to stream: dump, then parse.
+        objects = self.dump(family, counters)
+        if objects is None: return None
+        return (*self.parse(objects, family), self.fingerprint(objects))
+
+    def _chain_object(self, l3, table, chain, policy):
+        obj = {"family": l3, "table": table, "name": chain}
+        if (table, chain) in BASE_CHAINS:
+            kind, hook, prio = BASE_CHAINS[(table, chain)]
+            obj.update(type=kind, hook=hook, prio=prio, policy=(policy if policy in ("ACCEPT", "DROP") else "ACCEPT").lower())
+        return obj
+
+    def _declarations(self, l3, state, chains_by_table):
+        commands = []
+        for table, chains in chains_by_table.items():
+            commands.append({"add": {"table": {"family": l3, "name": table}}})
+            known = state.chains.get(table, {})
+            for chain in chains:
+                if chain not in known: commands.append({"add": {"chain": self._chain_object(l3, table, chain, "ACCEPT")}})
+        return commands
+
+    def _transaction(self, commands, test_first=True):
+        payload = json.dumps({"nftables": commands})
+        steps = [["-c", "-j", "-f", "-"], ["-j", "-f", "-"]] if test_first else [["-j", "-f", "-"]]
+        for args in steps:
+            try: self._run(args, payload)
+            except subprocess.CalledProcessError as e: return False, e.stderr or "nft failed"
+            except OSError as e: return False, str(e)
+        return True, ""
+
+    def apply_plan(self, family, state, ops, test_first=True):
+        # Diff positions become rule handles: with ops in ascending order the rule an insert lands before
+        # is always one that already existed, so every command can name a handle from the last read.
+        l3 = NFT_FAMILIES[family]
+        handles = {key: list(value) for key, value in self.handles.get(family, {}).items()}
+        chains_by_table = {}
+        for op in ops: chains_by_table.setdefault(op.table, {})[op.chain] = None
+        try:
+            commands = self._declarations(l3, state, chains_by_table)
+            for op in ops:
+                if op.action == ":":
+                    commands.append({"add": {"chain": self._chain_object(l3, op.table, op.chain, op.policy)}})
+                    continue
+                chain_handles = handles.setdefault((op.table, op.chain), [])
+                base = {"family": l3, "table": op.table, "chain": op.chain}
+                i = op.position - 1
+                if op.action == "-D":
+                    commands.append({"delete": {"rule": {**base, "handle": chain_handles.pop(i)}}})
+                    continue
+                rule = {**base, "expr": rule_exprs(op.rule, family)}
+                if op.rule.comment: rule["comment"] = op.rule.comment
+                if op.action == "-R":
+                    # nft replaces in place and the rule keeps its handle, so later ops can still name it.
+                    commands.append({"replace": {"rule": {**rule, "handle": chain_handles[i]}}})
+                    continue
+                if i >= len(chain_handles): commands.append({"add": {"rule": rule}})
+                elif chain_handles[i] is not None: commands.append({"insert": {"rule": {**rule, "handle": chain_handles[i]}}})
+                elif i > 0 and chain_handles[i - 1] is not None: commands.append({"add": {"rule": {**rule, "handle": chain_handles[i - 1]}}})
+                else: return False, f"posizione {op.position} di {op.chain} non risolvibile con gli handle nft"
+                chain_handles.insert(i, None)
+        except (ValueError, KeyError, IndexError) as e:
+            return False, f"Traduzione nftables non riuscita: {e}"
+        return self._transaction(commands, test_first)
+
+    def _ruleset_commands(self, family, state, structured_data):
+        l3 = NFT_FAMILIES[family]
+        commands = []
+        for table in dict.fromkeys([*state.chains, *structured_data]):
+            chains = dict(state.chains.get(table, {}))
+            for chain in structured_data.get(table, {}): chains.setdefault(chain, "-")
+            commands.append({"add": {"table": {"family": l3, "name": table}}})
+            commands.append({"flush": {"table": {"family": l3, "name": table}}})
+            for chain, policy in chains.items():
+                commands.append({"add": {"chain": self._chain_object(l3, table, chain, policy)}})
+            for chain, rules in structured_data.get(table, {}).items():
+                for rule in rules:
+                    obj = {"family": l3, "table": table, "chain": chain, "expr": rule_exprs(rule, family)}
+                    if rule.comment: obj["comment"] = rule.comment
+                    commands.append({"add": {"rule": obj}})
+        return commands
+
+    def apply_rules(self, family, state, structured_data, test_first=True):
+        try: commands = self._ruleset_commands(family, state, structured_data)
+        except ValueError as e: return False, f"Traduzione nftables non riuscita: {e}"
+        return self._transaction(commands, test_first)
+
+    def apply_sets(self, family, state, ipsets):
+        l3 = NFT_FAMILIES[family]
+        commands = []
+        for table in dict.fromkeys(["filter", *state.chains]):
+            commands.append({"add": {"table": {"family": l3, "name": table}}})
+            for name, (_, members) in ipsets.items():
+                ref = {"family": l3, "table": table, "name": name}
+                commands.append({"add": {"set": {**ref, "type": SET_TYPES[family], "flags": ["interval"]}}})
+                commands.append({"add": {"element": {**ref, "elem": [_addr(m) for m in members]}}})
+        return self._transaction(commands)
+
+    def render(self, family, state, rules):
+        structured = {}
+        for rule in rules: structured.setdefault(rule.table, {}).setdefault(rule.chain, []).append(rule)
+        return json.dumps({"nftables": self._ruleset_commands(family, state, structured)}) + "\n"
+
+    def restore_argv(self, family, path):
+        return [self.nft, "-j", "-f", path]
+
+    def persistent_files(self, states):
+        commands = []
+        for family, state in states.items():
+            if state.fingerprint is None: continue
+            structured = {}
+            for rule in state.applied: structured.setdefault(rule.table, {}).setdefault(rule.chain, []).append(rule)
+            commands.extend(self._ruleset_commands(family, state, structured))
+        return {CONFIG_FILE: json.dumps({"nftables": commands}, indent=1) + "\n"} if commands else {}
+
+    def service_content(self, filenames):
+        return SERVICE_CONTENT
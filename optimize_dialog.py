@@ -0,0 +1,39 @@
+from PyQt6.QtGui import QFont
+from PyQt6.QtWidgets import QDialog, QVBoxLayout, QHBoxLayout, QLabel, QPlainTextEdit, QPushButton
+
+MAX_LISTED = 500
+
+class OptimizeDialog(QDialog):
+    def __init__(self, parent, plan):
+        super().__init__(parent)
+        self.plan = plan
+        self.setWindowTitle("Ottimizzazione Ruleset")
+        self.resize(900, 600)
+
+        layout = QVBoxLayout(self)
+        summary = QLabel(plan.summary())
+        summary.setWordWrap(True)
+        layout.addWidget(summary)
+
+        details = QPlainTextEdit()
+        details.setReadOnly(True)
+        details.setFont(QFont("Monospace", 9))
+        lines = [str(f) for f in plan.findings[:MAX_LISTED]]
+        if len(plan.findings) > MAX_LISTED: lines.append(f"... e altri {len(plan.findings) - MAX_LISTED} risultati")
+        lines += ["", "Regole valutate per pacchetto per chain:"]
+        lines += [f"  {table}/{chain}: {plan.before[(table, chain)]:.1f} -> {plan.after[(table, chain)]:.1f}"
+                  for table, chain in sorted(plan.before)]
+        details.setPlainText("\n".join(lines))
+        layout.addWidget(details)
+
+        buttons = QHBoxLayout()
+        buttons.addStretch()
+        close_btn = QPushButton("CHIUDI")
+        close_btn.clicked.connect(self.reject)
+        buttons.addWidget(close_btn)
+        apply_btn = QPushButton("APPLICA OTTIMIZZAZIONE")
+        apply_btn.setObjectName("applyButton")
+        apply_btn.setEnabled(bool(plan.findings or plan.moves))
+        apply_btn.clicked.connect(self.accept)
+        buttons.addWidget(apply_btn)
+        layout.addLayout(buttons)
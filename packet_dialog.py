@@ -0,0 +1,91 @@
+from PyQt6.QtWidgets import (QDialog, QVBoxLayout, QFormLayout, QLineEdit, QComboBox, QLabel, QPushButton,
+                             QPlainTextEdit, QDialogButtonBox)
+
+from packet_sim import Simulator, STATES, parse_flow
+from rule_index import parse_network
+
+class PacketDialog(QDialog):
+    VERDICT_COLORS = {"ACCEPT": "#40c057", "DROP": "#fa5252", "REJECT": "#fa5252"}
+
+    def __init__(self, parent, rules, chains):
+        super().__init__(parent)
+        self.simulator = Simulator(rules, chains)
+        self.setWindowTitle("Test Pacchetto")
+        self.setMinimumWidth(560)
+        self.setup_ui()
+
+    def setup_ui(self):
+        layout = QVBoxLayout(self)
+        layout.setContentsMargins(25, 25, 25, 25)
+        layout.setSpacing(15)
+
+        title = QLabel("QUALE REGOLA DECIDE?")
+        title.setStyleSheet("font-size: 14px; font-weight: bold; color: #339af0; letter-spacing: 1px;")
+        layout.addWidget(title)
+
+        form = QFormLayout()
+        form.setSpacing(12)
+        self.chain_cb = QComboBox()
+        self.chain_cb.addItems(["INPUT", "FORWARD", "OUTPUT"])
+        self.proto_cb = QComboBox()
+        self.proto_cb.addItems(["tcp", "udp", "icmp", "ipv6-icmp"])
+        self.src_input = QLineEdit()
+        self.src_input.setPlaceholderText("es. 203.0.113.7")
+        self.sport_input = QLineEdit("40000")
+        self.dst_input = QLineEdit()
+        self.dport_input = QLineEdit("443")
+        self.state_cb = QComboBox()
+        self.state_cb.addItems(STATES)
+        self.in_iface_input = QLineEdit("eth0")
+        self.out_iface_input = QLineEdit()
+
+        form.addRow("CHAIN:", self.chain_cb)
+        form.addRow("PROTOCOLLO:", self.proto_cb)
+        form.addRow("SORGENTE:", self.src_input)
+        form.addRow("PORTA SORG.:", self.sport_input)
+        form.addRow("DESTINAZIONE:", self.dst_input)
+        form.addRow("PORTA DEST.:", self.dport_input)
+        form.addRow("STATO:", self.state_cb)
+        form.addRow("INTERFACCIA IN:", self.in_iface_input)
+        form.addRow("INTERFACCIA OUT:", self.out_iface_input)
+        layout.addLayout(form)
+
+        self.test_btn = QPushButton("VERIFICA")
+        self.test_btn.setMinimumHeight(34)
+        self.test_btn.clicked.connect(self.run_test)
+        layout.addWidget(self.test_btn)
+
+        self.verdict_label = QLabel()
+        self.verdict_label.setStyleSheet("font-size: 16px; font-weight: bold;")
+        layout.addWidget(self.verdict_label)
+        self.trace_view = QPlainTextEdit()
+        self.trace_view.setReadOnly(True)
+        self.trace_view.setMinimumHeight(140)
+        layout.addWidget(self.trace_view)
+
+        buttons = QDialogButtonBox(QDialogButtonBox.StandardButton.Close)
+        buttons.rejected.connect(self.reject)
+        layout.addWidget(buttons)
+
+    def run_test(self):
+        for field in (self.src_input, self.dst_input):
+            if field.text().strip() and parse_network(field.text().strip()) is None:
+                self.verdict_label.setText(f"Indirizzo non valido: {field.text()}")
+                return
+        try:
+            flow = parse_flow((self.src_input.text(), self.dst_input.text(), self.proto_cb.currentText(),
+                               self.sport_input.text(), self.dport_input.text(), self.state_cb.currentText(),
+                               self.in_iface_input.text(), self.out_iface_input.text()))
+        except ValueError:
+            self.verdict_label.setText("Porta non valida")
+            return
+        trace = []
+        result = self.simulator.evaluate(flow, self.chain_cb.currentText(), trace)
+        verdict, chain, index, approximate = result
+        rule = self.simulator.rule_of(result)
+        decided_by = f"regola {index + 1} di {chain}" if rule else f"policy di {chain}"
+        self.verdict_label.setText(f"{verdict} ({decided_by})" + (" ~ approssimato" if approximate else ""))
+        self.verdict_label.setStyleSheet(f"font-size: 16px; font-weight: bold; color: {self.VERDICT_COLORS.get(verdict, '#e0e0e0')};")
+        lines = [f"{name} #{i + 1}: {self.simulator.chains[name].rules[i]}" for name, i in trace]
+        if rule is None: lines.append(f"nessuna regola terminale: si applica la policy {verdict}")
+        self.trace_view.setPlainText("\n".join(lines))
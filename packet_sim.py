@@ -0,0 +1,318 @@
+import csv
+import os
+from bisect import bisect_right
+from multiprocessing import Pool
+
+from rule import ANY_ADDRS
+from rule_index import parse_network, parse_ports
+
+VERDICTS = {"ACCEPT", "DROP", "REJECT", "NFQUEUE"}
+STATES = ("NEW", "ESTABLISHED", "RELATED", "INVALID", "UNTRACKED")
+PROTOCOL_NUMBERS = {"1": "icmp", "6": "tcp", "17": "udp", "58": "ipv6-icmp", "icmpv6": "ipv6-icmp"}
+FLOW_FIELDS = ("src", "dst", "proto", "sport", "dport", "state", "in_iface", "out_iface")
+MAX_DEPTH = 64
+CACHE_SIZE = 1 << 18
+CHUNK_SIZE = 20000
+
+def _negation(value):
+    value = str(value)
+    return (True, value[1:].strip()) if value.startswith("!") else (False, value)
+
+def _merge(ranges):
+    merged = []
+    for lo, hi in sorted(ranges):
+        if merged and lo <= merged[-1][1] + 1: merged[-1] = (merged[-1][0], max(merged[-1][1], hi))
+        else: merged.append((lo, hi))
+    return merged
+
+def _complement(ranges):
+    gaps, start = [], 0
+    for lo, hi in sorted(ranges):
+        if lo > start: gaps.append((start, lo - 1))
+        start = max(start, hi + 1)
+    if start <= 65535: gaps.append((start, 65535))
+    return gaps
+
+class AddressTable:
+    # The same flattened prefix trie as rule_index.PrefixIndex, but each slot holds a rule bitmask,
+    # so a lookup ORs one dict hit per prefix length in use.
+    def __init__(self):
+        self.levels = {4: {}, 6: {}}
+        self.negated_levels = {4: {}, 6: {}}
+        self.wildcard = 0
+        self.negated = 0
+
+    def add(self, value, bit):
+        if not value or value in ANY_ADDRS:
+            self.wildcard |= bit
+            return True
+        negated, value = _negation(value)
+        net = parse_network(value)
+        if net is None: return False
+        version, network, plen, bits = net
+        level = (self.negated_levels if negated else self.levels)[version].setdefault(plen, {})
+        level[network >> (bits - plen)] = level.get(network >> (bits - plen), 0) | bit
+        if negated: self.negated |= bit
+        return True
+
+    def lookup(self, addr):
+        if addr is None: return self.wildcard | self.negated
+        version, value, _, bits = addr
+        mask = self.wildcard
+        for plen, level in self.levels[version].items(): mask |= level.get(value >> (bits - plen), 0)
+        if self.negated:
+            hit = 0
+            for plen, level in self.negated_levels[version].items(): hit |= level.get(value >> (bits - plen), 0)
+            mask |= self.negated & ~hit
+        return mask
+
+class PortTable:
+    # Rule port ranges cut 0-65535 into elementary intervals, each with the mask of rules covering it.
+    def __init__(self):
+        self.wildcard = 0
+        self.ranges = []
+        self.points = [0]
+        self.masks = [0]
+
+    def add(self, value, bit):
+        if not value:
+            self.wildcard |= bit
+            return True
+        negated, value = _negation(value)
+        ranges = parse_ports(value)
+        if ranges is None: return False
+        # A rule's own ranges must be disjoint for the sweep in compile() to add and remove its bit cleanly.
+        self.ranges.extend((lo, hi, bit) for lo, hi in (_complement(ranges) if negated else _merge(ranges)))
+        return True
+
+    def compile(self):
+        events = {}
+        for lo, hi, bit in self.ranges:
+            events.setdefault(lo, [0, 0])[0] |= bit
+            events.setdefault(hi + 1, [0, 0])[1] |= bit
+        mask, self.points, self.masks = 0, [0], [0]
+        for point in sorted(events):
+            added, removed = events[point]
+            mask = (mask & ~removed) | added
+            if point == 0: self.masks[0] = mask
+            else:
+                self.points.append(point)
+                self.masks.append(mask)
+
+    def lookup(self, port):
+        if port is None: return self.wildcard
+        return self.wildcard | self.masks[bisect_right(self.points, port) - 1]
+
+class ValueTable:
+    def __init__(self, universe=None):
+        self.universe = universe
+        self.values = {}
+        self.wildcard = 0
+        self.negated = []
+
+    def add(self, value, bit):
+        if not value or value == "all":
+            self.wildcard |= bit
+            return
+        negated, value = _negation(value)
+        names = {v.strip() for v in value.split(",")}
+        if negated:
+            if self.universe is None: self.negated.append((names, bit))
+            else: names = set(self.universe) - names
+        if not negated or self.universe is not None:
+            for name in names: self.values[name] = self.values.get(name, 0) | bit
+
+    def lookup(self, value):
+        mask = self.wildcard | self.values.get(value, 0)
+        for names, bit in self.negated:
+            if value not in names: mask |= bit
+        return mask
+
+class IfaceTable:
+    def __init__(self):
+        self.wildcard = 0
+        self.patterns = []
+        self.cache = {}
+
+    def add(self, value, bit):
+        if not value: self.wildcard |= bit
+        else: self.patterns.append((*_negation(value), bit))
+
+    def lookup(self, name):
+        mask = self.cache.get(name)
+        if mask is None:
+            mask = self.wildcard
+            for negated, pattern, bit in self.patterns:
+                hit = bool(name) and (name == pattern or pattern.endswith("+") and name.startswith(pattern[:-1]))
+                if hit != negated: mask |= bit
+            self.cache[name] = mask
+        return mask
+
+def _parse_extra(extra):
+    # Match extensions the simulator understands; anything else makes the rule approximate.
+    state, sets, opaque, tokens, i = None, [], False, list(extra), 0
+    while i < len(tokens):
+        negated = tokens[i] == "!"
+        if negated: i += 1
+        token = tokens[i] if i < len(tokens) else ""
+        if token == "-m" or token in ("--limit", "--limit-burst"): i += 2
+        elif token == "--ctstate" and i + 1 < len(tokens):
+            state = ("! " if negated else "") + tokens[i + 1]
+            i += 2
+        elif token == "--match-set" and i + 2 < len(tokens):
+            sets.append((tokens[i + 1], tokens[i + 2].split(",")[0], negated))
+            i += 3
+        else:
+            opaque = True
+            i += 1
+    return state, sets, opaque
+
+class CompiledChain:
+    def __init__(self, name, rules, policy, ipsets):
+        self.name = name
+        self.rules = rules
+        self.targets = [r.target for r in rules]
+        self.policy = policy
+        self.protocols = ValueTable()
+        self.sources, self.destinations = AddressTable(), AddressTable()
+        self.sports, self.dports = PortTable(), PortTable()
+        self.states = ValueTable(STATES)
+        self.in_ifaces, self.out_ifaces = IfaceTable(), IfaceTable()
+        self.set_matches = []
+        self.never = 0
+        self.approximate = 0
+        for i, rule in enumerate(rules):
+            bit = 1 << i
+            state, sets, opaque = _parse_extra(rule.extra)
+            negated, protocol = _negation((rule.protocol or "all").lower())
+            protocol = PROTOCOL_NUMBERS.get(protocol, protocol)
+            self.protocols.add(f"! {protocol}" if negated else protocol, bit)
+            self.states.add((rule.state or state or "").upper(), bit)
+            self.in_ifaces.add(rule.in_iface, bit)
+            self.out_ifaces.add(rule.out_iface, bit)
+            modelled = self.sources.add(rule.source, bit) & self.destinations.add(rule.destination, bit) & \
+                self.sports.add(rule.sport, bit) & self.dports.add(rule.dport, bit)
+            for set_name, direction, negated in sets:
+                members = (ipsets or {}).get(set_name)
+                if members is None:
+                    opaque = True
+                    continue
+                table = AddressTable()
+                for member in members: table.add(member, 1)
+                self.set_matches.append((bit, direction == "dst", table, negated))
+            # Unparseable addresses/ports never match; unknown extensions are assumed to match.
+            if not modelled: self.never |= bit
+            if opaque or not modelled: self.approximate |= bit
+        self.sports.compile()
+        self.dports.compile()
+
+    def match(self, src, dst, proto, sport, dport, state, in_iface, out_iface):
+        mask = self.protocols.lookup(proto)
+        if mask: mask &= self.dports.lookup(dport)
+        if mask: mask &= self.sources.lookup(src)
+        if mask: mask &= self.destinations.lookup(dst)
+        if mask: mask &= self.sports.lookup(sport)
+        if mask: mask &= self.states.lookup(state)
+        if mask: mask &= self.in_ifaces.lookup(in_iface) & self.out_ifaces.lookup(out_iface)
+        if mask and self.set_matches:
+            for bit, use_dst, table, negated in self.set_matches:
+                if mask & bit and bool(table.lookup(dst if use_dst else src)) == negated: mask &= ~bit
+        return mask & ~self.never
+
+def parse_flow(row):
+    values = [str(v).strip() if v is not None else "" for v in row] + [""] * len(FLOW_FIELDS)
+    src, dst, proto, sport, dport, state, in_iface, out_iface = values[:len(FLOW_FIELDS)]
+    proto = proto.lower()
+    return (src or None, dst or None, PROTOCOL_NUMBERS.get(proto, proto) or None,
+            int(sport) if sport else None, int(dport) if dport else None,
+            state.upper() or "NEW", in_iface or None, out_iface or None)
+
+class Simulator:
+    def __init__(self, rules, chains=None, table="filter", ipsets=None):
+        policies = (chains or {}).get(table, {})
+        by_chain = {}
+        for rule in rules:
+            if rule.table == table: by_chain.setdefault(rule.chain, []).append(rule)
+        names = dict.fromkeys([*policies, *by_chain])
+        self.chains = {name: CompiledChain(name, by_chain.get(name, []), policies.get(name, "-"), ipsets) for name in names}
+        self.cache = {}
+
+    def __getstate__(self):
+        return {**self.__dict__, "cache": {}}
+
+    def evaluate(self, flow, chain="INPUT", trace=None):
+        # Result: (verdict, chain, index of the deciding rule in that chain or -1 for the policy, approximate).
+        key = (chain, flow)
+        if trace is None:
+            result = self.cache.get(key)
+            if result is not None: return result
+        src, dst, *rest = flow
+        decided = self._walk(chain, (parse_network(src) if src else None, parse_network(dst) if dst else None, *rest), trace, 0)
+        if decided is None:
+            policy = self.chains[chain].policy if chain in self.chains else "-"
+            result = (policy if policy in VERDICTS else "ACCEPT", chain, -1, False)
+        else: result = decided
+        if trace is None:
+            if len(self.cache) >= CACHE_SIZE: self.cache.clear()
+            self.cache[key] = result
+        return result
+
+    def _walk(self, name, flow, trace, depth):
+        chain = self.chains.get(name)
+        if chain is None or depth > MAX_DEPTH: return None
+        mask = chain.match(*flow)
+        while mask:
+            low = mask & -mask
+            mask ^= low
+            i = low.bit_length() - 1
+            target = chain.targets[i]
+            if trace is not None: trace.append((name, i))
+            if target in VERDICTS: return target, name, i, bool(chain.approximate & low)
+            if target == "RETURN": return None
+            if target in self.chains:
+                decided = self._walk(target, flow, trace, depth + 1)
+                if decided is not None: return decided
+        return None
+
+    def evaluate_many(self, flows, chain="INPUT"):
+        evaluate = self.evaluate
+        return [evaluate(flow, chain) for flow in flows]
+
+    def rule_of(self, result):
+        _, chain, index, _ = result
+        return self.chains[chain].rules[index] if index >= 0 else None
+
+_worker_simulator = None
+
+def _init_worker(simulator):
+    global _worker_simulator
+    _worker_simulator = simulator
+
+def _evaluate_chunk(args):
+    chain, flows = args
+    return _worker_simulator.evaluate_many(flows, chain)
+
+def evaluate_parallel(simulator, flows, chain="INPUT", processes=None, chunk_size=CHUNK_SIZE):
+    processes = processes or os.cpu_count() or 1
+    if processes == 1 or len(flows) <= chunk_size: return simulator.evaluate_many(flows, chain)
+    chunks = [(chain, flows[i:i + chunk_size]) for i in range(0, len(flows), chunk_size)]
+    results = []
+    with Pool(processes, initializer=_init_worker, initargs=(simulator,)) as pool:
+        for part in pool.imap(_evaluate_chunk, chunks): results.extend(part)
+    return results
+
+def read_flows(path):
+    flows = []
+    with open(path, newline="") as f:
+        for row in csv.reader(f):
+            if not row or row[0].startswith("#") or row[0].strip().lower() == "src": continue
+            flows.append(parse_flow(row))
+    return flows
+
+def write_results(out, simulator, flows, results):
+    writer = csv.writer(out)
+    writer.writerow([*FLOW_FIELDS, "verdict", "chain", "rule_num", "approximate", "rule"])
+    for flow, result in zip(flows, results):
+        rule = simulator.rule_of(result)
+        writer.writerow([*("" if v is None else v for v in flow), result[0], result[1],
+                         result[2] + 1 if result[2] >= 0 else "policy", int(result[3]), rule.spec() if rule else ""])
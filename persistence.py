@@ -0,0 +1,117 @@
+import hashlib
+import os
+import tempfile
+import time
+
+RULES_DIR = "/etc/iptables"
+RULES_FILES = {"ipv4": "rules.v4", "ipv6": "rules.v6"}
+SERVICE_NAME = "iptables-forge.service"
+SYSTEMD_DIR = "/etc/systemd/system"
+RESTORE_COMMANDS = {"rules.v4": "/sbin/iptables-restore", "rules.v6": "/sbin/ip6tables-restore"}
+SERVICE_TEMPLATE = """[Unit]
+Description=Restore IPTables Rules (Forge GUI)
+After=network-online.target
+Wants=network-online.target
+
+[Service]
+Type=oneshot
+{exec_start}RemainAfterExit=yes
+
+[Install]
+WantedBy=multi-user.target
+"""
+
+def service_content(filenames):
+    # One ExecStart per rules file: systemd fails the whole unit at boot if any of them is missing.
+    return SERVICE_TEMPLATE.format(exec_start="".join(f"ExecStart={RESTORE_COMMANDS[name]} {RULES_DIR}/{name}\n" for name in filenames))
+
+SERVICE_CONTENT = service_content(RULES_FILES.values())
+
+def digest(data):
+    return hashlib.sha256(data).hexdigest()
+
+def file_digest(path):
+    try:
+        with open(path, "rb") as f: return digest(f.read())
+    except FileNotFoundError:
+        return None
+
+def write_atomic(path, content, mode=0o644):
+    # Temp file in the same directory + fsync + rename: a crash leaves either the old file or the new one.
+    directory = os.path.dirname(path) or "."
+    fd, tmp = tempfile.mkstemp(dir=directory, prefix=".forge-")
+    try:
+        with os.fdopen(fd, "wb") as f:
+            f.write(content)
+            f.flush()
+            os.fsync(f.fileno())
+        os.chmod(tmp, mode)
+        os.replace(tmp, path)
+    except BaseException:
+        if os.path.exists(tmp): os.remove(tmp)
+        raise
+    dir_fd = os.open(directory, os.O_RDONLY)
+    try: os.fsync(dir_fd)
+    finally: os.close(dir_fd)
+
+class SaveReport:
+    def __init__(self):
+        self.written = []
+        self.unchanged = []
+        self.unit_updated = False
+        self.enabled = False
+        self.elapsed = 0.0
+
+    @property
+    def noop(self):
+        return not (self.written or self.unit_updated or self.enabled)
+
+    def __str__(self):
+        ms = f"{self.elapsed * 1000:.1f} ms"
+        if self.noop: return f"Persistenza già aggiornata, nessuna scrittura ({ms})."
+        parts = [f"scritti {', '.join(os.path.basename(p) for p in self.written)}"] if self.written else []
+        if self.unit_updated: parts.append("servizio systemd aggiornato")
+        if self.enabled: parts.append("servizio abilitato")
+        return f"Persistenza: {'; '.join(parts)} ({ms})."
+
+class PersistenceWriter:
+    def __init__(self, rules_dir=RULES_DIR, systemd_dir=SYSTEMD_DIR, transport=None):
+        if transport is None: from transport import LOCAL as transport
+        self.transport = transport
+        self.rules_dir = rules_dir
+        self.unit_path = os.path.join(systemd_dir, SERVICE_NAME)
+        self.wants_link = os.path.join(systemd_dir, "multi-user.target.wants", SERVICE_NAME)
+
+    def exists(self, filename):
+        return self.transport.exists(os.path.join(self.rules_dir, filename))
+
+    def save(self, contents, service=SERVICE_CONTENT):
+        started = time.perf_counter()
+        report = SaveReport()
+        for filename, text in contents.items():
+            path, data = os.path.join(self.rules_dir, filename), text.encode()
+            if self.transport.file_digest(path) == digest(data):
+                report.unchanged.append(path)
+                continue
+            self.transport.write_file(path, data)
+            report.written.append(path)
+        self._ensure_service(report, service)
+        report.elapsed = time.perf_counter() - started
+        return report
+
+    def _ensure_service(self, report, service):
+        data = service.encode()
+        if self.transport.file_digest(self.unit_path) != digest(data):
+            self.transport.write_file(self.unit_path, data)
+            self.transport.run(["systemctl", "daemon-reload"], check=True)
+            report.unit_updated = True
+        if not self.transport.exists(self.wants_link):
+            self.transport.run(["systemctl", "enable", SERVICE_NAME], check=True, capture_output=True)
+            report.enabled = True
+
+    def disable(self):
+        if not self.transport.exists(self.unit_path) and not self.transport.exists(self.wants_link): return False
+        self.transport.run(["systemctl", "disable", SERVICE_NAME], capture_output=True)
+        self.transport.remove(self.unit_path)
+        self.transport.run(["systemctl", "daemon-reload"], check=True)
+        return True
@@ -0,0 +1,192 @@
+import functools
+import os
+import subprocess
+import threading
+import time
+from contextlib import contextmanager
+
+# None unless profiling was requested: every hook below checks this once and otherwise stays out of the way.
+_profiler = None
+
+class _NullSpan:
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        return False
+
+NULL_SPAN = _NullSpan()
+
+class _Span:
+    __slots__ = ("profiler", "name", "started")
+
+    def __init__(self, profiler, name):
+        self.profiler = profiler
+        self.name = name
+
+    def __enter__(self):
+        self.started = time.perf_counter()
+        return self
+
+    def __exit__(self, *exc):
+        self.profiler.add_span(self.name, self.started, time.perf_counter() - self.started)
+        return False
+
+class Profiler:
+    def __init__(self):
+        self.origin = time.perf_counter()
+        self.lock = threading.Lock()
+        self.events = []
+        self.spans = {}
+        self.processes = {}
+        self.last = None
+
+    def add_span(self, name, started, elapsed, args=None):
+        with self.lock:
+            self.events.append((name, started, elapsed, threading.get_ident(), args))
+            stats = self.spans.setdefault(name, [0, 0.0, 0.0])
+            stats[0] += 1
+            stats[1] += elapsed
+            stats[2] = max(stats[2], elapsed)
+            if not name.startswith("exec:"): self.last = (name, elapsed)
+
+    def add_process(self, argv, started, elapsed, sent, received):
+        command = os.path.basename(str(argv[0] if isinstance(argv, (list, tuple)) else argv.split()[0]))
+        with self.lock:
+            stats = self.processes.setdefault(command, [0, 0.0, 0, 0])
+            stats[0] += 1
+            stats[1] += elapsed
+            stats[2] += sent
+            stats[3] += received
+        self.add_span(f"exec:{command}", started, elapsed, {"sent": sent, "received": received})
+
+    def summary(self):
+        with self.lock:
+            count = sum(s[0] for s in self.processes.values())
+            seconds = sum(s[1] for s in self.processes.values())
+            transferred = sum(s[2] + s[3] for s in self.processes.values())
+            last = self.last
+        text = f"processi: {count} in {seconds * 1000:.0f} ms, {transferred / 1024:.0f} KB"
+        return f"{last[0]} {last[1] * 1000:.0f} ms | {text}" if last else text
+
+    def report(self):
+        with self.lock:
+            spans, processes = dict(self.spans), dict(self.processes)
+        lines = [f"{'OPERAZIONE':<28} {'N':>6} {'TOTALE ms':>10} {'MAX ms':>9}"]
+        for name, (count, total, worst) in sorted(spans.items(), key=lambda item: -item[1][1]):
+            if not name.startswith("exec:"): lines.append(f"{name:<28} {count:>6} {total * 1000:>10.1f} {worst * 1000:>9.1f}")
+        lines.append(f"{'PROCESSO':<28} {'N':>6} {'TOTALE ms':>10} {'KB IN/OUT':>9}")
+        for command, (count, total, sent, received) in sorted(processes.items(), key=lambda item: -item[1][1]):
+            lines.append(f"{command:<28} {count:>6} {total * 1000:>10.1f} {sent / 1024:>4.1f}/{received / 1024:.1f}")
+        return "\n".join(lines)
+
+    def chrome_trace(self):
+        with self.lock: events = list(self.events)
+        trace = []
+        for name, started, elapsed, thread, args in events:
+            event = {"name": name, "cat": "exec" if name.startswith("exec:") else "forge", "ph": "X",
+                     "ts": (started - self.origin) * 1e6, "dur": elapsed * 1e6, "pid": os.getpid(), "tid": thread}
+            if args: event["args"] = args
+            trace.append(event)
+        return {"traceEvents": trace, "displayTimeUnit": "ms"}
+
+def enable():
+    global _profiler
+    _profiler = Profiler()
+    return _profiler
+
+def disable():
+    global _profiler
+    _profiler = None
+
+def current():
+    return _profiler
+
+def span(name):
+    return NULL_SPAN if _profiler is None else _Span(_profiler, name)
+
+def traced(name):
+    def decorate(fn):
+        @functools.wraps(fn)
+        def wrapper(*args, **kwargs):
+            if _profiler is None: return fn(*args, **kwargs)
+            with _Span(_profiler, name): return fn(*args, **kwargs)
+        return wrapper
+    return decorate
+
+def _size(data):
+    return len(data) if data else 0
+
+def run(argv, **kwargs):
+    # subprocess.run with accounting: invocations, wall time and bytes piped in and out.
+    profiler = _profiler
+    if profiler is None: return subprocess.run(argv, **kwargs)
+    started = time.perf_counter()
+    try:
+        result = subprocess.run(argv, **kwargs)
+    except subprocess.CalledProcessError as e:
+        profiler.add_process(argv, started, time.perf_counter() - started, _size(kwargs.get("input")),
+                             _size(e.stdout) + _size(e.stderr))
+        raise
+    profiler.add_process(argv, started, time.perf_counter() - started, _size(kwargs.get("input")),
+                         _size(result.stdout) + _size(result.stderr))
+    return result
+
+class Stream:
+    # A subprocess whose stdout is consumed line by line, e.g. `iptables-save`, with the same accounting as run().
+    def __init__(self, argv):
+        self.argv = argv
+        self.received = 0
+
+    def __enter__(self):
+        self.profiler = _profiler
+        self.started = time.perf_counter()
+        self.proc = subprocess.Popen(self.argv, stdout=subprocess.PIPE, stderr=subprocess.DEVNULL, text=True)
+        self.proc.__enter__()
+        return self
+
+    def __iter__(self):
+        if self.profiler is None: return iter(self.proc.stdout)
+        return self._counted()
+
+    def _counted(self):
+        for line in self.proc.stdout:
+            self.received += len(line)
+            yield line
+
+    def readlines(self):
+        return list(self)
+
+    @property
+    def returncode(self):
+        return self.proc.returncode
+
+    def __exit__(self, *exc):
+        self.proc.__exit__(*exc)
+        if self.profiler is not None:
+            self.profiler.add_process(self.argv, self.started, time.perf_counter() - self.started, 0, self.received)
+        return False
+
+@contextmanager
+def session(path=None):
+    # --profile FILE: a .json path gets a Chrome trace (chrome://tracing, Perfetto) of every span and subprocess
+    # on every thread; any other path gets cProfile stats of the main thread, readable with pstats or snakeviz.
+    if not path:
+        yield None
+        return
+    profiler = enable()
+    cprofile = None
+    if not path.endswith(".json"):
+        import cProfile
+        cprofile = cProfile.Profile()
+        cprofile.enable()
+    try:
+        yield profiler
+    finally:
+        if cprofile is not None:
+            cprofile.disable()
+            cprofile.dump_stats(path)
+        else:
+            import json
+            with open(path, "w") as f: json.dump(profiler.chrome_trace(), f)
+        disable()
@@ -0,0 +1,92 @@
+from sys import intern
+
+ANY_ADDRS = ("0.0.0.0/0", "::/0", "anywhere", "any")
+
+def quote(token, force=False):
+    if token and not force and not any(c in token for c in ' \t"\''): return token
+    return '"' + token.replace("\\", "\\\\").replace('"', '\\"') + '"'
+
+def _option(parts, flag, value):
+    if value.startswith("!"): parts.extend(["!", flag, value[1:].strip()])
+    else: parts.extend([flag, value])
+
+class Rule:
+    # Treated as immutable once built: edits create a new Rule, so the cached key stays valid.
+    __slots__ = ("table", "chain", "protocol", "source", "destination", "target", "sport", "dport",
+                 "state", "comment", "in_iface", "out_iface", "extra", "target_extra", "pkts", "bytes", "_key")
+    FIELDS = ("table", "chain", "protocol", "source", "destination", "sport", "dport", "state",
+              "in_iface", "out_iface", "comment", "target", "extra", "target_extra")
+
+    def __init__(self, chain, protocol="all", source="any", destination="any",
+                 target="ACCEPT", sport=None, dport=None, state=None,
+                 comment="", table='filter', in_iface=None, out_iface=None,
+                 extra=(), target_extra=(), pkts=0, bytes=0):
+        self.table = intern(table)
+        self.chain = intern(chain)
+        self.protocol = intern(protocol)
+        self.source = source
+        self.destination = destination
+        self.target = intern(target)
+        self.sport = sport
+        self.dport = dport
+        self.state = intern(state) if state else state
+        self.comment = comment
+        self.in_iface = in_iface
+        self.out_iface = out_iface
+        self.extra = tuple(extra)
+        self.target_extra = tuple(target_extra)
+        self.pkts = pkts
+        self.bytes = bytes
+        self._key = None
+
+    @classmethod
+    def from_dict(cls, data):
+        if not isinstance(data, dict) or "chain" not in data: raise ValueError(f"regola senza chain: {data!r}")
+        unknown = set(data) - set(cls.FIELDS)
+        if unknown: raise ValueError(f"campi sconosciuti: {', '.join(sorted(unknown))}")
+        fields = dict(data)
+        for port in ("sport", "dport"):
+            if fields.get(port) is not None: fields[port] = str(fields[port])
+        return cls(**fields)
+
+    def to_dict(self):
+        data = {}
+        for field in self.FIELDS:
+            value = getattr(self, field)
+            if value in (None, "", ()) or field == "protocol" and value == "all": continue
+            if field in ("source", "destination") and value in ANY_ADDRS: continue
+            data[field] = list(value) if isinstance(value, tuple) else value
+        return data
+
+    @property
+    def key(self):
+        if self._key is None: self._key = f"{self.table} -A {self.chain} {self.spec()}"
+        return self._key
+
+    def __eq__(self, other):
+        return isinstance(other, Rule) and self.key == other.key
+
+    def __hash__(self):
+        return hash(self.key)
+
+    def __str__(self):
+        return f"-A {self.chain} {self.spec()}"
+
+    def spec(self):
+        parts = []
+        if self.protocol and self.protocol != "all": _option(parts, "-p", self.protocol)
+        if self.source and self.source not in ANY_ADDRS: _option(parts, "-s", self.source)
+        if self.destination and self.destination not in ANY_ADDRS: _option(parts, "-d", self.destination)
+        if self.in_iface: _option(parts, "-i", self.in_iface)
+        if self.out_iface: _option(parts, "-o", self.out_iface)
+        for flag, value in (("sport", self.sport), ("dport", self.dport)):
+            if not value: continue
+            value = str(value)
+            if "," in value: parts.extend(["-m", "multiport"]); _option(parts, f"--{flag}s", value)
+            else: _option(parts, f"--{flag}", value)
+        if self.state: parts.extend(["-m", "state"]); _option(parts, "--state", self.state)
+        parts.extend(quote(t) for t in self.extra)
+        if self.comment: parts.extend(["-m", "comment", "--comment", quote(self.comment, force=True)])
+        if self.target: parts.extend(["-j", self.target])
+        parts.extend(quote(t) for t in self.target_extra)
+        return " ".join(parts)
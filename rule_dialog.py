@@ -3,6 +3,7 @@ from PyQt6.QtWidgets import QDialog, QVBoxLayout, QFormLayout, QLineEdit, QCombo
 class RuleDialog(QDialog):
     def __init__(self, parent=None, rule=None):
         super().__init__(parent)
+        self.rule = rule
         self.setWindowTitle("Dettagli Regola")
         self.setMinimumWidth(480)
         
@@ -47,6 +48,7 @@ class RuleDialog(QDialog):
         self.dport_input = QLineEdit()
         self.state_input = QLineEdit()
         self.target_cb = QComboBox()
+        self.target_cb.setEditable(True)
         self.target_cb.addItems(["ACCEPT", "DROP", "REJECT", "LOG", "MASQUERADE", "DNAT", "SNAT"])
         self.comment_input = QLineEdit()
 
@@ -98,5 +100,10 @@ class RuleDialog(QDialog):
             sport=self.sport_input.text() or None,
             dport=self.dport_input.text() or None,
             state=self.state_input.text() or None,
-            comment=self.comment_input.text()
+            comment=self.comment_input.text(),
+            in_iface=self.rule.in_iface if self.rule else None,
+            out_iface=self.rule.out_iface if self.rule else None,
+            extra=self.rule.extra if self.rule else (),
+            # Target options (--reject-with, --to-destination...) only make sense for the target they came with.
+            target_extra=self.rule.target_extra if self.rule and self.target_cb.currentText() == self.rule.target else ()
         )
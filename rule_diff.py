@@ -0,0 +1,98 @@
+MAX_EDIT_DISTANCE = 2000
+
+class ChainOp:
+    # action is -R/-D/-I on a rule position, or ":" to declare a chain with a policy ("-" for a user chain).
+    __slots__ = ("action", "table", "chain", "position", "rule", "policy")
+
+    def __init__(self, action, table, chain, position, rule=None, policy=None):
+        self.action = action
+        self.table = table
+        self.chain = chain
+        self.position = position
+        self.rule = rule
+        self.policy = policy
+
+    def __str__(self):
+        if self.action == ":": return f":{self.chain} {self.policy}"
+        if self.action == "-D": return f"-D {self.chain} {self.position}"
+        return f"{self.action} {self.chain} {self.position} {self.rule.spec()}"
+
+    def __repr__(self):
+        return f"<ChainOp [{self.table}] {self}>"
+
+def _myers(a, b, max_d):
+    n, m = len(a), len(b)
+    v = {1: 0}
+    trace = []
+    for d in range(min(n + m, max_d) + 1):
+        trace.append(dict(v))
+        for k in range(-d, d + 1, 2):
+            if k == -d or (k != d and v[k - 1] < v[k + 1]): x = v[k + 1]
+            else: x = v[k - 1] + 1
+            y = x - k
+            while x < n and y < m and a[x] == b[y]: x += 1; y += 1
+            v[k] = x
+            if x >= n and y >= m: return _backtrack(trace, n, m)
+    return None
+
+def _backtrack(trace, x, y):
+    edits = []
+    for d in range(len(trace) - 1, -1, -1):
+        v, k = trace[d], x - y
+        prev_k = k + 1 if k == -d or (k != d and v[k - 1] < v[k + 1]) else k - 1
+        prev_x = v[prev_k]
+        prev_y = prev_x - prev_k
+        while x > prev_x and y > prev_y:
+            edits.append(("=", x - 1, y - 1)); x -= 1; y -= 1
+        if d > 0:
+            edits.append(("+", x, y - 1) if x == prev_x else ("-", x - 1, y))
+        x, y = prev_x, prev_y
+    edits.reverse()
+    return edits
+
+def edit_script(a, b, max_d=MAX_EDIT_DISTANCE):
+    start, end_a, end_b = 0, len(a), len(b)
+    while start < end_a and start < end_b and a[start] == b[start]: start += 1
+    while end_a > start and end_b > start and a[end_a - 1] == b[end_b - 1]: end_a -= 1; end_b -= 1
+    script = [("=", i, i) for i in range(start)]
+    middle = _myers(a[start:end_a], b[start:end_b], max_d)
+    if middle is None:
+        middle = [("-", i, 0) for i in range(end_a - start)] + [("+", 0, j) for j in range(end_b - start)]
+    script.extend((tag, i + start, j + start) for tag, i, j in middle)
+    script.extend(("=", end_a + i, end_b + i) for i in range(len(a) - end_a))
+    return script
+
+def diff_chain(table, chain, old, new, max_d=MAX_EDIT_DISTANCE):
+    script = edit_script([r.key for r in old], [r.key for r in new], max_d)
+    ops, pos, dels, ins = [], 1, [], []
+
+    def flush_run():
+        nonlocal pos
+        paired = min(len(dels), len(ins))
+        for j in ins[:paired]:
+            ops.append(ChainOp("-R", table, chain, pos, new[j])); pos += 1
+        for _ in dels[paired:]: ops.append(ChainOp("-D", table, chain, pos))
+        for j in ins[paired:]:
+            ops.append(ChainOp("-I", table, chain, pos, new[j])); pos += 1
+        dels.clear(); ins.clear()
+
+    for tag, i, j in script:
+        if tag == "=":
+            flush_run()
+            pos += 1
+        elif tag == "-": dels.append(i)
+        else: ins.append(j)
+    flush_run()
+    return ops
+
+def group_by_chain(rules):
+    grouped = {}
+    for r in rules: grouped.setdefault((r.table, r.chain), []).append(r)
+    return grouped
+
+def diff_rules(old_rules, new_rules, max_d=MAX_EDIT_DISTANCE):
+    old, new = group_by_chain(old_rules), group_by_chain(new_rules)
+    ops = []
+    for table, chain in dict.fromkeys([*old, *new]):
+        ops.extend(diff_chain(table, chain, old.get((table, chain), []), new.get((table, chain), []), max_d))
+    return ops
@@ -0,0 +1,244 @@
+import ipaddress
+import re
+from bisect import bisect_left, insort
+from functools import lru_cache
+
+from rule import ANY_ADDRS
+
+_WORD = re.compile(r"[^\s\"',;()\[\]]+")
+_ENDPOINT = re.compile(r"^(?P<addr>[0-9.]+(?:/\d+)?|\[[0-9a-fA-F:.]+(?:/\d+)?\])?:(?P<port>\d+)(?:/(?P<proto>\w+))?$")
+_PORT_PROTO = re.compile(r"^(?P<port>\d+)/(?P<proto>\w+)$")
+
+@lru_cache(maxsize=65536)
+def parse_network(value):
+    if not value or value in ANY_ADDRS or value.startswith("!"): return None
+    addr, _, plen = value.strip("[]").partition("/")
+    octets = addr.split(".")
+    if len(octets) == 4 and all(o.isdigit() and int(o) < 256 for o in octets) and (not plen or plen.isdigit() and int(plen) <= 32):
+        a, b, c, d = map(int, octets)
+        plen = int(plen) if plen else 32
+        return 4, ((a << 24 | b << 16 | c << 8 | d) >> (32 - plen)) << (32 - plen), plen, 32
+    try: net = ipaddress.ip_network(value.strip("[]"), strict=False)
+    except ValueError: return None
+    return net.version, int(net.network_address), net.prefixlen, net.max_prefixlen
+
+def parse_ports(value):
+    if not value or str(value).startswith("!"): return None
+    ranges = []
+    for item in str(value).split(","):
+        lo, _, hi = item.partition(":")
+        try: ranges.append((int(lo or 0), int(hi or (65535 if _ else lo))))
+        except ValueError: return None
+    return ranges
+
+class PrefixIndex:
+    # A binary prefix trie flattened per prefix length: every populated length keeps a dict of
+    # network -> rule ids plus the sorted networks, so a lookup walks only the lengths in use.
+    def __init__(self):
+        self.levels = {4: {}, 6: {}}
+        self.sorted_keys = {4: {}, 6: {}}
+        self.wildcard = set()
+
+    def _slot(self, net):
+        version, value, plen, bits = net
+        return self.levels[version], self.sorted_keys[version], plen, value >> (bits - plen)
+
+    def add(self, net, rid):
+        if net is None:
+            self.wildcard.add(rid)
+            return
+        levels, keys, plen, key = self._slot(net)
+        bucket = levels.setdefault(plen, {})
+        if key not in bucket:
+            bucket[key] = set()
+            insort(keys.setdefault(plen, []), key)
+        bucket[key].add(rid)
+
+    def discard(self, net, rid):
+        if net is None:
+            self.wildcard.discard(rid)
+            return
+        levels, keys, plen, key = self._slot(net)
+        ids = levels.get(plen, {}).get(key)
+        if ids is None: return
+        ids.discard(rid)
+        if not ids:
+            del levels[plen][key]
+            level_keys = keys[plen]
+            del level_keys[bisect_left(level_keys, key)]
+
+    def containing(self, net):
+        version, value, prefixlen, bits = net
+        hits = set()
+        for plen, bucket in self.levels[version].items():
+            if plen <= prefixlen:
+                ids = bucket.get(value >> (bits - plen))
+                if ids: hits |= ids
+        return hits
+
+    def overlapping(self, net):
+        version, value, prefixlen, bits = net
+        hits = self.containing(net)
+        for plen, level_keys in self.sorted_keys[version].items():
+            if plen <= prefixlen: continue
+            shift = plen - prefixlen
+            lo = (value >> (bits - prefixlen)) << shift
+            bucket = self.levels[version][plen]
+            for key in level_keys[bisect_left(level_keys, lo):bisect_left(level_keys, lo + (1 << shift))]:
+                hits |= bucket[key]
+        return hits
+
+PORT_SPACE = 1 << 16
+
+def _port_nodes(lo, hi):
+    # The O(log n) canonical nodes of a segment tree over all ports (heap numbered, leaves at PORT_SPACE + port)
+    # whose spans tile lo..hi exactly.
+    lo, hi = max(lo, 0) + PORT_SPACE, min(hi, PORT_SPACE - 1) + PORT_SPACE + 1
+    while lo < hi:
+        if lo & 1:
+            yield lo
+            lo += 1
+        if hi & 1:
+            hi -= 1
+            yield hi
+        lo >>= 1; hi >>= 1
+
+class PortIndex:
+    # A segment tree over the port space: a range is stored on the nodes that tile it, so a port lookup only
+    # visits the nodes on its leaf-to-root path, whatever the number of ranges indexed.
+    def __init__(self):
+        self.nodes = {}
+        self.wildcard = set()
+
+    def add(self, ranges, rid):
+        if ranges is None:
+            self.wildcard.add(rid)
+            return
+        for lo, hi in ranges:
+            for node in _port_nodes(lo, hi): self.nodes.setdefault(node, set()).add(rid)
+
+    def discard(self, ranges, rid):
+        if ranges is None:
+            self.wildcard.discard(rid)
+            return
+        for lo, hi in ranges:
+            for node in _port_nodes(lo, hi):
+                ids = self.nodes.get(node)
+                if ids is not None:
+                    ids.discard(rid)
+                    if not ids: del self.nodes[node]
+
+    def containing(self, port):
+        hits, node = set(), port + PORT_SPACE
+        if not 0 <= port < PORT_SPACE: return hits
+        while node:
+            ids = self.nodes.get(node)
+            if ids: hits |= ids
+            node >>= 1
+        return hits
+
+class TextIndex:
+    def __init__(self):
+        self.postings = {}
+        self.vocabulary = []
+
+    @staticmethod
+    def words(rule):
+        return {w.lower() for w in _WORD.findall(f"{rule.comment or ''} {rule.target} {rule.chain}")}
+
+    def add(self, rule, rid):
+        for word in self.words(rule):
+            if word not in self.postings:
+                self.postings[word] = set()
+                insort(self.vocabulary, word)
+            self.postings[word].add(rid)
+
+    def discard(self, rule, rid):
+        for word in self.words(rule):
+            ids = self.postings.get(word)
+            if ids is None: continue
+            ids.discard(rid)
+            if not ids:
+                del self.postings[word]
+                del self.vocabulary[bisect_left(self.vocabulary, word)]
+
+    def prefix(self, term):
+        term = term.lower()
+        hits = set()
+        for word in self.vocabulary[bisect_left(self.vocabulary, term):]:
+            if not word.startswith(term): break
+            hits |= self.postings[word]
+        return hits
+
+class RuleIndex:
+    def __init__(self):
+        self.rules = {}
+        self.sources = PrefixIndex()
+        self.destinations = PrefixIndex()
+        self.sports = PortIndex()
+        self.dports = PortIndex()
+        self.protocols = {}
+        self.text = TextIndex()
+
+    def rule_added(self, rule):
+        rid = id(rule)
+        self.rules[rid] = rule
+        self.sources.add(parse_network(rule.source), rid)
+        self.destinations.add(parse_network(rule.destination), rid)
+        self.sports.add(parse_ports(rule.sport), rid)
+        self.dports.add(parse_ports(rule.dport), rid)
+        self.protocols.setdefault(rule.protocol or "all", set()).add(rid)
+        self.text.add(rule, rid)
+
+    def rule_removed(self, rule):
+        rid = id(rule)
+        if self.rules.pop(rid, None) is None: return
+        self.sources.discard(parse_network(rule.source), rid)
+        self.destinations.discard(parse_network(rule.destination), rid)
+        self.sports.discard(parse_ports(rule.sport), rid)
+        self.dports.discard(parse_ports(rule.dport), rid)
+        self.protocols[rule.protocol or "all"].discard(rid)
+        self.text.discard(rule, rid)
+
+    def _addr_matches(self, index, value):
+        net = parse_network(value)
+        if net is None: raise ValueError(f"Indirizzo non valido: {value}")
+        return index.containing(net) | index.wildcard
+
+    def _port_matches(self, index, value):
+        if not value.isdigit(): raise ValueError(f"Porta non valida: {value}")
+        return index.containing(int(value)) | index.wildcard
+
+    def _proto_matches(self, proto):
+        return self.protocols.get(proto.lower(), set()) | self.protocols.get("all", set())
+
+    def _mentions(self, value):
+        net = parse_network(value)
+        return self.sources.overlapping(net) | self.destinations.overlapping(net)
+
+    def _term(self, term):
+        key, sep, value = term.partition(":")
+        key = key.lower()
+        if sep and key in ("src", "dst", "sport", "dport", "port", "proto"):
+            if key == "src": return self._addr_matches(self.sources, value)
+            if key == "dst": return self._addr_matches(self.destinations, value)
+            if key == "sport": return self._port_matches(self.sports, value)
+            if key == "proto": return self._proto_matches(value)
+            return self._port_matches(self.dports, value)
+        endpoint = _ENDPOINT.match(term) or _PORT_PROTO.match(term)
+        if endpoint:
+            parts = endpoint.groupdict()
+            hits = self._port_matches(self.dports, parts["port"])
+            if parts.get("addr"): hits &= self._addr_matches(self.destinations, parts["addr"])
+            if parts.get("proto"): hits &= self._proto_matches(parts["proto"])
+            return hits
+        if parse_network(term) is not None: return self._mentions(term)
+        return self.text.prefix(term)
+
+    def search(self, query):
+        hits = None
+        for term in query.split():
+            ids = self._term(term)
+            hits = ids if hits is None else hits & ids
+            if not hits: break
+        return hits if hits is not None else set(self.rules)
@@ -0,0 +1,148 @@
+from contextlib import nullcontext
+
+from PyQt6.QtCore import Qt, QAbstractTableModel, QModelIndex, QMimeData
+from PyQt6.QtGui import QColor
+
+from rule_store import RuleStore
+
+ALL_CHAINS = "TUTTE LE CHAIN"
+ROW_MIME = "application/x-forge-rule-row"
+
+class RuleTableModel(QAbstractTableModel):
+    HEADERS = ["TABELLA", "CHAIN", "PROTO", "SORGENTE", "S.PORT", "DEST", "D.PORT", "STATO", "COMMENTO", "AZIONE"]
+    TARGET_COLORS = {"ACCEPT": QColor("#40c057"), "DROP": QColor("#fa5252"), "REJECT": QColor("#fa5252")}
+
+    def __init__(self, rules=None, parent=None):
+        super().__init__(parent)
+        self.rules = rules if rules is not None else RuleStore()
+        self.chain_filter = ALL_CHAINS
+        self.search_ids = None
+        self.rows = self.rules
+
+    def set_rules(self, rules):
+        self.beginResetModel()
+        self.rules = rules
+        self._refilter()
+        self.endResetModel()
+
+    def set_chain_filter(self, chain):
+        self.set_filters(chain, self.search_ids)
+
+    def set_filters(self, chain, search_ids=None):
+        self.beginResetModel()
+        self.chain_filter = chain
+        self.search_ids = search_ids
+        self._refilter()
+        self.endResetModel()
+
+    def _refilter(self):
+        rows = self.rules if self.chain_filter == ALL_CHAINS else self.rules.chain_rules(self.chain_filter)
+        if self.search_ids is not None:
+            ids = self.search_ids
+            if len(ids) * 8 < len(rows): rows = sorted((r for r in self.rules.lookup(ids) if self._visible(r)), key=self.rules.index)
+            else: rows = [r for r in rows if id(r) in ids]
+        self.rows = rows
+
+    def _visible(self, rule):
+        return (self.chain_filter == ALL_CHAINS or rule.chain == self.chain_filter) and \
+            (self.search_ids is None or id(rule) in self.search_ids)
+
+    def rule_at(self, row):
+        return self.rows[row]
+
+    def rowCount(self, parent=QModelIndex()):
+        return 0 if parent.isValid() else len(self.rows)
+
+    def columnCount(self, parent=QModelIndex()):
+        return 0 if parent.isValid() else len(self.HEADERS)
+
+    def headerData(self, section, orientation, role=Qt.ItemDataRole.DisplayRole):
+        if role == Qt.ItemDataRole.DisplayRole and orientation == Qt.Orientation.Horizontal:
+            return self.HEADERS[section]
+        return None
+
+    def data(self, index, role=Qt.ItemDataRole.DisplayRole):
+        if not index.isValid(): return None
+        r, col = self.rows[index.row()], index.column()
+        if role == Qt.ItemDataRole.DisplayRole:
+            vals = (r.table, r.chain, r.protocol, r.source, r.sport, r.destination, r.dport, r.state, r.comment, r.target)
+            return str(vals[col] or "")
+        if role == Qt.ItemDataRole.TextAlignmentRole: return Qt.AlignmentFlag.AlignCenter
+        if role == Qt.ItemDataRole.ForegroundRole and col == 9: return self.TARGET_COLORS.get(r.target)
+        return None
+
+    def flags(self, index):
+        base = Qt.ItemFlag.ItemIsEnabled | Qt.ItemFlag.ItemIsSelectable | Qt.ItemFlag.ItemIsDragEnabled
+        return base if index.isValid() else Qt.ItemFlag.ItemIsDropEnabled
+
+    def supportedDropActions(self):
+        return Qt.DropAction.MoveAction
+
+    def mimeTypes(self):
+        return [ROW_MIME]
+
+    def mimeData(self, indexes):
+        mime = QMimeData()
+        mime.setData(ROW_MIME, str(indexes[0].row()).encode())
+        return mime
+
+    def dropMimeData(self, mime, action, row, column, parent):
+        if action != Qt.DropAction.MoveAction or not mime.hasFormat(ROW_MIME): return False
+        src = int(bytes(mime.data(ROW_MIME)).decode())
+        # `row` is the gap the item is dropped into, counted before the move: below the source it shifts up by one
+        # once the source is taken out. Dropped onto a row, the item takes that row's place; past the end, it goes last.
+        if row == -1: dst = parent.row() if parent.isValid() else len(self.rows) - 1
+        else: dst = row - 1 if row > src else row
+        self.move_row(src, min(dst, len(self.rows) - 1))
+        # The move is already done: returning False stops the view from removing the source row.
+        return False
+
+    def _step(self, label):
+        # Groups the store changes of one edit into one undo step when a history is attached.
+        journal = self.rules.journal
+        return nullcontext() if journal is None else journal.step(label)
+
+    def append_rule(self, rule):
+        with self._step("aggiunta"): self._append_rule(rule)
+
+    def _append_rule(self, rule):
+        if self.rows is self.rules:
+            self.beginInsertRows(QModelIndex(), len(self.rows), len(self.rows))
+            self.rules.append(rule)
+            self.endInsertRows()
+            return
+        self.rules.append(rule)
+        if self._visible(rule):
+            self.beginInsertRows(QModelIndex(), len(self.rows), len(self.rows))
+            self.rows.append(rule)
+            self.endInsertRows()
+
+    def replace_row(self, row, rule):
+        with self._step("modifica"): self.rules.replace(self.rows[row], rule)
+        if self.rows is not self.rules:
+            if self._visible(rule): self.rows[row] = rule
+            else:
+                self.beginRemoveRows(QModelIndex(), row, row)
+                del self.rows[row]
+                self.endRemoveRows()
+                return
+        self.dataChanged.emit(self.index(row, 0), self.index(row, len(self.HEADERS) - 1))
+
+    def remove_row(self, row):
+        rule = self.rows[row]
+        self.beginRemoveRows(QModelIndex(), row, row)
+        if self.rows is not self.rules: del self.rows[row]
+        with self._step("rimozione"): self.rules.remove(rule)
+        self.endRemoveRows()
+
+    def move_row(self, src, dst):
+        if src == dst or not (0 <= src < len(self.rows) and 0 <= dst < len(self.rows)): return
+        # Qt expects the destination as the row the item lands before, in pre-move coordinates.
+        self.beginMoveRows(QModelIndex(), src, src, QModelIndex(), dst + 1 if dst > src else dst)
+        with self._step("spostamento"):
+            if self.rows is self.rules:
+                self.rules.move(src, dst)
+            else:
+                self.rules.move(self.rules.index(self.rows[src]), self.rules.index(self.rows[dst]))
+                self.rows.insert(dst, self.rows.pop(src))
+        self.endMoveRows()
@@ -0,0 +1,193 @@
+import hashlib
+
+from rule import Rule, ANY_ADDRS
+from rule_diff import group_by_chain
+from rule_index import PrefixIndex, PortIndex, parse_network, parse_ports
+
+TERMINAL_TARGETS = {"ACCEPT", "DROP", "REJECT", "RETURN", "DNAT", "SNAT", "MASQUERADE", "REDIRECT"}
+MIN_SET_SIZE = 4
+REORDER_LIMIT = 5000
+
+def _negated(value):
+    return isinstance(value, str) and value.startswith("!")
+
+def _match_fields(rule):
+    return (rule.protocol, rule.source, rule.destination, rule.sport, rule.dport, rule.state,
+            rule.in_iface, rule.out_iface, rule.extra)
+
+class Match:
+    __slots__ = ("rule", "protocol", "source", "destination", "sport", "dport", "state", "opaque")
+
+    def __init__(self, rule):
+        self.rule = rule
+        self.protocol = None if rule.protocol in (None, "", "all") or _negated(rule.protocol) else rule.protocol
+        self.source = parse_network(rule.source)
+        self.destination = parse_network(rule.destination)
+        self.sport = parse_ports(rule.sport)
+        self.dport = parse_ports(rule.dport)
+        self.state = None if not rule.state or _negated(rule.state) else frozenset(rule.state.split(","))
+        # Negations, hostnames and odd port syntax are not modelled: such rules only cover identical matches.
+        self.opaque = any(_negated(v) for v in _match_fields(rule)[:8]) or \
+            (rule.source not in ANY_ADDRS + ("", None) and self.source is None) or \
+            (rule.destination not in ANY_ADDRS + ("", None) and self.destination is None) or \
+            (bool(rule.sport) and self.sport is None) or (bool(rule.dport) and self.dport is None)
+
+def _net_contains(outer, inner):
+    if outer is None: return True
+    if inner is None or outer[0] != inner[0] or outer[2] > inner[2]: return False
+    shift = outer[3] - outer[2]
+    return outer[1] >> shift == inner[1] >> shift
+
+def _nets_disjoint(a, b):
+    return a is not None and b is not None and not _net_contains(a, b) and not _net_contains(b, a)
+
+def _ports_contain(outer, inner):
+    if outer is None: return True
+    return inner is not None and all(any(lo >= o_lo and hi <= o_hi for o_lo, o_hi in outer) for lo, hi in inner)
+
+def _ports_disjoint(a, b):
+    return a is not None and b is not None and not any(lo <= o_hi and o_lo <= hi for lo, hi in a for o_lo, o_hi in b)
+
+def _field_covers(outer, inner):
+    return outer in (None, "", inner)
+
+def covers(a, b):
+    ra, rb = a.rule, b.rule
+    if a.opaque or b.opaque: return _match_fields(ra) == _match_fields(rb)
+    if ra.extra and ra.extra != rb.extra: return False
+    return (a.protocol is None or a.protocol == b.protocol) and \
+        _net_contains(a.source, b.source) and _net_contains(a.destination, b.destination) and \
+        _ports_contain(a.sport, b.sport) and _ports_contain(a.dport, b.dport) and \
+        _field_covers(ra.in_iface, rb.in_iface) and _field_covers(ra.out_iface, rb.out_iface) and \
+        (a.state is None or b.state is not None and b.state <= a.state)
+
+def disjoint(a, b):
+    if a.protocol and b.protocol and a.protocol != b.protocol: return True
+    if _nets_disjoint(a.source, b.source) or _nets_disjoint(a.destination, b.destination): return True
+    if _ports_disjoint(a.sport, b.sport) or _ports_disjoint(a.dport, b.dport): return True
+    for x, y in ((a.rule.in_iface, b.rule.in_iface), (a.rule.out_iface, b.rule.out_iface)):
+        if x and y and x != y and "+" not in x + y and not _negated(x) and not _negated(y): return True
+    return a.state is not None and b.state is not None and not (a.state & b.state)
+
+class Finding:
+    def __init__(self, kind, rule, by=None, detail=""):
+        self.kind = kind
+        self.rule = rule
+        self.by = by
+        self.detail = detail
+
+    def __str__(self):
+        text = f"[{self.kind}] {self.rule.table}/{self.rule}"
+        if self.by is not None: text += f"\n    coperta da: {self.by}"
+        return text + (f"\n    {self.detail}" if self.detail else "")
+
+class OptimizationPlan:
+    def __init__(self):
+        self.findings = []
+        self.rules = []
+        self.ipsets = {}
+        self.moves = 0
+        self.before = {}
+        self.after = {}
+
+    def summary(self):
+        def total(estimate): return sum(v for v in estimate.values())
+        kinds = {}
+        for f in self.findings: kinds[f.kind] = kinds.get(f.kind, 0) + 1
+        lines = [f"{kind}: {count}" for kind, count in sorted(kinds.items())]
+        lines.append(f"ipset generati: {len(self.ipsets)}, regole spostate: {self.moves}")
+        lines.append(f"regole valutate per pacchetto (somma chain): {total(self.before):.1f} -> {total(self.after):.1f}")
+        return "\n".join(lines)
+
+def _find_unreachable(chain_rules, matches, plan):
+    # Earlier terminal rules are indexed by source prefix and destination port: only rules whose
+    # source and dport contain this rule's can cover it, so most pairs are never compared.
+    sources, dports, keep = PrefixIndex(), PortIndex(), []
+    for pos, (rule, match) in enumerate(zip(chain_rules, matches)):
+        candidates = sources.wildcard | (sources.containing(match.source) if match.source else set())
+        candidates &= dports.wildcard | (dports.containing(match.dport[0][0]) if match.dport else set())
+        cover = next((matches[i] for i in sorted(candidates) if covers(matches[i], match)), None)
+        if cover is not None:
+            kind = "ridondante" if cover.rule.target == rule.target else "oscurata"
+            plan.findings.append(Finding(kind, rule, cover.rule))
+            continue
+        keep.append(pos)
+        if rule.target in TERMINAL_TARGETS:
+            sources.add(None if match.opaque else match.source, pos)
+            dports.add(None if match.opaque else match.dport, pos)
+    return keep
+
+def _merge_key(rule):
+    return (rule.protocol, rule.destination, rule.sport, rule.dport, rule.state, rule.in_iface, rule.out_iface,
+            rule.extra, rule.target, rule.target_extra)
+
+def set_name(family, chain, members):
+    # Named after the content: a later run, the other family or another chain never reuses a name for different
+    # members, so creating a set can never change what the rules already pointing at it match (max 31 chars).
+    digest = hashlib.blake2b("\n".join(sorted(members)).encode(), digest_size=4).hexdigest()
+    return f"forge-{family}-{chain.lower()[:10]}-{digest}"
+
+def _sources_disjoint(rules):
+    # Prefixes either nest or do not overlap, so in address order any overlap shows up between neighbours.
+    nets = sorted(parse_network(r.source) for r in rules)
+    return all(a[0] != b[0] or not _net_contains(a, b) for a, b in zip(nets, nets[1:]))
+
+def _merge_runs(table, chain, rules, hits, plan, family):
+    merged, merged_hits, i = [], [], 0
+    while i < len(rules):
+        j = i
+        key = _merge_key(rules[i])
+        while j < len(rules) and _merge_key(rules[j]) == key and parse_network(rules[j].source) is not None \
+                and not rules[j].source.startswith("!"):
+            j += 1
+        # One set rule matches a packet once: a LOG or a jump that returns would have run once per matching member.
+        if j - i >= MIN_SET_SIZE and (rules[i].target in TERMINAL_TARGETS or _sources_disjoint(rules[i:j])):
+            members = [r.source for r in rules[i:j]]
+            name = set_name(family, chain, members)
+            plan.ipsets[name] = ("inet6" if family == "ipv6" else "inet", members)
+            first = rules[i]
+            comments = {r.comment for r in rules[i:j]}
+            merged.append(Rule(chain, first.protocol, "any", first.destination, first.target, first.sport, first.dport,
+                               first.state, comments.pop() if len(comments) == 1 else f"forge: {j - i} regole unite",
+                               table, first.in_iface, first.out_iface, ("-m", "set", "--match-set", name, "src") + first.extra,
+                               first.target_extra))
+            merged_hits.append(sum(hits[i:j]))
+            plan.findings.append(Finding("unibili", first, detail=f"{j - i} regole consecutive -> ipset {name}"))
+            i = j
+        else:
+            merged.append(rules[i]); merged_hits.append(hits[i]); i += 1
+    return merged, merged_hits
+
+def _promote_hot(rules, hits, plan):
+    if len(rules) > REORDER_LIMIT: return rules, hits
+    matches = [Match(r) for r in rules]
+    order = list(range(len(rules)))
+    for i in range(1, len(order)):
+        p = i
+        while p > 0 and hits[order[p]] > hits[order[p - 1]] and disjoint(matches[order[p]], matches[order[p - 1]]):
+            order[p], order[p - 1] = order[p - 1], order[p]
+            p -= 1
+        if p != i: plan.moves += 1
+    return [rules[i] for i in order], [hits[i] for i in order]
+
+def evaluated_per_packet(hits, policy_hits=0):
+    total = sum(hits) + policy_hits
+    if not total: return 0.0
+    return (sum(h * (i + 1) for i, h in enumerate(hits)) + policy_hits * len(hits)) / total
+
+def optimize(rules, hits=None, policy_hits=None, family="ipv4"):
+    hits = hits if hits is not None else [r.pkts for r in rules]
+    policy_hits = policy_hits or {}
+    hit_of = {id(r): h for r, h in zip(rules, hits)}
+    plan = OptimizationPlan()
+    for (table, chain), chain_rules in group_by_chain(rules).items():
+        chain_hits = [hit_of[id(r)] for r in chain_rules]
+        policy = policy_hits.get((table, chain), 0)
+        plan.before[(table, chain)] = evaluated_per_packet(chain_hits, policy)
+        keep = _find_unreachable(chain_rules, [Match(r) for r in chain_rules], plan)
+        kept, kept_hits = [chain_rules[i] for i in keep], [chain_hits[i] for i in keep]
+        kept, kept_hits = _merge_runs(table, chain, kept, kept_hits, plan, family)
+        kept, kept_hits = _promote_hot(kept, kept_hits, plan)
+        plan.after[(table, chain)] = evaluated_per_packet(kept_hits, policy)
+        plan.rules.extend(kept)
+    return plan
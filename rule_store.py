@@ -0,0 +1,120 @@
+from bisect import bisect_left, insort
+from heapq import merge
+
+class RuleStore:
+    # Each rule carries a sortable label, so its position is a bisect over the labels instead of a
+    # list scan. Labels are spaced GAP apart and only renumbered when an insert finds no room.
+    GAP = 1 << 16
+
+    def __init__(self, rules=()):
+        self._rules = list(rules)
+        self._observers = []
+        # Receives every positional change as ("i" | "d", pos, rule); see history.History.
+        self.journal = None
+        self._relabel()
+
+    def __len__(self):
+        return len(self._rules)
+
+    def __iter__(self):
+        return iter(self._rules)
+
+    def __getitem__(self, index):
+        return self._rules[index]
+
+    def __contains__(self, rule):
+        return id(rule) in self._label_of
+
+    def observe(self, observer):
+        self._observers.append(observer)
+        for rule in self._rules: observer.rule_added(rule)
+
+    def index(self, rule):
+        label = self._label_of.get(id(rule))
+        if label is None: raise ValueError(f"rule not in store: {rule}")
+        return bisect_left(self._labels, label)
+
+    def _new_label(self, pos):
+        labels = self._labels
+        if not labels: return 0
+        if pos == 0: return labels[0] - self.GAP
+        if pos == len(labels): return labels[-1] + self.GAP
+        lo, hi = labels[pos - 1], labels[pos]
+        if hi - lo < 2:
+            self._relabel()
+            lo, hi = self._labels[pos - 1], self._labels[pos]
+        return (lo + hi) // 2
+
+    def _relabel(self):
+        self._labels = [i * self.GAP for i in range(len(self._rules))]
+        self._label_of = {id(r): label for r, label in zip(self._rules, self._labels)}
+        self._rule_of = dict(zip(self._labels, self._rules))
+        self._chain_labels = {}
+        for r, label in zip(self._rules, self._labels):
+            self._chain_labels.setdefault((r.table, r.chain), []).append(label)
+
+    def insert(self, pos, rule):
+        if id(rule) in self._label_of: raise ValueError(f"rule already in store: {rule}")
+        pos = max(0, min(pos, len(self._rules)))
+        label = self._new_label(pos)
+        self._rules.insert(pos, rule)
+        self._labels.insert(pos, label)
+        self._label_of[id(rule)] = label
+        self._rule_of[label] = rule
+        insort(self._chain_labels.setdefault((rule.table, rule.chain), []), label)
+        if self.journal is not None: self.journal.record("i", pos, rule)
+        for observer in self._observers: observer.rule_added(rule)
+
+    def append(self, rule):
+        self.insert(len(self._rules), rule)
+
+    def pop(self, pos):
+        rule = self._rules.pop(pos)
+        label = self._labels.pop(pos)
+        del self._label_of[id(rule)]
+        del self._rule_of[label]
+        chain_labels = self._chain_labels[(rule.table, rule.chain)]
+        del chain_labels[bisect_left(chain_labels, label)]
+        if not chain_labels: del self._chain_labels[(rule.table, rule.chain)]
+        if self.journal is not None: self.journal.record("d", pos, rule)
+        for observer in self._observers: observer.rule_removed(rule)
+        return rule
+
+    def remove(self, rule):
+        pos = self.index(rule)
+        self.pop(pos)
+        return pos
+
+    def replace(self, old, new):
+        pos = self.index(old)
+        self.pop(pos)
+        self.insert(pos, new)
+        return pos
+
+    def move(self, src, dst):
+        if src == dst: return
+        self.insert(dst, self.pop(src))
+
+    def lookup(self, ids):
+        return [self._rule_of[self._label_of[rid]] for rid in ids if rid in self._label_of]
+
+    def chain_keys(self):
+        return self._chain_labels.keys()
+
+    def chains(self):
+        return {chain for _, chain in self._chain_labels}
+
+    def chain_rules(self, chain, table=None):
+        keys = [(table, chain)] if table is not None else [k for k in self._chain_labels if k[1] == chain]
+        labels = merge(*(self._chain_labels.get(k, ()) for k in keys))
+        return [self._rule_of[label] for label in labels]
+
+    def chain_index(self, rule):
+        label = self._label_of[id(rule)]
+        return bisect_left(self._chain_labels[(rule.table, rule.chain)], label)
+
+    def by_table_chain(self):
+        data = {}
+        for table, chain in sorted(self._chain_labels, key=lambda k: self._chain_labels[k][0]):
+            data.setdefault(table, {})[chain] = self.chain_rules(chain, table)
+        return data
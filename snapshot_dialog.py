@@ -0,0 +1,93 @@
+import time
+
+from PyQt6.QtGui import QFont
+from PyQt6.QtWidgets import (QDialog, QVBoxLayout, QHBoxLayout, QListWidget, QListWidgetItem, QPlainTextEdit,
+                             QPushButton, QInputDialog, QMessageBox)
+from PyQt6.QtCore import Qt
+
+from rule_diff import diff_rules
+
+MAX_LISTED = 500
+
+class SnapshotDialog(QDialog):
+    def __init__(self, parent, history, rules):
+        super().__init__(parent)
+        self.history = history
+        self.rules = rules
+        self.selected = None
+        self.setWindowTitle(f"Snapshot {history.family.upper()}")
+        self.resize(900, 600)
+
+        layout = QVBoxLayout(self)
+        self.snapshot_list = QListWidget()
+        self.snapshot_list.currentItemChanged.connect(self.compare)
+        layout.addWidget(self.snapshot_list, 1)
+
+        self.details = QPlainTextEdit()
+        self.details.setReadOnly(True)
+        self.details.setFont(QFont("Monospace", 9))
+        layout.addWidget(self.details, 2)
+
+        buttons = QHBoxLayout()
+        new_btn = QPushButton("NUOVO SNAPSHOT")
+        new_btn.clicked.connect(self.create)
+        buttons.addWidget(new_btn)
+        self.drop_btn = QPushButton("ELIMINA")
+        self.drop_btn.clicked.connect(self.drop)
+        buttons.addWidget(self.drop_btn)
+        buttons.addStretch()
+        close_btn = QPushButton("CHIUDI")
+        close_btn.clicked.connect(self.reject)
+        buttons.addWidget(close_btn)
+        self.restore_btn = QPushButton("RIPRISTINA E APPLICA")
+        self.restore_btn.setObjectName("applyButton")
+        self.restore_btn.clicked.connect(self.restore)
+        buttons.addWidget(self.restore_btn)
+        layout.addLayout(buttons)
+        self.refresh_list()
+
+    def refresh_list(self):
+        self.snapshot_list.clear()
+        for name, (node, at) in sorted(self.history.snapshots.items(), key=lambda item: -item[1][1]):
+            item = QListWidgetItem(f"{name}    ({time.strftime('%d/%m/%Y %H:%M', time.localtime(at))}, dopo: {node.label})")
+            item.setData(Qt.ItemDataRole.UserRole, name)
+            self.snapshot_list.addItem(item)
+        if self.snapshot_list.count(): self.snapshot_list.setCurrentRow(0)
+        else: self.details.setPlainText("Nessuno snapshot: NUOVO SNAPSHOT salva lo stato attuale dell'editor.")
+        for btn in (self.drop_btn, self.restore_btn): btn.setEnabled(self.snapshot_list.count() > 0)
+
+    def current_name(self):
+        item = self.snapshot_list.currentItem()
+        return item.data(Qt.ItemDataRole.UserRole) if item else None
+
+    def compare(self, *_):
+        # Only the positions that differ are listed: the operations that restoring would apply.
+        name = self.current_name()
+        if name is None: return
+        try: ops = diff_rules(self.rules, self.history.rules_at(self.history.snapshots[name][0]))
+        except ValueError as e:
+            self.details.setPlainText(str(e))
+            return
+        lines = [f"[{op.table}] {op}" for op in ops[:MAX_LISTED]]
+        if len(ops) > MAX_LISTED: lines.append(f"... e altre {len(ops) - MAX_LISTED} operazioni")
+        self.details.setPlainText(f"{len(ops)} operazioni per tornare a '{name}':\n\n" + "\n".join(lines) if ops
+                                  else f"L'editor coincide con '{name}'.")
+
+    def create(self):
+        name, ok = QInputDialog.getText(self, "Nuovo snapshot", "Nome:", text=time.strftime("prima della manutenzione %d/%m %H:%M"))
+        if not ok or not name.strip(): return
+        self.history.snapshot(name.strip())
+        self.refresh_list()
+
+    def drop(self):
+        name = self.current_name()
+        if name is None: return
+        self.history.drop_snapshot(name)
+        self.refresh_list()
+
+    def restore(self):
+        name = self.current_name()
+        if name is None: return
+        if QMessageBox.question(self, "Ripristino", f"Ripristinare '{name}' e applicarlo al kernel?") != QMessageBox.StandardButton.Yes: return
+        self.selected = self.history.snapshots[name][0]
+        self.accept()
@@ -0,0 +1,93 @@
+import os
+import sys
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import pytest
+
+from cli import build_parser, read_rules
+from iptables_manager import IptablesBackend, IptablesManager
+from transport import FakeTransport, _parse_tables
+
+KERNEL = """*filter
+:INPUT ACCEPT [10:600]
+:FORWARD ACCEPT [0:0]
+:OUTPUT ACCEPT [0:0]
+:DOCKER-USER - [0:0]
+-A INPUT -i lo -j ACCEPT
+-A INPUT -p tcp -m tcp --dport 80 -j ACCEPT
+-A FORWARD -j DOCKER-USER
+-A DOCKER-USER -j RETURN
+COMMIT
+*nat
+:PREROUTING ACCEPT [0:0]
+:INPUT ACCEPT [0:0]
+:OUTPUT ACCEPT [0:0]
+:POSTROUTING ACCEPT [0:0]
+:DOCKER - [0:0]
+-A PREROUTING -m addrtype --dst-type LOCAL -j DOCKER
+-A POSTROUTING -s 172.17.0.0/16 ! -o docker0 -j MASQUERADE
+COMMIT
+"""
+FILE = """*filter
+:INPUT DROP [0:0]
+:FORWARD ACCEPT [0:0]
+:OUTPUT ACCEPT [0:0]
+:DOCKER-USER - [0:0]
+:SSH - [0:0]
+-A INPUT -i lo -j ACCEPT
+-A INPUT -p tcp -m tcp --dport 22 -j SSH
+-A FORWARD -j DOCKER-USER
+-A DOCKER-USER -j RETURN
+-A SSH -s 10.0.0.0/8 -j ACCEPT
+COMMIT
+"""
+
+@pytest.fixture
+def host():
+    return FakeTransport("host", {"ipv4": KERNEL})
+
+def run(host, tmp_path, *argv):
+    path = tmp_path / "rules.v4"
+    path.write_text(FILE)
+    args = build_parser().parse_args([argv[0], str(path), *argv[1:]])
+    return args.handler(IptablesManager(IptablesBackend(host)), args)
+
+def test_apply_save_file_leaves_other_tables_alone(host, tmp_path):
+    assert run(host, tmp_path, "apply") == 0
+    tables = _parse_tables(host.dumps["ipv4"])
+    assert tables["nat"] == _parse_tables(KERNEL)["nat"]
+    manager = IptablesManager(IptablesBackend(host))
+    assert [r.key for r in manager.kernel_rules() if r.table == "filter"] == [r.key for r in read_rules(manager, str(tmp_path / "rules.v4"))[0]]
+
+def test_apply_save_file_sets_policies_and_creates_chains(host, tmp_path):
+    assert run(host, tmp_path, "apply") == 0
+    chains = _parse_tables(host.dumps["ipv4"])["filter"]["chains"]
+    assert chains["INPUT"] == "DROP"
+    assert chains["SSH"] == "-"
+
+def test_diff_lists_policy_changes_only_for_declared_tables(host, tmp_path, capsys):
+    assert run(host, tmp_path, "diff") == 1
+    out = capsys.readouterr().out.splitlines()
+    assert out[:2] == ["[filter] :INPUT DROP", "[filter] :SSH -"]
+    assert not [line for line in out if line.startswith("[nat]")]
+
+def test_existing_user_chain_is_not_redeclared(host, tmp_path):
+    # Redeclaring an existing user chain under --noflush would flush it.
+    path = tmp_path / "rules.v4"
+    path.write_text(FILE)
+    manager = IptablesManager(IptablesBackend(host))
+    ops = manager.plan_changes(*read_rules(manager, str(path)))
+    assert [op.chain for op in ops if op.action == ":"] == ["INPUT", "SSH"]
+    payload, _ = manager.backend.build_noflush_payload(manager.state, ops)
+    assert ":DOCKER-USER" not in payload
+    assert ":INPUT DROP [10:600]" in payload
+
+def test_apply_twice_is_a_no_op(host, tmp_path):
+    assert run(host, tmp_path, "apply") == 0
+    assert run(host, tmp_path, "diff") == 0
+
+def test_persist_refuses_a_failed_read_back(host, tmp_path, monkeypatch):
+    monkeypatch.setattr(IptablesManager, "refresh", lambda self, family=None, force=False: False)
+    monkeypatch.setattr(IptablesManager, "save_to_system", lambda self: pytest.fail("boot files written from a stale read"))
+    assert run(host, tmp_path, "apply", "--persist") == 1
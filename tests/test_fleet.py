@@ -0,0 +1,45 @@
+import os
+import sys
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from fleet import Fleet
+from iptables_parser import SaveParser
+from transport import FakeTransport
+
+DUMP = """*filter
+:INPUT ACCEPT [0:0]
+:FORWARD DROP [0:0]
+:OUTPUT ACCEPT [0:0]
+-A INPUT -i lo -j ACCEPT
+COMMIT
+"""
+UNIT = "/etc/systemd/system/iptables-forge.service"
+
+def exec_starts(host):
+    return [line.split()[-1] for line in host.files[UNIT].decode().splitlines() if line.startswith("ExecStart=")]
+
+def apply(host, golden):
+    result, = Fleet([host]).apply(list(SaveParser().parse(golden.splitlines())), persist=True)
+    assert result.ok, result.error
+    return result
+
+def test_persist_without_ipv6_leaves_it_out_of_the_unit():
+    host = FakeTransport("web1", {"ipv4": ""})
+    result = apply(host, DUMP)
+    assert result.applied
+    assert sorted(host.files) == ["/etc/iptables/rules.v4", UNIT, "/etc/systemd/system/multi-user.target.wants/iptables-forge.service"]
+    assert exec_starts(host) == ["/etc/iptables/rules.v4"]
+
+def test_persist_writes_both_families():
+    host = FakeTransport("web1", {"ipv4": "", "ipv6": DUMP})
+    apply(host, DUMP)
+    assert host.files["/etc/iptables/rules.v6"].decode().count("-A INPUT -i lo -j ACCEPT") == 1
+    assert exec_starts(host) == ["/etc/iptables/rules.v4", "/etc/iptables/rules.v6"]
+
+def test_unreadable_family_keeps_an_earlier_file():
+    host = FakeTransport("web1", {"ipv4": "", "ipv6": DUMP})
+    apply(host, DUMP)
+    del host.dumps["ipv6"]
+    apply(host, DUMP)
+    assert exec_starts(host) == ["/etc/iptables/rules.v4", "/etc/iptables/rules.v6"]
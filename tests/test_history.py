@@ -0,0 +1,80 @@
+import os
+import sys
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import history
+from history import History
+from iptables_parser import parse_rule_line
+from rule_store import RuleStore
+
+def rule(n):
+    return parse_rule_line(f"-A INPUT -p tcp -m tcp --dport {n} -j ACCEPT", "filter")
+
+def ports(rules):
+    return [r.dport for r in rules]
+
+def edit(hist, store, label, *ops):
+    with hist.step(label):
+        for op in ops: op(store)
+
+def test_journal_replays_after_restart(tmp_path):
+    hist, store = History("ipv4", str(tmp_path)), RuleStore([rule(22), rule(80)])
+    hist.attach(store)
+    edit(hist, store, "add", lambda s: s.insert(1, rule(443)))
+    edit(hist, store, "move", lambda s: s.move(0, 2))
+    edit(hist, store, "drop", lambda s: s.pop(0))
+    hist.snapshot("web")
+    hist.undo()
+    assert ports(store) == ["443", "80", "22"]
+    again = History("ipv4", str(tmp_path))
+    assert ports(again.rules_at(again.head)) == ["443", "80", "22"]
+    assert ports(again.rules_at(again.snapshots["web"][0])) == ["80", "22"]
+    # The kernel still holds the root ruleset: the unapplied edits come back as redo steps.
+    kernel = RuleStore([rule(22), rule(80)])
+    again.attach(kernel)
+    assert again.head.is_root and again.store is kernel
+    while again.can_redo(): again.redo()
+    assert ports(kernel) == ["443", "80", "22"]
+
+def test_ids_keep_increasing_across_restarts(tmp_path):
+    hist, store = History("ipv4", str(tmp_path)), RuleStore([rule(22)])
+    hist.attach(store)
+    edit(hist, store, "add", lambda s: s.append(rule(80)))
+    edit(hist, store, "add", lambda s: s.append(rule(443)))
+    hist.undo()
+    again = History("ipv4", str(tmp_path))
+    again.track(store)
+    edit(again, store, "add", lambda s: s.append(rule(8080)))
+    # Step 3 was undone and is gone after the restart, but its id is never handed out again.
+    assert (again.head.id, again.head.parent.id) == (4, 2)
+
+def test_restart_drops_unreachable_steps_and_their_bases(tmp_path):
+    hist = History("ipv4", str(tmp_path))
+    hist.attach(RuleStore([rule(22)]))
+    first = hist.head
+    hist.attach(RuleStore([rule(80)]), "optimizer")
+    hist.undo()
+    hist.attach(RuleStore([rule(443)]))
+    bases = lambda: sorted(name for name in os.listdir(tmp_path) if name.startswith("base-"))
+    assert len(bases()) == 3
+    again = History("ipv4", str(tmp_path))
+    assert sorted(again.nodes) == [first.id, 3]
+    assert bases() == sorted(f"base-ipv4-{node.fp}.rules" for node in again.nodes.values())
+    assert ports(again.rules_at(again.head)) == ["443"]
+    # Already compact: a second restart leaves the journal as it is.
+    journal = (tmp_path / "history-ipv4.jsonl").read_text()
+    History("ipv4", str(tmp_path))
+    assert (tmp_path / "history-ipv4.jsonl").read_text() == journal
+
+def test_attach_hashes_the_tracked_store_once(tmp_path, monkeypatch):
+    hist, store = History("ipv4", None), RuleStore([rule(22), rule(80)])
+    hist.attach(store)
+    calls = []
+    fingerprint = history.ruleset_fingerprint
+    monkeypatch.setattr(history, "ruleset_fingerprint", lambda rules: calls.append(rules) or fingerprint(rules))
+    for _ in range(3): hist.attach(RuleStore(list(store)))
+    assert len(calls) == 3
+    hist.store.append(rule(443))
+    hist.attach(RuleStore([rule(22), rule(80)]))
+    assert len(calls) == 5 and hist.head.is_root
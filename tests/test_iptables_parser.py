@@ -0,0 +1,95 @@
+import os
+import sys
+from collections import defaultdict
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import pytest
+
+from iptables_manager import FamilyState, IptablesBackend, IptablesManager, fingerprint
+from iptables_parser import SaveParser, parse_rule_line
+from transport import FakeStream, FakeTransport
+
+DUMP = """# Generated by iptables-save v1.8.7 on Sun Oct 18 10:00:00 2026
+*filter
+:INPUT DROP [10:200]
+:FORWARD ACCEPT [0:0]
+:OUTPUT ACCEPT [5:100]
+:LOGDROP - [0:0]
+[100:6000] -A INPUT -i lo -j ACCEPT
+[50:3000] -A INPUT -p tcp -m tcp --dport 22 -m state --state NEW,ESTABLISHED -m comment --comment "ssh access" -j ACCEPT
+[7:420] -A INPUT -s 10.0.0.0/8 -p tcp -m multiport --dports 80,443 -j ACCEPT
+[0:0] -A INPUT ! -s 192.168.1.0/24 -p udp -m udp --sport 1000:2000 -j LOGDROP
+[0:0] -A INPUT -m iprange --src-range 10.1.0.1-10.1.0.9 -m comment --comment "say \\"hi\\"" -j REJECT --reject-with tcp-reset
+[0:0] -A LOGDROP -m limit --limit 5/min -j LOG --log-prefix "dropped: "
+[0:0] -A LOGDROP -j DROP
+COMMIT
+*nat
+:PREROUTING ACCEPT [0:0]
+:INPUT ACCEPT [0:0]
+:OUTPUT ACCEPT [0:0]
+:POSTROUTING ACCEPT [0:0]
+[0:0] -A PREROUTING -d 1.2.3.4/32 -p tcp -m tcp --dport 8080 -j DNAT --to-destination 10.0.0.5:80
+[0:0] -A POSTROUTING -o eth0 -j MASQUERADE
+COMMIT
+"""
+
+def parse(text):
+    parser = SaveParser()
+    return list(parser.parse(text.splitlines(keepends=True))), parser
+
+def render(rules, parser):
+    state = FamilyState("ipv4")
+    state.chains, state.chain_counters = parser.chains, parser.chain_counters
+    data = defaultdict(lambda: defaultdict(list))
+    for rule in rules: data[rule.table][rule.chain].append(rule)
+    return IptablesBackend.build_restore_payload(state, data)[0]
+
+def test_fields():
+    rules, _ = parse(DUMP)
+    ssh, lan, udp, iprange = rules[1:5]
+    assert (ssh.protocol, ssh.dport, ssh.state, ssh.comment) == ("tcp", "22", "NEW,ESTABLISHED", "ssh access")
+    assert (lan.source, lan.dport, str(lan)) == ("10.0.0.0/8", "80,443", "-A INPUT -p tcp -s 10.0.0.0/8 -m multiport --dports 80,443 -j ACCEPT")
+    assert (udp.source, udp.sport, udp.target) == ("! 192.168.1.0/24", "1000:2000", "LOGDROP")
+    assert iprange.comment == 'say "hi"'
+    assert iprange.target_extra == ("--reject-with", "tcp-reset")
+    assert rules[-2].target_extra == ("--to-destination", "10.0.0.5:80")
+
+def test_policies_and_counters():
+    rules, parser = parse(DUMP)
+    assert parser.chains["filter"] == {"INPUT": "DROP", "FORWARD": "ACCEPT", "OUTPUT": "ACCEPT", "LOGDROP": "-"}
+    assert parser.chain_counters["filter", "INPUT"] == (10, 200)
+    assert (rules[0].pkts, rules[0].bytes) == (100, 6000)
+
+def test_round_trip():
+    rules, parser = parse(DUMP)
+    payload = render(rules, parser)
+    again, parser_again = parse(payload)
+    assert [r.key for r in again] == [r.key for r in rules]
+    assert render(again, parser_again) == payload
+
+@pytest.mark.parametrize("line", [
+    '-A INPUT -m comment --comment "a  b" -j ACCEPT',
+    "-A INPUT -p tcp ! --dport 22 -j DROP",
+    "-A INPUT -i eth+ ! -o br0 -j ACCEPT",
+    "-A INPUT -m set --match-set forge-ipv4-input-0a1b2c3d src -j DROP",
+])
+def test_line_round_trip(line):
+    assert str(parse_rule_line(line, "filter")) == line
+
+def test_read_streams_from_the_pipe():
+    # Lines must reach the parser as they arrive: a buffered read would call readlines().
+    class Pipe(FakeStream):
+        def readlines(self): raise AssertionError("dump buffered before parsing")
+    host = FakeTransport("host")
+    host.stream = lambda argv: Pipe(DUMP)
+    manager = IptablesManager(IptablesBackend(host))
+    assert manager.refresh() is True
+    assert len(manager.state.rules) == 9
+    assert manager.state.fingerprint == fingerprint(DUMP.splitlines(keepends=True))
+
+def test_fingerprint_ignores_comments_and_chain_counters():
+    lines = DUMP.splitlines(keepends=True)
+    moved = [line.replace("[10:200]", "[11:260]").replace("10:00:00", "10:00:05") for line in lines]
+    assert fingerprint(moved) == fingerprint(lines)
+    assert fingerprint(lines[:-2] + lines[-1:]) != fingerprint(lines)
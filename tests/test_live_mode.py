@@ -0,0 +1,100 @@
+import os
+import sys
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+os.environ.setdefault("QT_QPA_PLATFORM", "offscreen")
+
+import pytest
+from PyQt6.QtCore import QObject, QThreadPool
+from PyQt6.QtTest import QTest
+from PyQt6.QtWidgets import QApplication, QLabel
+
+from iptables_manager import IptablesBackend, IptablesManager
+from iptables_parser import parse_rule_line
+from live_mode import LiveApplier, Watchdog
+from transport import FakeTransport
+
+app = QApplication.instance() or QApplication([])
+
+DUMP = """*filter
+:INPUT DROP [0:0]
+:FORWARD DROP [0:0]
+:OUTPUT ACCEPT [0:0]
+-A INPUT -i lo -j ACCEPT
+-A INPUT -p tcp -m tcp --dport 22 -j ACCEPT
+COMMIT
+"""
+
+class Window(QObject):
+    # The slice of MainWindow the live applier talks to.
+    def __init__(self, manager):
+        super().__init__()
+        self.manager, self.worker, self.status_label = manager, None, QLabel()
+        self.failed, self.reverted = [], []
+
+    def update_live_controls(self): pass
+    def update_state_label(self): pass
+    def live_failed(self, err): self.failed.append(err)
+    def live_reverted(self, family, rules, count): self.reverted.append((family, count))
+
+def settle(ms=0):
+    QThreadPool.globalInstance().waitForDone()
+    app.processEvents()
+    if ms: QTest.qWait(ms)
+
+@pytest.fixture
+def live():
+    host = FakeTransport("host", {"ipv4": DUMP})
+    manager = IptablesManager(IptablesBackend(host))
+    manager.refresh()
+    live = LiveApplier(Window(manager), debounce_ms=10, confirm_seconds=1)
+    live.set_enabled(True)
+    yield live
+    if live.watchdog is not None: live.watchdog.discard()
+
+def kernel(live):
+    return [str(r) for r in live.manager.kernel_rules()]
+
+def edit(live):
+    live.manager.state.rules.append(parse_rule_line("-A INPUT -s 9.9.9.9/32 -j DROP", "filter"))
+    live.schedule()
+    QTest.qWait(50)
+    settle()
+
+def test_first_batch_arms_and_confirm_keeps_it(live):
+    before = kernel(live)
+    edit(live)
+    assert kernel(live) == before + ["-A INPUT -s 9.9.9.9/32 -j DROP"]
+    family, baseline, path = live.last_good
+    assert [str(r) for r in baseline] == before and os.path.exists(path)
+    assert live.watchdog.proc.poll() is None
+    watchdog = live.watchdog
+    live.confirm()
+    assert live.watchdog is None and not live.pending_confirmation
+    assert watchdog.proc.poll() is not None and not os.path.exists(path)
+    assert kernel(live)[-1] == "-A INPUT -s 9.9.9.9/32 -j DROP"
+
+def test_unconfirmed_changes_revert_when_the_countdown_ends(live):
+    before = kernel(live)
+    edit(live)
+    settle(1300)
+    settle()
+    assert kernel(live) == before
+    assert live.window.reverted == [("ipv4", 1)] and live.watchdog is None
+
+def test_shutdown_reverts_right_away(live):
+    before = kernel(live)
+    edit(live)
+    live.shutdown()
+    assert kernel(live) == before and live.watchdog is None
+
+def test_watchdog_runs_unless_cancelled(tmp_path):
+    src, fired, cancelled = tmp_path / "good.rules", tmp_path / "fired", tmp_path / "cancelled"
+    src.write_text("*filter\nCOMMIT\n")
+    Watchdog(["cp", str(src), str(fired)], str(src), 0).proc.wait()
+    assert fired.read_text() == src.read_text()
+    watchdog = Watchdog(["cp", str(src), str(cancelled)], str(src), 1)
+    watchdog.discard()
+    time.sleep(1.2)
+    assert not cancelled.exists() and not src.exists()
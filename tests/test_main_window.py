@@ -0,0 +1,37 @@
+import os
+import sys
+from types import SimpleNamespace
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+os.environ.setdefault("QT_QPA_PLATFORM", "offscreen")
+
+from PyQt6.QtWidgets import QApplication
+
+from main_window import MainWindow
+
+app = QApplication.instance() or QApplication([])
+
+class Manager:
+    def __init__(self, read_ok):
+        self.read_ok, self.calls = read_ok, []
+    def apply_ipsets(self, ipsets): self.calls.append("ipsets"); return True, ""
+    def plan_changes(self, rules): return []
+    def apply_plan(self, ops): return True, ""
+    def refresh(self, force=False): return self.read_ok
+    def save_to_system(self): self.calls.append("save"); return True, "salvato"
+    def disable_persistence(self): self.calls.append("disable"); return True, False
+
+worker = SimpleNamespace(report=lambda *args, **kwargs: None, is_cancelled=False)
+
+def test_failed_read_back_skips_persistence():
+    window = SimpleNamespace(manager=Manager(read_ok=False))
+    ok, msg = MainWindow._apply(window, worker, [], True, {})
+    assert ok and "Persistenza non aggiornata" in msg
+    assert window.manager.calls == []
+
+def test_apply_leaves_pending_ipsets_to_the_gui_thread():
+    sets = {"forge-ipv4-input-0a1b2c3d": ["10.0.0.1"]}
+    window = SimpleNamespace(manager=Manager(read_ok=True), pending_ipsets=sets)
+    ok, _ = MainWindow._apply(window, worker, [], True, dict(sets))
+    assert ok and window.manager.calls == ["ipsets", "save"]
+    assert window.pending_ipsets == sets
@@ -0,0 +1,55 @@
+import os
+import sys
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from iptables_manager import IptablesBackend, IptablesManager
+from iptables_parser import parse_rule_line
+from transport import FakeTransport
+
+V4 = """*filter
+:INPUT DROP [0:0]
+:FORWARD DROP [0:0]
+:OUTPUT ACCEPT [0:0]
+-A INPUT -i lo -j ACCEPT
+COMMIT
+"""
+V6 = V4.replace("-i lo", "-p ipv6-icmp")
+
+def manager():
+    host = FakeTransport("host", {"ipv4": V4, "ipv6": V6})
+    return IptablesManager(IptablesBackend(host)), host
+
+def test_refresh_all_loads_both_families():
+    m, _ = manager()
+    assert m.refresh_all() == {"ipv4": True, "ipv6": True}
+    assert [str(r) for r in m.states["ipv4"].rules] == ["-A INPUT -i lo -j ACCEPT"]
+    assert [str(r) for r in m.states["ipv6"].rules] == ["-A INPUT -p ipv6-icmp -j ACCEPT"]
+    m.is_ipv6_mode = True
+    assert m.state is m.states["ipv6"]
+
+def test_unchanged_kernel_keeps_the_parsed_state():
+    m, host = manager()
+    m.refresh_all()
+    rules = m.states["ipv4"].rules
+    assert m.refresh("ipv4") is False and m.states["ipv4"].rules is rules
+    host.dumps["ipv4"] = V4.replace("COMMIT", "-A INPUT -p tcp -m tcp --dport 22 -j ACCEPT\nCOMMIT")
+    assert m.refresh("ipv4") is True and len(m.states["ipv4"].rules) == 2
+
+def test_edits_survive_a_kernel_change_until_forced():
+    m, host = manager()
+    m.refresh_all()
+    state = m.states["ipv4"]
+    state.rules.append(parse_rule_line("-A INPUT -s 10.0.0.0/8 -j ACCEPT", "filter"))
+    assert state.dirty and not m.states["ipv6"].dirty
+    host.dumps["ipv4"] = V4.replace("DROP", "ACCEPT", 1)
+    assert m.refresh("ipv4") is False
+    assert state.kernel_changed and len(state.rules) == 2
+    assert m.refresh("ipv4", force=True) is True
+    assert not m.states["ipv4"].dirty and len(m.states["ipv4"].rules) == 1
+
+def test_a_failed_read_leaves_the_other_family_loaded():
+    m, host = manager()
+    del host.dumps["ipv6"]
+    assert m.refresh_all() == {"ipv4": True, "ipv6": False}
+    assert len(m.states["ipv4"].rules) == 1
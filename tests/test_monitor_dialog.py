@@ -0,0 +1,40 @@
+import os
+import sys
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+os.environ.setdefault("QT_QPA_PLATFORM", "offscreen")
+
+from PyQt6.QtCore import Qt, QThreadPool
+from PyQt6.QtTest import QTest
+from PyQt6.QtWidgets import QApplication, QWidget
+
+from iptables_manager import IptablesManager
+from monitor_dialog import MonitorDialog
+
+app = QApplication.instance() or QApplication([])
+
+class Window(QWidget):
+    manager = IptablesManager()
+    all_rules = []
+
+def settle():
+    QThreadPool.globalInstance().waitForDone()
+    app.processEvents()
+
+def test_escape_stops_polling():
+    window = Window()
+    dialog = MonitorDialog(window)
+    dialog.show()
+    assert dialog.timer.isActive()
+    QTest.keyClick(dialog, Qt.Key.Key_Escape)
+    settle()
+    assert not dialog.isVisible()
+    assert not dialog.timer.isActive()
+    assert dialog.toggle_btn.text() == "AVVIA"
+
+def test_close_stops_polling():
+    dialog = MonitorDialog(Window())
+    dialog.show()
+    dialog.close()
+    settle()
+    assert not dialog.timer.isActive()
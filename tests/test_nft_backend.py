@@ -0,0 +1,116 @@
+import os
+import random
+import sys
+from collections import defaultdict
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+
+import pytest
+
+from iptables_manager import IptablesManager
+from iptables_parser import SaveParser, parse_rule_line
+from nft_backend import NftablesBackend, rule_exprs, rule_from_nft
+from rule_diff import ChainOp
+
+STUB = os.path.join(ROOT, "benchmarks", "stubs", "nft")
+DUMP = """*filter
+:INPUT DROP [0:0]
+:FORWARD DROP [0:0]
+:OUTPUT ACCEPT [0:0]
+:LOGDROP - [0:0]
+-A INPUT -i lo -j ACCEPT
+-A INPUT -m state --state RELATED,ESTABLISHED -j ACCEPT
+-A INPUT -s 10.0.0.0/8 -p tcp -m tcp --dport 22 -j ACCEPT
+-A INPUT -p tcp -m tcp --dport 80:90 -j ACCEPT
+-A INPUT -p tcp -m tcp --dport 113 -j REJECT --reject-with tcp-reset
+-A INPUT -p udp -m udp --dport 53 -j REJECT --reject-with icmp-port-unreachable
+-A INPUT -s 192.168.1.0/24 -j REJECT --reject-with icmp-host-prohibited
+-A INPUT -m limit --limit 5/min -j LOGDROP
+-A LOGDROP -j LOG --log-prefix "drop: "
+-A LOGDROP -j DROP
+-A FORWARD -j REJECT
+COMMIT
+*nat
+:PREROUTING ACCEPT [0:0]
+:INPUT ACCEPT [0:0]
+:OUTPUT ACCEPT [0:0]
+:POSTROUTING ACCEPT [0:0]
+-A PREROUTING -p tcp -m tcp --dport 8080 -j REDIRECT --to-ports 80
+-A POSTROUTING -o eth0 -j MASQUERADE
+COMMIT
+"""
+
+@pytest.fixture
+def manager(tmp_path, monkeypatch):
+    monkeypatch.setenv("FORGE_BENCH_NFT_STATE", str(tmp_path / "ruleset.json"))
+    manager = IptablesManager(NftablesBackend(STUB))
+    parser = SaveParser()
+    rules = list(parser.parse(DUMP.splitlines()))
+    manager.state.chains = parser.chains
+    data = defaultdict(lambda: defaultdict(list))
+    for rule in rules: data[rule.table][rule.chain].append(rule)
+    assert manager.apply_rules(data) == (True, "")
+    manager.refresh(force=True)
+    return manager, rules
+
+def keys(rules):
+    # Per chain: the kernel lists chains in its own order, only the order within each one matters.
+    chains = defaultdict(list)
+    for rule in rules: chains[rule.table, rule.chain].append(rule.key)
+    return dict(chains)
+
+def test_round_trip(manager):
+    manager, rules = manager
+    assert keys(manager.kernel_rules()) == keys(rules)
+
+def test_replace_keeps_handle(manager):
+    # Later ops in the same batch still address a replaced rule by its handle.
+    manager, rules = manager
+    replaced = parse_rule_line("-A LOGDROP -j LOG --log-prefix \"limit: \"", "filter")
+    extra = parse_rule_line("-A LOGDROP -j RETURN", "filter")
+    ops = [ChainOp("-R", "filter", "LOGDROP", 1, replaced), ChainOp("-I", "filter", "LOGDROP", 1, extra),
+           ChainOp("-D", "filter", "LOGDROP", 2)]
+    assert manager.apply_plan(ops) == (True, "")
+    assert keys(manager.kernel_rules())["filter", "LOGDROP"] == [extra.key, keys(rules)["filter", "LOGDROP"][-1]]
+
+def test_random_edits(manager):
+    manager, rules = manager
+    rnd = random.Random(1)
+    for _ in range(30):
+        new = list(manager.state.rules)
+        for _ in range(rnd.randint(1, 5)):
+            choice = rnd.random()
+            if choice < 0.4 and new: new.pop(rnd.randrange(len(new)))
+            elif choice < 0.7: new.insert(rnd.randint(0, len(new)), rnd.choice(rules))
+            elif new:
+                i, j = rnd.randrange(len(new)), rnd.randrange(len(new))
+                new[i], new[j] = new[j], new[i]
+        assert manager.apply_plan(manager.plan_changes(new)) == (True, "")
+        manager.refresh(force=True)
+        assert keys(manager.state.rules) == keys(new)
+
+@pytest.mark.parametrize("family, line, reject", [
+    ("ipv4", "-A INPUT -j REJECT", None),
+    ("ipv4", "-A INPUT -j REJECT --reject-with icmp-admin-prohibited", {"type": "icmp", "expr": "admin-prohibited"}),
+    ("ipv4", "-A INPUT -j REJECT --reject-with icmp-proto-unreachable", {"type": "icmp", "expr": "prot-unreachable"}),
+    ("ipv6", "-A INPUT -j REJECT --reject-with icmp6-adm-prohibited", {"type": "icmpv6", "expr": "admin-prohibited"}),
+    ("ipv6", "-A INPUT -p tcp -j REJECT --reject-with tcp-reset", {"type": "tcp reset"}),
+])
+def test_reject_types(family, line, reject):
+    rule = parse_rule_line(line, "filter")
+    exprs = rule_exprs(rule, family)
+    assert exprs[-1] == {"reject": reject}
+    back = rule_from_nft({"table": "filter", "chain": "INPUT", "expr": exprs})
+    assert back.key == rule.key
+
+@pytest.mark.parametrize("family, with_", [("ipv6", "icmp-host-prohibited"), ("ipv4", "icmp6-no-route"), ("ipv4", "icmp-bogus")])
+def test_reject_unsupported(family, with_):
+    with pytest.raises(ValueError):
+        rule_exprs(parse_rule_line(f"-A INPUT -j REJECT --reject-with {with_}", "filter"), family)
+
+def test_icmpx_reject_kept_verbatim():
+    obj = {"table": "filter", "chain": "INPUT", "expr": [{"reject": {"type": "icmpx", "expr": "port-unreachable"}}]}
+    rule = rule_from_nft(obj)
+    assert rule.target == ""
+    assert [expr for expr in rule_exprs(rule, "ipv4") if "reject" in expr] == obj["expr"]
@@ -0,0 +1,75 @@
+import ipaddress
+import os
+import random
+import sys
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from packet_sim import Simulator, parse_flow
+from rule import Rule
+
+ADDRS = ["10.0.0.1", "10.1.2.3", "192.168.1.10", "172.16.5.5", "8.8.8.8"]
+NETS = ["10.0.0.0/8", "10.1.0.0/16", "192.168.1.0/24", "8.8.8.8", "172.16.0.0/12"]
+PORTS = ["22", "80", "443", "1000:2000", "80,443", "8000:"]
+STATES = ["NEW", "ESTABLISHED", "RELATED"]
+IFACES = ["eth0", "eth1", "wg0"]
+# INPUT may jump to A or B, A to B: no loops.
+TARGETS = {"INPUT": ["ACCEPT", "DROP", "REJECT", "A", "B"], "A": ["ACCEPT", "DROP", "RETURN", "B"], "B": ["ACCEPT", "DROP", "RETURN"]}
+
+def maybe(rnd, values, negate=False):
+    if rnd.random() < 0.5: return None
+    value = rnd.choice(values)
+    return f"! {value}" if negate and rnd.random() < 0.2 else value
+
+def random_rule(rnd, chain):
+    protocol = rnd.choice(["all", "tcp", "udp", "! udp"])
+    ports = protocol in ("tcp", "udp")
+    return Rule(chain, protocol, maybe(rnd, NETS, True) or "any", maybe(rnd, NETS, True) or "any", rnd.choice(TARGETS[chain]),
+                maybe(rnd, PORTS, True) if ports else None, maybe(rnd, PORTS, True) if ports else None,
+                maybe(rnd, [",".join(rnd.sample(STATES, 2)), *STATES], True), in_iface=maybe(rnd, IFACES + ["eth+"], True))
+
+def field_matches(value, test):
+    if not value or value in ("any", "all"): return True
+    negated = value.startswith("!")
+    return test(value.lstrip("! ").strip()) != negated
+
+def ports_match(value, port):
+    def test(text):
+        return any(int(lo or 0) <= port <= int(hi or (65535 if sep else lo)) for lo, sep, hi in (p.partition(":") for p in text.split(",")))
+    return field_matches(value, test)
+
+def naive(chains, policies, flow, chain="INPUT"):
+    # Rule by rule, straight from the iptables semantics, with none of the simulator's tables.
+    src, dst, proto, sport, dport, state, in_iface, _ = flow
+    for i, r in enumerate(chains.get(chain, [])):
+        if not (field_matches(r.protocol, lambda p: p == proto)
+                and field_matches(r.source, lambda n: ipaddress.ip_address(src) in ipaddress.ip_network(n))
+                and field_matches(r.destination, lambda n: ipaddress.ip_address(dst) in ipaddress.ip_network(n))
+                and ports_match(r.sport, sport) and ports_match(r.dport, dport)
+                and field_matches(r.state, lambda s: state in s.split(","))
+                and field_matches(r.in_iface, lambda p: in_iface == p or p.endswith("+") and in_iface.startswith(p[:-1]))):
+            continue
+        if r.target in ("ACCEPT", "DROP", "REJECT"): return r.target, chain, i
+        if r.target == "RETURN": return None
+        decided = naive(chains, policies, flow, r.target)
+        if decided is not None: return decided
+    return (policies[chain], chain, -1) if chain == "INPUT" else None
+
+def test_matches_a_naive_evaluator():
+    rnd = random.Random(5)
+    for _ in range(20):
+        chains = {name: [random_rule(rnd, name) for _ in range(rnd.randint(0, 25))] for name in TARGETS}
+        policies = {"INPUT": rnd.choice(["ACCEPT", "DROP"]), "A": "-", "B": "-"}
+        sim = Simulator([r for rules in chains.values() for r in rules], {"filter": policies})
+        for _ in range(300):
+            flow = parse_flow([rnd.choice(ADDRS), rnd.choice(ADDRS), rnd.choice(["tcp", "udp", "icmp"]),
+                               rnd.choice([22, 80, 443, 1500, 8080, 40000]), rnd.choice([22, 80, 443, 1500, 8080, 40000]),
+                               rnd.choice(STATES), rnd.choice(IFACES), ""])
+            assert sim.evaluate(flow)[:3] == naive(chains, policies, flow), flow
+
+def test_cached_result_is_the_same():
+    rules = [Rule("INPUT", "tcp", dport="22", target="ACCEPT"), Rule("INPUT", target="DROP")]
+    sim = Simulator(rules)
+    flow = parse_flow(["10.0.0.1", "10.0.0.2", "tcp", "5000", "22"])
+    assert sim.evaluate(flow) == sim.evaluate(flow) == ("ACCEPT", "INPUT", 0, False)
+    assert sim.rule_of(sim.evaluate(flow)) is rules[0]
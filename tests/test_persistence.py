@@ -0,0 +1,58 @@
+import os
+import stat
+import sys
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import pytest
+
+import persistence
+from persistence import PersistenceWriter, write_atomic
+from transport import LocalTransport
+
+def test_write_atomic_replaces_the_file(tmp_path):
+    path = tmp_path / "rules.v4"
+    path.write_bytes(b"old\n")
+    write_atomic(str(path), b"new\n", 0o600)
+    assert path.read_bytes() == b"new\n"
+    assert stat.S_IMODE(os.stat(path).st_mode) == 0o600
+    assert os.listdir(tmp_path) == ["rules.v4"]
+
+@pytest.mark.parametrize("step", ["fsync", "replace"])
+def test_failed_write_keeps_the_old_file_and_no_temp(tmp_path, monkeypatch, step):
+    path = tmp_path / "rules.v4"
+    path.write_bytes(b"old\n")
+    def fail(*args): raise OSError("disk full")
+    monkeypatch.setattr(persistence.os, step, fail)
+    with pytest.raises(OSError):
+        write_atomic(str(path), b"new\n")
+    assert path.read_bytes() == b"old\n"
+    assert os.listdir(tmp_path) == ["rules.v4"]
+
+class Host(LocalTransport):
+    def __init__(self):
+        self.calls = []
+
+    def run(self, argv, **kwargs):
+        self.calls.append(argv)
+
+@pytest.fixture
+def writer(tmp_path):
+    return PersistenceWriter(str(tmp_path / "iptables"), str(tmp_path / "systemd"), Host())
+
+def test_second_save_writes_nothing(writer):
+    first = writer.save({"rules.v4": "*filter\nCOMMIT\n"})
+    assert [os.path.basename(p) for p in first.written] == ["rules.v4"] and first.unit_updated
+    writer.transport.calls.clear()
+    # Enabling creates the wants link on a real system: stand in for systemctl.
+    os.makedirs(os.path.dirname(writer.wants_link))
+    os.symlink(writer.unit_path, writer.wants_link)
+    second = writer.save({"rules.v4": "*filter\nCOMMIT\n"})
+    assert second.noop and not writer.transport.calls
+
+def test_only_changed_files_are_rewritten(writer):
+    writer.save({"rules.v4": "*filter\nCOMMIT\n", "rules.v6": "*filter\nCOMMIT\n"})
+    report = writer.save({"rules.v4": "*filter\nCOMMIT\n", "rules.v6": "*filter\n-A INPUT -j ACCEPT\nCOMMIT\n"})
+    assert [os.path.basename(p) for p in report.written] == ["rules.v6"]
+    assert [os.path.basename(p) for p in report.unchanged] == ["rules.v4"]
+    assert not report.unit_updated
@@ -0,0 +1,47 @@
+import json
+import os
+import sys
+import threading
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import pytest
+
+import profiling
+
+@pytest.fixture
+def profiler():
+    yield profiling.enable()
+    profiling.disable()
+
+def test_hooks_are_inert_when_disabled():
+    assert profiling.current() is None
+    assert profiling.span("x") is profiling.NULL_SPAN
+    assert profiling.traced("x")(lambda a: a + 1)(1) == 2
+
+def test_spans_are_counted_across_threads(profiler):
+    @profiling.traced("work")
+    def work(): pass
+    threads = [threading.Thread(target=work) for _ in range(4)]
+    for t in threads: t.start()
+    for t in threads: t.join()
+    with profiling.span("outer"): work()
+    assert profiler.spans["work"][0] == 5 and profiler.spans["outer"][0] == 1
+    assert len({tid for _, _, _, tid, _ in profiler.events}) >= 2
+
+def test_subprocess_accounting(profiler):
+    profiling.run(["cat"], input=b"abcd", capture_output=True)
+    with profiling.Stream(["printf", "a\\nbb\\n"]) as stream: lines = list(stream)
+    assert lines == ["a\n", "bb\n"]
+    count, _, sent, received = profiler.processes["cat"]
+    assert (count, sent, received) == (1, 4, 4)
+    assert profiler.processes["printf"][3] == 5
+    assert "processi: 2" in profiler.summary()
+
+def test_session_writes_a_chrome_trace(tmp_path):
+    path = tmp_path / "trace.json"
+    with profiling.session(str(path)):
+        with profiling.span("gui.load"): pass
+    assert profiling.current() is None
+    events = json.loads(path.read_text())["traceEvents"]
+    assert [(e["name"], e["ph"]) for e in events] == [("gui.load", "X")]
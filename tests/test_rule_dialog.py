@@ -0,0 +1,28 @@
+import os
+import sys
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+os.environ.setdefault("QT_QPA_PLATFORM", "offscreen")
+
+from PyQt6.QtWidgets import QApplication
+
+from iptables_parser import parse_rule_line
+from rule_dialog import RuleDialog
+
+app = QApplication.instance() or QApplication([])
+
+def edit(line, target=None):
+    dialog = RuleDialog(rule=parse_rule_line(line, "filter"))
+    if target: dialog.target_cb.setCurrentText(target)
+    return str(dialog.get_rule())
+
+def test_target_options_kept_with_the_same_target():
+    line = "-A INPUT -p tcp -j REJECT --reject-with tcp-reset"
+    assert edit(line) == line
+
+def test_target_options_dropped_with_a_new_target():
+    assert edit("-A INPUT -p tcp -j REJECT --reject-with tcp-reset", "ACCEPT") == "-A INPUT -p tcp -j ACCEPT"
+
+def test_match_options_survive_a_target_change():
+    assert edit("-A INPUT -m iprange --src-range 10.0.0.1-10.0.0.9 -j LOG --log-prefix x", "DROP") == \
+        "-A INPUT -m iprange --src-range 10.0.0.1-10.0.0.9 -j DROP"
@@ -0,0 +1,69 @@
+import os
+import random
+import sys
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import pytest
+
+from iptables_parser import parse_rule_line
+from rule_diff import diff_chain, diff_rules, edit_script
+
+def rule(n, chain="INPUT"):
+    return parse_rule_line(f"-A {chain} -p tcp -m tcp --dport {n} -j ACCEPT", "filter")
+
+def play(old, ops):
+    # What the kernel does with the ops, positions counted from 1 as in iptables.
+    rules = list(old)
+    for op in ops:
+        if op.action == "-R": rules[op.position - 1] = op.rule
+        elif op.action == "-D": del rules[op.position - 1]
+        else: rules.insert(op.position - 1, op.rule)
+    return rules
+
+def lcs(a, b):
+    row = [0] * (len(b) + 1)
+    for x in a:
+        prev, row = row, [0]
+        for j, y in enumerate(b): row.append(prev[j] + 1 if x == y else max(prev[j + 1], row[j]))
+    return row[-1]
+
+@pytest.mark.parametrize("a, b", [("abcabba", "cbabac"), ("", "abc"), ("abc", ""), ("abc", "abc"), ("xabcx", "yabcy")])
+def test_edit_script_is_a_shortest_one(a, b):
+    script = edit_script(list(a), list(b))
+    assert "".join(a[i] for tag, i, _ in script if tag != "+") == a
+    assert "".join(b[j] for tag, _, j in script if tag != "-") == b
+    assert sum(tag == "=" for tag, _, _ in script) == lcs(a, b)
+
+def test_changed_rule_becomes_a_replace():
+    old = [rule(n) for n in (22, 80, 443)]
+    new = [old[0], rule(8080), old[2]]
+    ops = diff_chain("filter", "INPUT", old, new)
+    assert [(op.action, op.position) for op in ops] == [("-R", 2)]
+
+def test_unpaired_changes_delete_then_insert():
+    old = [rule(n) for n in (22, 80, 443)]
+    new = [rule(1), old[0], old[2], rule(2), rule(3)]
+    ops = diff_chain("filter", "INPUT", old, new)
+    assert play(old, ops) == new
+    assert len(ops) == 4
+
+def test_random_edits_replay_to_the_target():
+    rnd = random.Random(3)
+    pool = [rule(n, chain) for n in range(40) for chain in ("INPUT", "OUTPUT")]
+    for _ in range(200):
+        old = rnd.sample(pool, rnd.randint(0, 30))
+        new = [r for r in old if rnd.random() > 0.2]
+        for _ in range(rnd.randint(0, 6)): new.insert(rnd.randint(0, len(new)), rnd.choice(pool))
+        ops = diff_rules(old, new)
+        for chain in ("INPUT", "OUTPUT"):
+            before = [r for r in old if r.chain == chain]
+            after = [r for r in new if r.chain == chain]
+            chain_ops = [op for op in ops if op.chain == chain]
+            assert play(before, chain_ops) == after
+            assert len(chain_ops) <= len(before) + len(after) - lcs(before, after)
+
+def test_distance_cap_falls_back_to_a_rewrite():
+    old, new = [rule(n) for n in range(10)], [rule(n) for n in range(10, 20)]
+    ops = diff_chain("filter", "INPUT", old, new, max_d=3)
+    assert play(old, ops) == new
@@ -0,0 +1,37 @@
+import os
+import random
+import sys
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from rule_index import PortIndex, parse_ports
+
+def naive(entries, port):
+    return {rid for rid, ranges in entries.items() if ranges is None or any(lo <= port <= hi for lo, hi in ranges)}
+
+def test_port_index_matches_a_linear_scan():
+    rnd, index, entries = random.Random(7), PortIndex(), {}
+    for rid in range(400):
+        if rnd.random() < 0.05: ranges = None
+        else:
+            ranges = []
+            for _ in range(rnd.randint(1, 3)):
+                lo = rnd.choice([0, 1, 22, 80, 1024, 65535, rnd.randrange(65536)])
+                ranges.append((lo, lo if rnd.random() < 0.5 else min(65535, lo + rnd.randrange(5000))))
+            ranges = sorted(set(ranges))
+        index.add(ranges, rid)
+        entries[rid] = ranges
+        if rnd.random() < 0.2:
+            gone = rnd.choice(list(entries))
+            index.discard(entries.pop(gone), gone)
+    for port in [0, 1, 21, 22, 23, 80, 1023, 1024, 65534, 65535] + [rnd.randrange(65536) for _ in range(300)]:
+        assert index.containing(port) | index.wildcard == naive(entries, port), port
+
+def test_port_index_edges():
+    index = PortIndex()
+    index.add(parse_ports("1000:2000,8080"), 1)
+    index.add(parse_ports("2000:"), 2)
+    assert [index.containing(p) for p in (999, 1000, 2000, 2001, 8080, 65535)] == [set(), {1}, {1, 2}, {2}, {1, 2}, {2}]
+    assert index.containing(70000) == set()
+    index.discard(parse_ports("1000:2000,8080"), 1)
+    assert index.nodes.keys() and all(ids == {2} for ids in index.nodes.values())
@@ -0,0 +1,47 @@
+import os
+import sys
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+os.environ.setdefault("QT_QPA_PLATFORM", "offscreen")
+
+import pytest
+from PyQt6.QtCore import QModelIndex, Qt
+from PyQt6.QtWidgets import QApplication
+
+from iptables_parser import parse_rule_line
+from rule_model import RuleTableModel
+from rule_store import RuleStore
+
+app = QApplication.instance() or QApplication([])
+
+def make_model(names="abcde"):
+    return RuleTableModel(RuleStore(parse_rule_line(f"-A INPUT -m comment --comment {n} -j ACCEPT", "filter") for n in names))
+
+def drop(model, src, row, parent=QModelIndex()):
+    mime = model.mimeData([model.index(src, 0)])
+    model.dropMimeData(mime, Qt.DropAction.MoveAction, row, 0, parent)
+    return "".join(rule.comment for rule in model.rules)
+
+@pytest.mark.parametrize("src, row, expected", [
+    (0, 3, "bcade"),  # down: a into the gap between c and d
+    (1, 5, "acdeb"),  # down past the last row
+    (0, 1, "abcde"),  # into its own lower gap: no move
+    (3, 1, "adbce"),  # up: d into the gap between a and b
+    (4, 0, "eabcd"),  # up to the top
+])
+def test_drop_between_rows(src, row, expected):
+    assert drop(make_model(), src, row) == expected
+
+def test_drop_onto_row_and_past_end():
+    model = make_model()
+    assert drop(model, 0, -1, model.index(2, 0)) == "bcade"
+    assert drop(model, 0, -1) == "cadeb"
+
+def test_drop_with_chain_filter_moves_within_store():
+    model = RuleTableModel(RuleStore([*(parse_rule_line(f"-A INPUT -m comment --comment {n} -j ACCEPT", "filter") for n in "abc"),
+                                      parse_rule_line("-A OUTPUT -m comment --comment x -j ACCEPT", "filter"),
+                                      parse_rule_line("-A INPUT -m comment --comment d -j ACCEPT", "filter")]))
+    model.set_chain_filter("INPUT")
+    assert [r.comment for r in model.rows] == list("abcd")
+    drop(model, 0, 3)
+    assert [r.comment for r in model.rows] == list("bcad")
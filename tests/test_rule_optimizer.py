@@ -0,0 +1,76 @@
+import os
+import sys
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import pytest
+
+from iptables_parser import parse_rule_line
+from rule_optimizer import Match, covers, disjoint, optimize
+
+def rules(*lines):
+    return [parse_rule_line(line, "filter") for line in lines]
+
+def match(line):
+    return Match(parse_rule_line(line, "filter"))
+
+@pytest.mark.parametrize("outer, inner, expected", [
+    ("-A INPUT -s 10.0.0.0/8 -j ACCEPT", "-A INPUT -s 10.1.2.0/24 -p tcp -j ACCEPT", True),
+    ("-A INPUT -s 10.1.2.0/24 -j ACCEPT", "-A INPUT -s 10.0.0.0/8 -j ACCEPT", False),
+    ("-A INPUT -p tcp -m tcp --dport 1000:2000 -j DROP", "-A INPUT -p tcp -m tcp --dport 1500 -j ACCEPT", True),
+    ("-A INPUT -p tcp -m tcp --dport 1000:2000 -j DROP", "-A INPUT -p udp -m udp --dport 1500 -j ACCEPT", False),
+    ("-A INPUT -m state --state NEW,ESTABLISHED -j ACCEPT", "-A INPUT -m state --state NEW -j ACCEPT", True),
+    # A negation is not modelled: it only covers the identical match.
+    ("-A INPUT ! -s 10.0.0.0/8 -j DROP", "-A INPUT -s 192.168.0.0/16 -j DROP", False),
+])
+def test_covers(outer, inner, expected):
+    assert covers(match(outer), match(inner)) is expected
+
+@pytest.mark.parametrize("a, b, expected", [
+    ("-A INPUT -s 10.0.0.0/8 -j ACCEPT", "-A INPUT -s 192.168.0.0/16 -j ACCEPT", True),
+    ("-A INPUT -s 10.0.0.0/8 -j ACCEPT", "-A INPUT -s 10.1.0.0/16 -j ACCEPT", False),
+    ("-A INPUT -p tcp -j ACCEPT", "-A INPUT -p udp -j ACCEPT", True),
+    ("-A INPUT -p tcp -m tcp --dport 80 -j ACCEPT", "-A INPUT -p tcp -m tcp --dport 443 -j ACCEPT", True),
+    ("-A INPUT -i eth0 -j ACCEPT", "-A INPUT -i eth+ -j ACCEPT", False),
+])
+def test_disjoint(a, b, expected):
+    assert disjoint(match(a), match(b)) is expected
+    assert disjoint(match(b), match(a)) is expected
+
+def test_shadowed_and_redundant_rules_are_dropped():
+    plan = optimize(rules("-A INPUT -s 10.0.0.0/8 -j ACCEPT", "-A INPUT -s 10.1.0.0/16 -j DROP",
+                          "-A INPUT -s 10.2.0.0/16 -j ACCEPT", "-A INPUT -s 192.168.0.0/16 -j DROP"))
+    assert [f.kind for f in plan.findings] == ["oscurata", "ridondante"]
+    assert [r.source for r in plan.rules] == ["10.0.0.0/8", "192.168.0.0/16"]
+
+def test_run_of_sources_becomes_one_set_rule():
+    sources = ["10.0.0.1", "10.0.0.2", "10.0.0.3", "10.0.0.4"]
+    plan = optimize(rules(*(f"-A INPUT -s {s} -p tcp -m tcp --dport 22 -j ACCEPT" for s in sources)))
+    (name, (kind, members)), = plan.ipsets.items()
+    assert (kind, members) == ("inet", sources)
+    rule, = plan.rules
+    assert str(rule) == f"-A INPUT -p tcp --dport 22 -m set --match-set {name} src -j ACCEPT"
+
+@pytest.mark.parametrize("sources, merged", [
+    # Overlapping members: a packet from 10.1.0.1 was logged twice and would be logged once.
+    (["10.0.0.0/8", "10.1.0.0/16", "172.16.0.1", "192.168.0.1"], False),
+    (["10.0.0.0/8", "172.16.0.0/12", "192.168.0.1", "192.168.0.2"], True),
+    (["10.0.0.1", "10.0.0.1", "172.16.0.1", "192.168.0.1"], False),
+])
+def test_non_terminal_runs_merge_only_when_disjoint(sources, merged):
+    plan = optimize(rules(*(f'-A INPUT -s {s} -j LOG --log-prefix "in: "' for s in sources)))
+    assert bool(plan.ipsets) is merged
+    assert len(plan.rules) == (1 if merged else 4)
+
+def test_overlapping_terminal_run_still_merges():
+    sources = ["10.1.0.0/16", "10.0.0.0/8", "172.16.0.1", "192.168.0.1"]
+    plan = optimize(rules(*(f"-A INPUT -s {s} -p udp -j ACCEPT" for s in sources)))
+    assert len(plan.rules) == 1 and plan.ipsets
+
+def test_hot_rule_promoted_only_past_disjoint_rules():
+    chain = rules("-A INPUT -p tcp -m tcp --dport 80 -j ACCEPT", "-A INPUT -p tcp -m tcp --dport 22 -j DROP",
+                  "-A INPUT -p tcp -m tcp --dport 443 -j ACCEPT", "-A INPUT -p tcp -j REJECT")
+    plan = optimize(chain, [1, 5, 100, 1000])
+    # The catch-all overlaps everything before it, so it stays last whatever its counters say.
+    assert [r.dport for r in plan.rules] == ["443", "22", "80", None]
+    assert plan.after["filter", "INPUT"] < plan.before["filter", "INPUT"]
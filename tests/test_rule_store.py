@@ -0,0 +1,45 @@
+import os
+import random
+import sys
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import pytest
+
+from iptables_parser import parse_rule_line
+from rule_store import RuleStore
+
+def rule(n, chain="INPUT"):
+    return parse_rule_line(f"-A {chain} -p tcp -m tcp --dport {n} -j ACCEPT", "filter")
+
+def test_equal_rules_share_key_and_hash():
+    a, b = rule(22), rule(22)
+    assert a is not b and a == b and hash(a) == hash(b) and len({a, b}) == 1
+    assert rule(22) != rule(22, "OUTPUT")
+
+def test_positions_follow_a_list_through_relabels():
+    rnd, store, mirror = random.Random(11), RuleStore(), []
+    for n in range(3000):
+        # Inserting at the same spot halves the gap each time, which forces renumbering along the way.
+        pos = 1 if n % 3 else rnd.randint(0, len(mirror))
+        r = rule(n, rnd.choice(["INPUT", "OUTPUT"]))
+        store.insert(pos, r)
+        mirror.insert(pos, r)
+        if n % 7 == 0:
+            i = rnd.randrange(len(mirror))
+            assert store.pop(i) is mirror.pop(i)
+    assert list(store) == mirror
+    for i in rnd.sample(range(len(mirror)), 200): assert store.index(mirror[i]) == i
+    for chain in ("INPUT", "OUTPUT"):
+        in_chain = [r for r in mirror if r.chain == chain]
+        assert store.chain_rules(chain) == in_chain
+        assert [store.chain_index(r) for r in in_chain[:50]] == list(range(50))
+
+def test_move_and_replace():
+    store = RuleStore(rule(n) for n in range(5))
+    store.move(0, 3)
+    assert [r.dport for r in store] == ["1", "2", "3", "0", "4"]
+    new = rule(99)
+    assert store.replace(store[1], new) == 1 and store.index(new) == 1
+    with pytest.raises(ValueError):
+        store.insert(0, new)
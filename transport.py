@@ -0,0 +1,212 @@
+import os
+import shlex
+import subprocess
+import tempfile
+
+import profiling
+from persistence import SYSTEMD_DIR, digest, file_digest, write_atomic
+
+class LocalTransport:
+    # How a backend reaches a host: run a command, stream a command's output, and the handful of
+    # file operations persistence needs. This one is the machine the program runs on.
+    name = "localhost"
+
+    def run(self, argv, **kwargs):
+        return profiling.run(argv, **kwargs)
+
+    def stream(self, argv):
+        return profiling.Stream(argv)
+
+    def file_digest(self, path):
+        return file_digest(path)
+
+    def write_file(self, path, data, mode=0o644):
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        write_atomic(path, data, mode)
+
+    def exists(self, path):
+        return os.path.lexists(path)
+
+    def remove(self, path):
+        if os.path.exists(path): os.remove(path)
+
+    def close(self):
+        pass
+
+LOCAL = LocalTransport()
+
+# Same guarantees as persistence.write_atomic, done by the remote shell: temp file next to the target, sync, rename.
+REMOTE_WRITE = ('set -e; mkdir -p "$(dirname "$1")"; t=$(mktemp "$(dirname "$1")/.forge-XXXXXX"); '
+                'trap \'rm -f "$t"\' EXIT; cat > "$t"; chmod "$2" "$t"; sync "$t" 2>/dev/null || sync; mv "$t" "$1"; trap - EXIT')
+
+class SSHTransport:
+    # One OpenSSH control master per host: the first command opens it, every later one is multiplexed over it
+    # (no new TCP or key exchange), and it stays up for `persist` seconds after the last use.
+    def __init__(self, host, user=None, port=None, identity=None, options=(), persist=300, control_dir=None):
+        self.host = host
+        self.name = host
+        self.target = f"{user}@{host}" if user else host
+        self.control_dir = control_dir or os.path.join(tempfile.gettempdir(), f"forge-ssh-{os.getuid()}")
+        os.makedirs(self.control_dir, mode=0o700, exist_ok=True)
+        self.base = ["ssh", "-o", "BatchMode=yes", "-o", "ControlMaster=auto", "-o", f"ControlPersist={persist}",
+                     "-o", f"ControlPath={os.path.join(self.control_dir, '%C')}"]
+        if port: self.base += ["-p", str(port)]
+        if identity: self.base += ["-i", identity]
+        for option in options: self.base += ["-o", option]
+
+    def _argv(self, argv):
+        return [*self.base, self.target, "--", shlex.join(argv)]
+
+    def run(self, argv, **kwargs):
+        return profiling.run(self._argv(argv), **kwargs)
+
+    def stream(self, argv):
+        return profiling.Stream(self._argv(argv))
+
+    def file_digest(self, path):
+        result = self.run(["sha256sum", path], capture_output=True, text=True)
+        return result.stdout.split()[0] if result.returncode == 0 and result.stdout else None
+
+    def write_file(self, path, data, mode=0o644):
+        self.run(["sh", "-c", REMOTE_WRITE, "sh", path, f"{mode:o}"], input=data, capture_output=True, check=True)
+
+    def exists(self, path):
+        return self.run(["sh", "-c", 'test -e "$1" || test -L "$1"', "sh", path], capture_output=True).returncode == 0
+
+    def remove(self, path):
+        self.run(["rm", "-f", path], capture_output=True, check=True)
+
+    def close(self):
+        profiling.run([*self.base, "-O", "exit", self.target], capture_output=True)
+
+class FakeStream:
+    def __init__(self, text, returncode=0):
+        self.lines = text.splitlines(keepends=True)
+        self.returncode = returncode
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        return False
+
+    def __iter__(self):
+        return iter(self.lines)
+
+    def readlines(self):
+        return list(self.lines)
+
+class FakeTransport:
+    # A stand-in host for tests and dry runs: `iptables-save` serves a fixture, `iptables-restore` applies the
+    # payload to it (so a later read sees the change), files live in memory and every command is recorded.
+    SAVE = {"iptables-save": "ipv4", "ip6tables-save": "ipv6"}
+    RESTORE = {"iptables-restore": "ipv4", "ip6tables-restore": "ipv6"}
+
+    def __init__(self, name, dumps=None, fixture_dir=None):
+        self.name = name
+        self.dumps = dict(dumps or {})
+        for family, suffix in (("ipv4", "v4"), ("ipv6", "v6")):
+            path = os.path.join(fixture_dir, f"{name}.{suffix}") if fixture_dir else None
+            if family not in self.dumps and path and os.path.exists(path):
+                with open(path) as f: self.dumps[family] = f.read()
+        self.files = {}
+        self.calls = []
+
+    def _result(self, argv, returncode=0, stdout="", stderr="", check=False, text=True):
+        if not text: stdout, stderr = stdout.encode(), stderr.encode()
+        if check and returncode: raise subprocess.CalledProcessError(returncode, argv, stdout, stderr)
+        return subprocess.CompletedProcess(argv, returncode, stdout, stderr)
+
+    def run(self, argv, input=None, check=False, text=False, capture_output=False, **kwargs):
+        self.calls.append(list(argv))
+        command = os.path.basename(argv[0])
+        if command in self.SAVE:
+            family = self.SAVE[command]
+            if family not in self.dumps: return self._result(argv, 1, stderr="no fixture", check=check, text=text)
+            return self._result(argv, stdout=self.dumps[family], check=check, text=text)
+        if command in self.RESTORE:
+            if "--test" in argv: return self._result(argv, check=check, text=text)
+            family = self.RESTORE[command]
+            try: self.dumps[family] = restore_into(self.dumps.get(family, ""), input, "--noflush" in argv)
+            except ValueError as e: return self._result(argv, 1, stderr=f"{command}: {e}", check=check, text=text)
+            return self._result(argv, check=check, text=text)
+        if command == "systemctl" and argv[1:2] in (["enable"], ["disable"]):
+            link = os.path.join(SYSTEMD_DIR, "multi-user.target.wants", argv[2])
+            if argv[1] == "enable": self.files[link] = b""
+            else: self.files.pop(link, None)
+        return self._result(argv, check=check, text=text)
+
+    def stream(self, argv):
+        self.calls.append(list(argv))
+        family = self.SAVE.get(os.path.basename(argv[0]))
+        if family not in self.dumps: return FakeStream("", 1)
+        return FakeStream(self.dumps[family])
+
+    def file_digest(self, path):
+        return digest(self.files[path]) if path in self.files else None
+
+    def write_file(self, path, data, mode=0o644):
+        self.files[path] = data
+
+    def exists(self, path):
+        return path in self.files
+
+    def remove(self, path):
+        self.files.pop(path, None)
+
+    def close(self):
+        pass
+
+def _parse_tables(text):
+    tables = {}
+    current = None
+    for line in text.splitlines():
+        if line.startswith("*"):
+            current = tables.setdefault(line[1:].strip(), {"chains": {}, "rules": {}})
+        elif line.startswith(":") and current is not None:
+            name, policy = line[1:].split()[:2]
+            current["chains"][name] = policy
+            current["rules"].setdefault(name, [])
+        elif line.startswith("-A ") and current is not None:
+            chain = line.split()[1]
+            current["rules"].setdefault(chain, []).append(line[len(f"-A {chain} "):])
+    return tables
+
+def restore_into(dump, payload, noflush):
+    # Just enough of iptables-restore for FakeTransport: -A/-I/-R/-D with positions, new chains, COMMIT.
+    from iptables_manager import BUILTIN_CHAINS
+    tables = _parse_tables(dump)
+    for line in payload.splitlines():
+        if line.startswith("*"):
+            name = line[1:].strip()
+            if noflush and name in tables: table = tables[name]
+            else:
+                # Built-in chains exist as soon as a table is used, as in the kernel.
+                chains = {chain: "ACCEPT" for chain in BUILTIN_CHAINS.get(name, [])}
+                if name in tables: chains.update(tables[name]["chains"])
+                table = tables[name] = {"chains": chains, "rules": {chain: [] for chain in chains}}
+        elif line.startswith(":"):
+            name, policy = line[1:].split()[:2]
+            if policy != "-" or name not in table["chains"]: table["chains"][name] = policy
+            table["rules"].setdefault(name, [])
+        elif line[:3] in ("-A ", "-I ", "-R ", "-D "):
+            parts = line.split(" ", 3)
+            action, chain = parts[0], parts[1]
+            if chain not in table["rules"]: raise ValueError(f"chain {chain} inesistente")
+            rules = table["rules"][chain]
+            if action == "-A":
+                rules.append(line[len(f"-A {chain} "):])
+                continue
+            pos = int(parts[2]) - 1
+            if action == "-I" and pos <= len(rules): rules.insert(pos, parts[3])
+            elif action in ("-R", "-D") and pos < len(rules):
+                if action == "-R": rules[pos] = parts[3]
+                else: del rules[pos]
+            else: raise ValueError(f"posizione {pos + 1} non valida in {chain}")
+    out = []
+    for name, table in tables.items():
+        out.append(f"*{name}")
+        out.extend(f":{chain} {policy} [0:0]" for chain, policy in table["chains"].items())
+        out.extend(f"-A {chain} {rule}" for chain, rules in table["rules"].items() for rule in rules)
+        out.append("COMMIT")
+    return "\n".join(out) + "\n"